@@ -0,0 +1,362 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from array import array
+import collections
+import threading
+
+from histogram import LatencyHistogram
+from report_parser import UNLIMITED
+
+# Columns of a merged per-second row
+CONNECTIONS_ATTEMPTED = 0
+ACTUAL_CONNECTIONS = 1
+MESSAGES_ATTEMPTED = 2
+ACTUAL_MESSAGES = 3
+CONNECTION_ERRORS = 4
+MISFIRES = 5
+LATENCY = 6
+
+# Extra columns kept by the series: how many bees attempted an unlimited
+# ('max') rate, and how many messages rate-limited bees were scheduled to
+# send but have not sent (see Schedule)
+UNLIMITED_BEES = 7
+SHORTFALL = 8
+
+COLUMN_TYPES = ('l', 'l', 'l', 'l', 'l', 'l', 'd', 'l', 'l')
+
+# Buckets added at a time when a series outgrows its arrays
+GROW_BUCKETS = 256
+
+class Schedule(object):
+    """
+    Schedule-corrected latency samples of one rate-limited bee.
+
+    Reports only cover the messages a bee actually sent, so when the target
+    stalls the requests it should have sent meanwhile are missing from the
+    latencies (coordinated omission). Each scheduled message is counted
+    once. Misfires are never sent, so they are counted as omitted samples
+    of their own second: spread over the part of the second the bee
+    stalled for, they waited half of it on average, on top of the latency
+    measured.
+
+    The rest of a second's shortfall is still queued, and is kept as a
+    backlog of (second, count) in schedule order. Messages a bee sends
+    beyond its schedule in a later second (catching up) drain it, and are
+    counted then, charged the seconds they waited since they were due.
+    Queued messages that are never sent are never counted, so agents that
+    never catch up cannot inflate later seconds.
+    """
+
+    def __init__(self):
+        self.backlog = collections.deque()
+
+    def correct(self, row):
+        """
+        Correct one of the bee's rows, as produced by PerSecondTable.rows();
+        rows must be given in order. Returns the (latency, count) samples of
+        the row, and the (second, count) changes it makes to the shortfall
+        of the bee's seconds: the messages the row fell short by, less those
+        of earlier seconds it finally sent.
+        """
+        second, attempted, messages, misfires, latency = row[0], row[3], row[4], row[6], row[7]
+        if attempted == UNLIMITED or attempted <= 0:
+            # Without a schedule nothing can fall behind it; what was still
+            # queued is never sent.
+            self.backlog.clear()
+            return [(latency, messages)], []
+
+        samples = []
+        shortfall = []
+        late = max(messages - attempted, 0)
+        while late and self.backlog:
+            due, queued = self.backlog[0]
+            drained = min(late, queued)
+            samples.append((latency + 1000.0 * (second - due), drained))
+            shortfall.append((due, -drained))
+            late -= drained
+            if drained == queued:
+                self.backlog.popleft()
+            else:
+                self.backlog[0] = (due, queued - drained)
+        samples.insert(0, (latency, messages - sum(count for value, count in samples)))
+
+        short = max(attempted - messages, 0)
+        if short:
+            dropped = min(misfires, short)
+            if dropped:
+                samples.append((latency + 500.0 * short / attempted, dropped))
+            if short > dropped:
+                self.backlog.append((second, short - dropped))
+            shortfall.append((second, short))
+        return samples, shortfall
+
+class SwarmSeries(object):
+    """
+    Swarm-wide per-second time series, merged incrementally as bees report.
+
+    Each column is summed into a typed array indexed by bucket of `bucket`
+    seconds (one by default), so a bee's rows can be folded in as soon as
+    they are parsed and then dropped. Longer buckets keep memory and
+    output bounded for runs of many hours: a row read back from the series
+    holds the per-second averages over its bucket. Each bucket also keeps
+    a latency histogram, and a schedule-corrected one (see Schedule) that
+    also counts the messages rate-limited bees fell short by.
+
+    Bees only report a mean latency for each second, so the histograms
+    hold those means, each weighted by the messages behind it. The mean
+    they give is the exact mean over all messages. Their percentiles and
+    max are those of the per-second means, not of single messages, and
+    can sit well below the true per-message tail. Bees report from worker
+    threads, so merging is serialized by a lock.
+    """
+
+    def __init__(self, bucket=1, expected_seconds=0):
+        self.bucket = bucket
+        self.columns = [array(code) for code in COLUMN_TYPES]
+        self.first = array('l')
+        self.last = array('l')
+        self.histograms = []
+        self.total = LatencyHistogram()
+        self.corrected = []
+        self.corrected_total = LatencyHistogram()
+        self.epoch = None
+        # Metric counters of the runs merged so far (see metrics.carry_over)
+        self.counters = {}
+        self.lock = threading.Lock()
+
+        if expected_seconds:
+            self._grow(expected_seconds // bucket)
+
+    def _grow(self, index):
+        size = max(index + 1 - len(self.last), GROW_BUCKETS)
+        for column in self.columns:
+            column.extend([0] * size)
+        self.first.extend([-1] * size)
+        self.last.extend([-1] * size)
+        self.histograms.extend([None] * size)
+        self.corrected.extend([None] * size)
+
+    def add_rows(self, rows, shift=0, corrected=None):
+        """
+        Merge per-second rows from one bee, as produced by
+        PerSecondTable.rows(), moving them `shift` seconds later on the
+        swarm's timeline. `corrected` holds the Schedule.correct() of each
+        row, from the bee's own Schedule; without it the rows are corrected
+        by a Schedule of their own. Returns the highest (unshifted) second
+        merged.
+        """
+        last_second = None
+        bucket = self.bucket
+        schedule = Schedule()
+        corrected = iter(corrected) if corrected is not None else None
+
+        with self.lock:
+            columns = self.columns
+            for row in rows:
+                bee_second, connections_attempted, actual_connections, messages_attempted, messages, connection_errors, misfires, latency = row
+                second = bee_second + shift
+                index = second // bucket
+                if index >= len(self.last):
+                    self._grow(index)
+
+                columns[CONNECTIONS_ATTEMPTED][index] += connections_attempted
+                columns[ACTUAL_CONNECTIONS][index] += actual_connections
+                if messages_attempted == UNLIMITED:
+                    columns[UNLIMITED_BEES][index] += 1
+                else:
+                    columns[MESSAGES_ATTEMPTED][index] += messages_attempted
+                columns[ACTUAL_MESSAGES][index] += messages
+                columns[CONNECTION_ERRORS][index] += connection_errors
+                columns[MISFIRES][index] += misfires
+                columns[LATENCY][index] += latency * messages
+
+                if self.first[index] == -1 or second < self.first[index]:
+                    self.first[index] = second
+                if second > self.last[index]:
+                    self.last[index] = second
+
+                # Each bee reports one mean latency per second; weighting it by
+                # the messages behind it keeps the merged distribution honest.
+                if self.histograms[index] is None:
+                    self.histograms[index] = LatencyHistogram()
+                self.histograms[index].record(latency, messages)
+                self.total.record(latency, messages)
+
+                # As the schedule saw it: the messages sent and those omitted,
+                # with the shortfall of the seconds they were due in
+                samples, shortfall = next(corrected) if corrected is not None else schedule.correct(row)
+                if self.corrected[index] is None:
+                    self.corrected[index] = LatencyHistogram()
+                for value, count in samples:
+                    self.corrected[index].record(value, count)
+                    self.corrected_total.record(value, count)
+                for due, count in shortfall:
+                    columns[SHORTFALL][(due + shift) // bucket] += count
+
+                if last_second is None or bee_second > last_second:
+                    last_second = bee_second
+
+        return last_second
+
+    def sorted_seconds(self):
+        """
+        The first second of every bucket that holds data, in order.
+        """
+        with self.lock:
+            return [index * self.bucket for index, last in enumerate(self.last) if last != -1]
+
+    def has(self, second):
+        index = second // self.bucket
+        return 0 <= index < len(self.last) and self.last[index] != -1
+
+    def last_second(self):
+        with self.lock:
+            return max(self.last) if len(self.last) else -1
+
+    def span(self, second):
+        """
+        The number of seconds the bucket holding `second` covers so far.
+        """
+        index = second // self.bucket
+        return self.last[index] - self.first[index] + 1
+
+    def sums(self, second):
+        """
+        The summed columns of the bucket holding `second`.
+        """
+        index = second // self.bucket
+        return [column[index] for column in self.columns]
+
+    def row(self, second):
+        """
+        The columns of the bucket holding `second`, averaged per second.
+        """
+        sums = self.sums(second)
+        span = self.span(second)
+        if span == 1:
+            return sums
+        return [value / float(span) for value in sums]
+
+    def mean_latency(self, second):
+        sums = self.sums(second)
+        if not sums[ACTUAL_MESSAGES]:
+            return 0.0
+        return sums[LATENCY] / sums[ACTUAL_MESSAGES]
+
+    def histogram_at(self, second, corrected=False):
+        histograms = self.corrected if corrected else self.histograms
+        return histograms[second // self.bucket] or LatencyHistogram()
+
+    def histogram(self, seconds=None, corrected=False):
+        """
+        Merge the latency histograms of the given seconds (default: all of
+        them), or their schedule-corrected ones.
+        """
+        histograms = self.corrected if corrected else self.histograms
+        merged = LatencyHistogram()
+        with self.lock:
+            if seconds is None:
+                merged.merge(self.corrected_total if corrected else self.total)
+            else:
+                for index in set(second // self.bucket for second in seconds):
+                    if 0 <= index < len(histograms) and histograms[index]:
+                        merged.merge(histograms[index])
+        return merged
+
+    def window(self, end, size):
+        """
+        Summarize the `size` seconds up to and including `end`.
+        """
+        seconds = sorted(set(second // self.bucket * self.bucket for second in range(end - size + 1, end + 1) if self.has(second)))
+        if not seconds:
+            return None
+
+        with self.lock:
+            sums = [self.sums(second) for second in seconds]
+            span = sum(self.span(second) for second in seconds)
+
+        messages = sum(row[ACTUAL_MESSAGES] for row in sums)
+        latency = self.histogram(seconds)
+
+        return {
+            'connections': sums[-1][ACTUAL_CONNECTIONS] / self.span(seconds[-1]),
+            'messages_per_second': float(messages) / span,
+            'errors': sum(row[CONNECTION_ERRORS] for row in sums),
+            'misfires': sum(row[MISFIRES] for row in sums),
+            'latency': sum(row[LATENCY] for row in sums) / messages if messages else 0.0,
+            'latency_p99': latency.percentile(99)
+            }
+
+def summarize(series, seconds=None):
+    """
+    Reduce a swarm series, or the given seconds of it, to run-wide totals.
+
+    The error rate is the share of attempted operations that failed, i.e.
+    connection errors and misfires over those plus the messages sent. The
+    shortfall rate is the share of the messages rate-limited bees were
+    scheduled to send that they never did, and the corrected latencies
+    count each scheduled message once (see Schedule).
+    """
+    if seconds is None:
+        seconds = series.sorted_seconds()
+    else:
+        seconds = sorted(set(second // series.bucket * series.bucket for second in seconds if series.has(second)))
+    rows = [series.sums(second) for second in seconds]
+    span = sum(series.span(second) for second in seconds)
+
+    messages = sum(row[ACTUAL_MESSAGES] for row in rows)
+    connection_errors = sum(row[CONNECTION_ERRORS] for row in rows)
+    misfires = sum(row[MISFIRES] for row in rows)
+    failures = connection_errors + misfires
+    scheduled = sum(row[MESSAGES_ATTEMPTED] for row in rows)
+    shortfall = sum(row[SHORTFALL] for row in rows)
+    subset = seconds if len(seconds) < len(series.sorted_seconds()) else None
+    latency = series.histogram(subset)
+    corrected = series.histogram(subset, corrected=True)
+
+    return {
+        'seconds': span,
+        'messages': messages,
+        'messages_per_second': float(messages) / span if span else 0.0,
+        'peak_messages_per_second': max([series.row(second)[ACTUAL_MESSAGES] for second in seconds] or [0]),
+        'connection_errors': connection_errors,
+        'misfires': misfires,
+        'error_rate': float(failures) / (messages + failures) if messages + failures else 0.0,
+        'latency_mean': latency.mean(),
+        'latency_p50': latency.percentile(50),
+        'latency_p95': latency.percentile(95),
+        'latency_p99': latency.percentile(99),
+        'latency_max': latency.max or 0.0,
+        'scheduled_messages': scheduled,
+        'shortfall': shortfall,
+        'shortfall_rate': float(shortfall) / scheduled if scheduled else 0.0,
+        'corrected_latency_mean': corrected.mean(),
+        'corrected_latency_p50': corrected.percentile(50),
+        'corrected_latency_p95': corrected.percentile(95),
+        'corrected_latency_p99': corrected.percentile(99),
+        'corrected_latency_max': corrected.max or 0.0
+        }
@@ -0,0 +1,214 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from array import array
+import json
+import os
+import sys
+import time
+
+import aggregate
+from report_parser import UNLIMITED
+from swarm import REQUEST_ERRORS, Straggler
+
+RUNS_DIRECTORY = os.path.expanduser('~/.bees-runs')
+MANIFEST_FILENAME = 'manifest.json'
+ARCHIVE_VERSION = 2
+
+class ArchiveError(ValueError):
+    """
+    Raised for an archived run that cannot be read on this platform.
+    """
+    pass
+
+# Per-second columns of an archived run and their array type codes
+COLUMNS = (
+    ('seconds', 'l'),
+    ('connections_attempted', 'l'),
+    ('actual_connections', 'l'),
+    ('messages_attempted', 'l'),
+    ('actual_messages', 'l'),
+    ('connection_errors', 'l'),
+    ('misfires', 'l'),
+    ('latency_mean', 'd'),
+    # Percentiles of the bees' per-second mean latencies (version 1 named
+    # these latency_p50, ... as if they were of single messages)
+    ('second_means_p50', 'd'),
+    ('second_means_p95', 'd'),
+    ('second_means_p99', 'd'),
+    ('shortfall', 'l'),
+    ('corrected_second_means_p50', 'd'),
+    ('corrected_second_means_p99', 'd'),
+    )
+
+BEE_FIELDS = ('request_count', 'average_per_second', 'last_minute_per_second', 'error_count',
+    'error_rate_per_minute', 'ips', 'start_offset', 'start_shift')
+
+def _bee_summary(params, result):
+    bee = {
+        'i': params['i'],
+        'instance_id': params['instance_id'],
+        'instance_name': params['instance_name'],
+        'instance_type': params['instance_type'],
+        'weight': params['weight'],
+        'planned_requests': params['num_requests'],
+        'planned_concurrent': params['concurrent_requests'],
+        'planned_rate': params['rate']
+        }
+
+    if 'phase' in params:
+        bee['phase'] = params['phase']
+
+    if result is None:
+        bee['status'] = 'timeout'
+    elif isinstance(result, REQUEST_ERRORS):
+        bee['status'] = 'error'
+        bee['error'] = str(result)
+    elif isinstance(result, Straggler):
+        bee['status'] = 'straggler'
+        bee['seconds'] = result.seconds()
+        bee['messages'] = result.messages()
+        bee['latency_mean'] = result.mean_latency()
+    else:
+        bee['status'] = 'complete'
+        for field in BEE_FIELDS:
+            bee[field] = result[field]
+
+    return bee
+
+def save(series, summary, params, results, parameters, directory=RUNS_DIRECTORY, verdict=None):
+    """
+    Archive a finished attack and return the directory it was written to.
+
+    Each run gets its own directory holding a JSON manifest (attack
+    parameters, run summary, per-bee summaries and SLO verdict, if any)
+    and one raw binary file per per-second column, so that later reads can
+    load only the columns they need. A series kept in buckets of several
+    seconds is archived one row per bucket, holding its per-second
+    averages, with the bucket length in the manifest.
+    """
+    run_id = time.strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(directory, run_id)
+    suffix = 1
+    while os.path.exists(path):
+        suffix += 1
+        path = os.path.join(directory, '%s-%i' % (run_id, suffix))
+    os.makedirs(path)
+
+    columns = dict((name, array(code)) for name, code in COLUMNS)
+    for second in series.sorted_seconds():
+        row = [int(round(value)) for value in series.row(second)]
+        latency = series.histogram_at(second)
+        columns['seconds'].append(second)
+        columns['connections_attempted'].append(row[aggregate.CONNECTIONS_ATTEMPTED])
+        columns['actual_connections'].append(row[aggregate.ACTUAL_CONNECTIONS])
+        columns['messages_attempted'].append(UNLIMITED if row[aggregate.UNLIMITED_BEES] else row[aggregate.MESSAGES_ATTEMPTED])
+        columns['actual_messages'].append(row[aggregate.ACTUAL_MESSAGES])
+        columns['connection_errors'].append(row[aggregate.CONNECTION_ERRORS])
+        columns['misfires'].append(row[aggregate.MISFIRES])
+        columns['latency_mean'].append(series.mean_latency(second))
+        columns['second_means_p50'].append(latency.percentile(50))
+        columns['second_means_p95'].append(latency.percentile(95))
+        columns['second_means_p99'].append(latency.percentile(99))
+        corrected = series.histogram_at(second, corrected=True)
+        columns['shortfall'].append(row[aggregate.SHORTFALL])
+        columns['corrected_second_means_p50'].append(corrected.percentile(50))
+        columns['corrected_second_means_p99'].append(corrected.percentile(99))
+
+    for name, code in COLUMNS:
+        with open(os.path.join(path, '%s.bin' % name), 'wb') as f:
+            columns[name].tofile(f)
+
+    manifest = {
+        'version': ARCHIVE_VERSION,
+        'run_id': os.path.basename(path),
+        'created': time.time(),
+        'byteorder': sys.byteorder,
+        'length': len(columns['seconds']),
+        'bucket': series.bucket,
+        'columns': [{'name': name, 'type': code, 'itemsize': columns[name].itemsize} for name, code in COLUMNS],
+        'parameters': parameters,
+        'summary': summary,
+        'bees': [_bee_summary(p, r) for p, r in zip(params, results)],
+        'verdict': verdict
+        }
+
+    with open(os.path.join(path, MANIFEST_FILENAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return path
+
+def find(name, directory=RUNS_DIRECTORY):
+    """
+    Resolve a run name, "latest" or a path to a run directory, or None.
+    """
+    if name == 'latest':
+        if not os.path.isdir(directory):
+            return None
+        runs = sorted(r for r in os.listdir(directory) if os.path.isfile(os.path.join(directory, r, MANIFEST_FILENAME)))
+        return os.path.join(directory, runs[-1]) if runs else None
+
+    for path in (name, os.path.join(directory, name)):
+        if os.path.isfile(os.path.join(path, MANIFEST_FILENAME)):
+            return path
+
+    return None
+
+class Run(object):
+    """
+    An archived run. Per-second columns are only read from disk when first used.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILENAME), 'r') as f:
+            self.manifest = json.load(f)
+        self.run_id = self.manifest['run_id']
+        self.summary = self.manifest['summary']
+        self.parameters = self.manifest['parameters']
+        self.length = self.manifest['length']
+        self._types = dict((c['name'], c['type']) for c in self.manifest['columns'])
+        self._itemsizes = dict((c['name'], c.get('itemsize')) for c in self.manifest['columns'])
+        self._columns = {}
+
+    def column(self, name):
+        """
+        Read a column with the array type it was written with. Raises
+        ArchiveError if that type has another size here than where the run
+        was archived (a long is 8 bytes on 64-bit Linux but 4 elsewhere).
+        """
+        if name not in self._columns:
+            values = array(self._types[name])
+            itemsize = self._itemsizes[name]
+            if itemsize is not None and itemsize != values.itemsize:
+                raise ArchiveError('Column %s of run %s was written with %i-byte items, but they are %i bytes here' % (name,
+                    self.run_id, itemsize, values.itemsize))
+            with open(os.path.join(self.path, '%s.bin' % name), 'rb') as f:
+                values.fromfile(f, self.length)
+            if self.manifest['byteorder'] != sys.byteorder:
+                values.byteswap()
+            self._columns[name] = values
+        return self._columns[name]
@@ -0,0 +1,378 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# Where the bees come from.
+#
+# A hive backend brings bees up, keeps their roster entries fresh and
+# stands them down again; everything else (sharding, the attack itself,
+# aggregation and reporting) is the same whichever one is used. The "ec2"
+# backend launches instances on EC2, the "local" one runs agent processes
+# on this machine, spread over its cores.
+
+from distutils.spawn import find_executable
+from multiprocessing.pool import ThreadPool
+import errno
+import multiprocessing
+import os
+import shlex
+import signal
+import socket
+import subprocess
+import time
+
+import fleet
+import roster
+import swarm
+import tracing
+
+EC2 = 'ec2'
+LOCAL = 'local'
+BACKENDS = (EC2, LOCAL)
+
+UP_TIMEOUT = 600
+UP_POLL_INTERVAL = 2
+UP_MAX_POLL_INTERVAL = 15
+AGENT_CONNECT_TIMEOUT = 2
+
+LOCAL_HOST = '127.0.0.1'
+LOCAL_BASE_PORT = 8101
+LOCAL_INSTANCE_TYPE = 'local'
+
+def _get_pem_path(key):
+    return os.path.expanduser('~/.ssh/%s.pem' % key)
+
+def _agent_reachable(address):
+    """
+    Check whether a load agent is accepting connections at (host, port).
+    """
+    try:
+        sock = socket.create_connection(address, AGENT_CONNECT_TIMEOUT)
+    except socket.error:
+        return False
+    sock.close()
+    return True
+
+class EC2Hive(object):
+    """
+    Bees that are EC2 instances, each running the load agent on
+    swarm.AGENT_PORT. Only up() needs the launch settings.
+    """
+
+    name = EC2
+
+    def __init__(self, group=None, zones=None, image_id=None, instance_type=None, timeout=UP_TIMEOUT, check_agent=False):
+        self.group = group
+        self.zones = zones
+        self.image_id = image_id
+        self.instance_type = instance_type
+        self.timeout = timeout
+        self.check_agent = check_agent
+
+    def _wait_for_bees(self, ec2_connection, instances):
+        """
+        Poll the whole reservation until every bee is running (and, optionally,
+        its agent is reachable) or the timeout expires.
+
+        Each tick describes all the bees that are still pending at once (see
+        fleet.describe) and backs off exponentially while nothing changes.
+        Returns the bees that are ready, as last described.
+        """
+        pending_ids = [instance.id for instance in instances]
+        ready = []
+        interval = UP_POLL_INTERVAL
+        deadline = time.time() + self.timeout
+
+        pool = ThreadPool(swarm.MAX_WORKER_THREADS) if self.check_agent else None
+
+        try:
+            while pending_ids:
+                # Freshly launched instances can take a moment to become visible to the API
+                running = [i for i in fleet.describe(ec2_connection, pending_ids) if i.state == 'running']
+
+                if self.check_agent and running:
+                    with tracing.span('up.check_agents', instances=len(running)):
+                        reachable = pool.map(_agent_reachable, [(i.public_dns_name, swarm.AGENT_PORT) for i in running])
+                    armed = [i for i, ok in zip(running, reachable) if ok]
+                else:
+                    armed = running
+
+                running_count = len(ready) + len(running)
+
+                for instance in armed:
+                    pending_ids.remove(instance.id)
+                    ready.append(instance)
+                    print 'Bee %s is ready for the attack.' % instance.id
+
+                if self.check_agent:
+                    print '%i bees running, %i armed, %i pending.' % (running_count, len(ready), len(pending_ids))
+                else:
+                    print '%i bees running, %i pending.' % (len(ready), len(pending_ids))
+
+                if not pending_ids:
+                    break
+
+                if time.time() + interval > deadline:
+                    print 'Timed out after %is waiting for %i bees: %s' % (self.timeout, len(pending_ids), ', '.join(pending_ids))
+                    break
+
+                if armed:
+                    interval = UP_POLL_INTERVAL
+                else:
+                    interval = min(interval * 2, UP_MAX_POLL_INTERVAL)
+
+                time.sleep(interval)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        return ready
+
+    def up(self, count, username, key_name, save):
+        """
+        Launch `count` bees and return their roster, calling `save` with it
+        as soon as there is something to save.
+
+        The bees are spread over the zones, and the zones with room make up
+        for those without (see fleet.launch). Bees that launched are kept
+        on the roster even if the swarm falls short.
+        """
+        pem_path = _get_pem_path(key_name)
+
+        if not os.path.isfile(pem_path):
+            print 'No key file found at %s' % pem_path
+            return None
+
+        print 'Connecting to the hive.'
+
+        ec2_connection = fleet.connect()
+
+        print 'Attempting to call up %i bees with image %s in %s' % (count, self.image_id, ', '.join(self.zones))
+
+        with tracing.span('up.launch', instances=count):
+            launched = fleet.launch(ec2_connection, count, self.zones, self.image_id, key_name, self.group, self.instance_type)
+
+        if not launched:
+            print 'No bees could be called up.'
+            return None
+
+        # Record the launched bees at once, so that "bees down" can find them
+        # even if the wait below is cut short.
+        hive = roster.Roster(username, key_name, backend=EC2)
+        hive.update(launched)
+        save(hive)
+
+        print 'Waiting for bees to load their machine guns...'
+
+        with tracing.span('up.wait_for_bees'):
+            ready = self._wait_for_bees(ec2_connection, launched)
+
+        fleet.tag(ec2_connection, [instance.id for instance in launched], { "Name": "a bee!" })
+
+        # Stragglers are kept on the roster so that "bees down" still terminates
+        # them; having no endpoint yet, they are described again before use.
+        hive.update(ready)
+        save(hive)
+
+        print 'The swarm has assembled %i of %i bees.' % (len(ready), count)
+        return hive
+
+    def refresh(self, hive, entries):
+        """
+        Describe the given roster entries again. Bees EC2 could not
+        describe are marked unhealthy.
+        """
+        print 'Connecting to the hive.'
+
+        ec2_connection = fleet.connect()
+
+        print 'Refreshing %i of %i bees on the roster.' % (len(entries), len(hive))
+
+        instances = fleet.describe(ec2_connection, [entry.id for entry in entries])
+
+        hive.update(instances)
+        described = set(instance.id for instance in instances)
+        for entry in entries:
+            if entry.id not in described:
+                hive.mark(entry.id, False)
+
+    def down(self, hive):
+        """
+        Terminate every bee on the roster and return the ids that were.
+        """
+        print 'Connecting to the hive.'
+
+        ec2_connection = fleet.connect()
+
+        print 'Calling off the swarm.'
+
+        return fleet.terminate(ec2_connection, hive.ids())
+
+def _alive(pid):
+    """
+    Whether a process this one did not start is still there.
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return e.errno == errno.EPERM
+    return True
+
+class LocalHive(object):
+    """
+    Bees that are load agent processes on this machine, one per
+    consecutive port from `base_port`, each pinned to a core of its own
+    (with taskset, where there is one) and wrapping round the cores when
+    there are more bees than cores.
+
+    `agent_command` starts one agent; "{port}" in it is replaced by the
+    agent's port and "{cpu}" by its core. The agents are started in
+    sessions of their own so that they outlive "bees up".
+    """
+
+    name = LOCAL
+
+    def __init__(self, agent_command=None, base_port=LOCAL_BASE_PORT, timeout=UP_TIMEOUT):
+        self.agent_command = agent_command
+        self.base_port = base_port
+        self.timeout = timeout
+
+    def _check(self, entries, processes=None, now=None):
+        """
+        Record whether each agent's process is alive and its port open.
+
+        The agents started by this process are asked through their Popen
+        objects in `processes`, keyed by pid, which also reaps those that
+        exited; left unreaped they would linger as zombies that os.kill()
+        still finds.
+        """
+        now = now or time.time()
+        processes = processes or {}
+        for entry in entries:
+            if entry.pid in processes:
+                alive = processes[entry.pid].poll() is None
+            else:
+                alive = _alive(entry.pid)
+
+            if not alive:
+                entry.state = 'terminated'
+            elif _agent_reachable((entry.public_dns_name, entry.agent_port)):
+                entry.state = 'running'
+            else:
+                entry.state = 'pending'
+            entry.healthy = entry.state == 'running'
+            entry.checked = now
+
+    def up(self, count, username, key_name, save):
+        """
+        Start `count` agents and return their roster, calling `save` with
+        it as soon as they are started.
+        """
+        cpus = multiprocessing.cpu_count()
+        taskset = find_executable('taskset')
+        if not taskset:
+            print 'taskset is not available, so the bees will not be pinned to cores.'
+
+        print 'Starting %i bees on ports %i-%i across %i cores.' % (count, self.base_port, self.base_port + count - 1, cpus)
+
+        hive = roster.Roster(username, key_name, backend=LOCAL)
+        processes = {}
+        devnull = open(os.devnull, 'w')
+        try:
+            for i in range(count):
+                port = self.base_port + i
+                cpu = i % cpus
+                command = shlex.split(self.agent_command.replace('{port}', str(port)).replace('{cpu}', str(cpu)))
+                if taskset:
+                    command = [taskset, '-c', str(cpu)] + command
+
+                try:
+                    process = subprocess.Popen(command, stdin=devnull, stdout=devnull, stderr=devnull,
+                        close_fds=True, preexec_fn=os.setsid)
+                except OSError, e:
+                    print 'Could not start bee on port %i: %s' % (port, e)
+                    break
+
+                processes[process.pid] = process
+                hive.entries.append(roster.RosterEntry('local-%i' % port, LOCAL_HOST, LOCAL_HOST, None, LOCAL_INSTANCE_TYPE,
+                    'pending', False, None, agent_port=port, pid=process.pid, cpu=cpu if taskset else None))
+        finally:
+            devnull.close()
+
+        if not hive.entries:
+            print 'No bees could be called up.'
+            return None
+
+        save(hive)
+
+        print 'Waiting for bees to load their machine guns...'
+
+        deadline = time.time() + self.timeout
+        while True:
+            self._check(hive.entries, processes)
+            pending = [entry for entry in hive.entries if entry.state == 'pending']
+            if not pending or time.time() + UP_POLL_INTERVAL > deadline:
+                break
+            time.sleep(UP_POLL_INTERVAL)
+
+        for entry in hive.entries:
+            if entry.state == 'terminated':
+                print 'Bee %s exited before it was ready.' % entry.id
+            elif entry.state == 'pending':
+                print 'Bee %s is not accepting connections on port %i yet.' % (entry.id, entry.agent_port)
+        save(hive)
+
+        ready = len([entry for entry in hive.entries if entry.healthy])
+        print 'The swarm has assembled %i of %i bees.' % (ready, count)
+        return hive
+
+    def refresh(self, hive, entries):
+        self._check(entries)
+
+    def down(self, hive):
+        """
+        Stop every agent on the roster and return the ids of those stopped.
+        """
+        print 'Calling off the swarm.'
+
+        stopped = []
+        for entry in hive.entries:
+            try:
+                os.killpg(entry.pid, signal.SIGTERM)
+            except OSError, e:
+                if e.errno != errno.ESRCH:
+                    print 'Could not stop bee %s: %s' % (entry.id, e)
+                    continue
+            stopped.append(entry.id)
+        return stopped
+
+def get(name, **settings):
+    """
+    The backend called `name`, set up with `settings`.
+    """
+    if name == LOCAL:
+        return LocalHive(**settings)
+    return EC2Hive(**settings)
@@ -24,267 +24,165 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-from multiprocessing import Pool
+import math
 import os
-import re
 import socket
 import sys
-import time
-import urllib2
 import subprocess
 
-import boto
 import paramiko
-import httplib, urllib
-import time
 
+import aggregate
+import archive
+import backends
 from debug_instance import DebugInstance
+import health
+import metrics
+import preflight
+import roster
+import shard
+import slo
+import swarm
+import tracing
 
 STATE_FILENAME = os.path.expanduser('~/.bees')
-MAX_HTTP_ERRORS = 10
+
+PROBE_START_RATE = 100
+PROBE_DURATION = 10
+PROBE_GROWTH = 2.0
+PROBE_PRECISION = 0.05
+PROBE_MAX_STEPS = 12
+# A step only passes if the swarm achieved this share of the rate asked for
+PROBE_MIN_ACHIEVED = 0.9
+# Thresholds a probe step is judged by, and the defaults they are laid over
+PROBE_THRESHOLD_NAMES = ('max_error_rate', 'max_p99_latency', 'max_failed_bees')
+PROBE_THRESHOLDS = {'max_error_rate': 0.01}
 
 # Utilities
 
 def _read_server_list():
-    instance_ids = []
-
-    if not os.path.isfile(STATE_FILENAME):
-        return (None, None, None)
+    hive = roster.load(STATE_FILENAME)
 
-    with open(STATE_FILENAME, 'r') as f:
-        username = f.readline().strip()
-        key_name = f.readline().strip()
-        text = f.read()
-        instance_ids = text.split('\n')
+    if hive:
+        print 'Read %i bees from the roster.' % len(hive)
 
-        print 'Read %i bees from the roster.' % len(instance_ids)
+    return hive
 
-    return (username, key_name, instance_ids)
-
-def _write_server_list(username, key_name, instances):
-    with open(STATE_FILENAME, 'w') as f:
-        f.write('%s\n' % username)
-        f.write('%s\n' % key_name)
-        f.write('\n'.join([instance.id for instance in instances]))
+def _write_server_list(hive):
+    roster.save(hive, STATE_FILENAME)
 
 def _delete_server_list():
     os.remove(STATE_FILENAME)
 
-def _get_pem_path(key):
-    return os.path.expanduser('~/.ssh/%s.pem' % key)
+def _refresh_server_list(hive, ttl):
+    """
+    Have the roster's backend check the bees whose entries are stale.
+
+    Fresh, healthy entries are used as they are, so an attack on a swarm
+    that was checked recently needs no EC2 calls at all.
+    """
+    stale = hive.stale(ttl)
+    if not stale:
+        return
+
+    backends.get(hive.backend).refresh(hive, stale)
+    _write_server_list(hive)
 
 # Methods
 
-def up(count, group, zone, image_id, username, key_name, instance_type):
+def up(count, group, zone, image_id, username, key_name, instance_type, timeout=backends.UP_TIMEOUT, check_agent=False, backend=backends.EC2, agent_command=None, base_port=backends.LOCAL_BASE_PORT):
     """
     Startup the load testing server.
+
+    With the "ec2" backend the bees are instances spread over the
+    comma-separated zones of `zone`; with the "local" backend they are
+    `agent_command` processes on this machine (see backends.LocalHive).
     """
-    existing_username, existing_key_name, instance_ids = _read_server_list()
+    hive = _read_server_list()
 
-    if instance_ids:
+    if hive:
         print 'Bees are already assembled and awaiting orders.'
         return
 
     count = int(count)
 
-    pem_path = _get_pem_path(key_name)
-
-    if not os.path.isfile(pem_path):
-        print 'No key file found at %s' % pem_path
-        return
-
-    print 'Connecting to the hive.'
-
-    ec2_connection = boto.connect_ec2()
-
-    print 'Attempting to call up %i bees with image %s' % (count, image_id)
-
-    reservation = ec2_connection.run_instances(
-        image_id=image_id,
-        min_count=count,
-        max_count=count,
-        key_name=key_name,
-        security_groups=[group],
-        instance_type=instance_type,
-        placement=zone)
-
-    print 'Waiting for bees to load their machine guns...'
-
-    instance_ids = []
-
-    for instance in reservation.instances:
-        instance.update()
-        while instance.state != 'running':
-            print '.'
-            time.sleep(5)
-            instance.update()
-
-        instance_ids.append(instance.id)
-
-        print 'Bee %s is ready for the attack.' % instance.id
-
-    ec2_connection.create_tags(instance_ids, { "Name": "a bee!" })
-
-    _write_server_list(username, key_name, reservation.instances)
+    if backend == backends.LOCAL:
+        hive_backend = backends.LocalHive(agent_command, base_port, timeout)
+    else:
+        hive_backend = backends.EC2Hive(group, zone.split(','), image_id, instance_type, timeout, check_agent)
 
-    print 'The swarm has assembled %i bees.' % len(reservation.instances)
+    hive_backend.up(count, username, key_name, _write_server_list)
 
-def report():
+def report(roster_ttl=roster.ROSTER_TTL, check_health=True, agent_timeout=health.PROBE_TIMEOUT):
     """
-    Report the status of the load testing servers.
+    Report the status of the load testing servers and, unless
+    `check_health` is off, the health of the agents on those running.
     """
-    username, key_name, instance_ids = _read_server_list()
+    hive = _read_server_list()
 
-    if not instance_ids:
+    if not hive:
         print 'No bees have been mobilized.'
         return
 
-    ec2_connection = boto.connect_ec2()
-
-    reservations = ec2_connection.get_all_instances(instance_ids=instance_ids)
+    _refresh_server_list(hive, roster_ttl)
 
-    instances = []
+    checks = {}
+    if check_health:
+        running = [entry for entry in hive.entries if entry.state == 'running']
+        for result in health.run(running, swarm.AGENT_PORT, agent_timeout):
+            checks[result['id']] = result
+            hive.mark(result['id'], health.healthy(result))
+        _write_server_list(hive)
 
-    for reservation in reservations:
-        instances.extend(reservation.instances)
+    for entry in hive.entries:
+        if entry.agent_port:
+            line = 'Bee %s: %s @ %s:%i' % (entry.id, entry.state, entry.ip_address, entry.agent_port)
+        else:
+            line = 'Bee %s: %s @ %s' % (entry.id, entry.state, entry.ip_address)
+        if entry.id in checks:
+            line += ', %s' % health.describe(checks[entry.id])
+        print line
 
-    for instance in instances:
-        print 'Bee %s: %s @ %s' % (instance.id, instance.state, instance.ip_address)
+    if check_health:
+        ready = len([result for result in checks.values() if health.healthy(result)])
+        print '%i of %i bees are ready to attack.' % (ready, len(hive))
 
 def down():
     """
     Shutdown the load testing server.
     """
-    username, key_name, instance_ids = _read_server_list()
+    hive = _read_server_list()
 
-    if not instance_ids:
+    if not hive:
         print 'No bees have been mobilized.'
         return
 
-    print 'Connecting to the hive.'
-
-    ec2_connection = boto.connect_ec2()
-
-    print 'Calling off the swarm.'
-
-    terminated_instance_ids = ec2_connection.terminate_instances(
-        instance_ids=instance_ids)
+    terminated_instance_ids = set(backends.get(hive.backend).down(hive))
 
     print 'Stood down %i bees.' % len(terminated_instance_ids)
 
-    _delete_server_list()
+    # Bees that could not be stood down stay on the roster for another try
+    hive.entries = [entry for entry in hive.entries if entry.id not in terminated_instance_ids]
+    if hive.entries:
+        _write_server_list(hive)
+        print '%i bees are still standing; run "bees down" again to stand them down.' % len(hive)
+    else:
+        _delete_server_list()
 
-def _attack(params):
-    """
-    Test the target URL with requests.
+def _failed(result):
+    return result is None or isinstance(result, swarm.REQUEST_ERRORS + (swarm.Straggler,))
 
-    Intended for use with multiprocessing.
+def _print_results(results, series):
     """
-    print 'Bee %i is joining the swarm.' % params['i']
-
-    try:
-        querystring_params = urllib.urlencode({
-            'host': params['host'],
-            'port': params['port'],
-            'concurrent': params['concurrent_requests'] if params['concurrent_requests'] else '',
-            'number': params['num_requests'],
-            'ramp_up_time': params['ramp_up_time'] if params['ramp_up_time'] else '',
-            'no_ssl': 'true' if params['no_ssl'] else '',
-            'rate': params['rate'] if params['rate'] else '',
-            'duration': params['duration'] if params['duration'] else ''
-            })
-        headers = {"Accept": "text/plain"}
-        if params['debug_mode']:
-            port = 8001
-        else:
-            port = 8000
-
-        attack_url = "/start?%s" % querystring_params
-
-        if params['i'] == 0:
-            print 'Attack URL: %s' % attack_url
-
-        conn = httplib.HTTPConnection('%s:%s' % (params['instance_name'], port))
-        conn.request("GET", attack_url, None, headers)
-        response = conn.getresponse()
-        response_data = response.read()
-
-        if re.search('Load test ([0-9.]+) already running', response_data):
-            print 'Bee %i is already running a load test' % params['i']
-            return None
-
-        load_test_id = re.search('Started load test number ([0-9.]+)', response_data)
-        if not load_test_id:
-            print 'Bee %i appears to be offline and has not started the load test' % params['i']
-            print 'Response: %s' % response_data
-            return None
-        else:
-            load_test_id = int(load_test_id.group(1))
-
-        print 'Bee %i is firing his machine gun (load test #%i, host: %s). Bang bang!' % (params['i'], load_test_id, params['instance_name'])
-
-        http_errors = 0
-        while http_errors < MAX_HTTP_ERRORS:
-            try:
-                conn = httplib.HTTPConnection('%s:%s' % (params['instance_name'], port))
-                conn.request("GET", "/report", None, headers)
-                response = conn.getresponse()
-                response_data = response.read()
-                if re.search('Report for load test %i not ready yet' % load_test_id, response_data):
-                    time.sleep(3)
-                elif re.search('Report for load test %i complete' % load_test_id, response_data):
-                    break
-                else:
-                    print 'Bee %i is not responding to report requests correctly' % params['i']
-                    print 'Response for load test %i: %s' % (load_test_id, response_data)
-                    return None
-            except:
-                http_errors += 1
-                if http_errors == MAX_HTTP_ERRORS:
-                    print 'Bee %i is unresponsive and has suffered %i http errors' % (params['i'], MAX_HTTP_ERRORS)
-                    return None
-                time.sleep(1)
-
-        response = {}
-
-        requests_per_second_last_minute = re.search('Average\ rate\ over\ last\ minute\ of\ ([0-9.]+)\ transactions\ per\ second', response_data)
-        requests_per_second_average = re.search('Average\ rate\ of\ ([0-9.]+)\ transactions\ per\ second', response_data)
-        request_count = re.search('([0-9.]+)\ connections\ opened', response_data)
-        error_count = re.search('Load test errors ([0-9.]+)', response_data)
-        error_rate_per_minute = re.search('errors per minute ([0-9.]+)', response_data)
-        ips = re.search('IPs\ used\:\ (.+)', response_data)
-        re_matcher = re.compile('Seconds passed.*Latency\(ms\)\n(.*)\n\-\-\-', re.MULTILINE|re.DOTALL)
-        report = re_matcher.search(response_data)
-
-        if not request_count:
-            print 'Bee %i lost sight of the target (connection timed out).' % params['i']
-            print 'Response was: %s' % response_data
-            return None
-
-        response['average_per_second'] = float(requests_per_second_average.group(1))
-        response['last_minute_per_second'] = float(requests_per_second_last_minute.group(1))
-        response['request_count'] = float(request_count.group(1))
-        response['error_count'] = float(error_count.group(1))
-        response['error_rate_per_minute'] = float(error_rate_per_minute.group(1))
-        response['ips'] = ips.group(1).split(',')
-        response['report'] = report.group(1).split('\n')
-
-        print 'Bee %i is out of ammo.' % params['i']
-
-        return response
-    except socket.error, e:
-        print "Socket error for host %s" % params['instance_name']
-        print e
-        return e
-
+    Print summarized load-testing results from the bees' results and the
+    swarm series swarm.run() merged their rows into.
 
-def _print_results(results):
-    """
-    Print summarized load-testing results.
+    Returns the series, or None if no bee completed.
     """
     timeout_bees = [r for r in results if r is None]
-    exception_bees = [r for r in results if type(r) == socket.error]
-    complete_bees = [r for r in results if r is not None and type(r) != socket.error]
+    exception_bees = [r for r in results if isinstance(r, swarm.REQUEST_ERRORS)]
+    straggler_bees = [r for r in results if isinstance(r, swarm.Straggler)]
+    complete_bees = [r for r in results if not _failed(r)]
 
     num_timeout_bees = len(timeout_bees)
     num_exception_bees = len(exception_bees)
@@ -296,9 +194,18 @@ def _print_results(results):
     if timeout_bees:
         print '     Target timed out without fully responding to %i bees.' % num_timeout_bees
 
+    if straggler_bees:
+        print '     %i bees missed the collection deadline and were left out of the results (but for seconds already shown live):' % len(straggler_bees)
+        for straggler in straggler_bees:
+            if straggler.table is None:
+                print '        Bee %i (load test #%s): no partial results' % (straggler.i, straggler.load_test_id)
+            else:
+                print '        Bee %i (load test #%s): %i seconds, %i messages, %.1f ms mean latency so far' % (straggler.i,
+                    straggler.load_test_id, straggler.seconds(), straggler.messages(), straggler.mean_latency())
+
     if num_complete_bees == 0:
         print '     No bees completed the mission. Apparently your bees are peace-loving hippies.'
-        return
+        return None
 
     complete_results = [r['request_count'] for r in complete_bees]
     total_complete_requests = sum(complete_results)
@@ -326,96 +233,242 @@ def _print_results(results):
     mean_requests = uniq(complete_results)
     print '     IPs used (brackets indicate old entries no longer active):\n     %s' % (', '.join(mean_requests))
 
-    complete_results = {}
-    for r in complete_bees:
-        for row in r['report']:
-            row = row.split(',')
-            seconds = int(row[0])
-            if seconds in complete_results:
-                complete_results[seconds][0] += int(row[1])
-                complete_results[seconds][1] += int(row[2])
-                if row[3] != 'max':
-                    complete_results[seconds][2] += int(row[3])
-                complete_results[seconds][3] += int(row[4])
-                complete_results[seconds][4] += int(row[5])
-                complete_results[seconds][5] += int(row[6])
-                complete_results[seconds][6] += int(row[7])
-            else:
-                messages_attempted = row[3] if row[3] == 'max' else int(row[3])
-                complete_results[seconds] = [int(row[1]), int(row[2]), messages_attempted, int(row[4]), int(row[5]), int(row[6]), int(row[7])]
-    print '\nCollective bee performance report:\nSeconds passed,Connections attempted,Actual connections,Messages attempted p/s,Actual Messages p/s,Connection Errors p/s,Misfires p/s,Average latency(ms)'
-    for i in sorted(complete_results.keys()):
-        row = complete_results[i]
-        row[6] = row[6] / len(complete_bees)
-        print '%s,%s' % (i, ','.join(str(i) for i in row))
+    start_offsets = [r['start_offset'] for r in complete_bees]
+    residual = max(abs(r['start_offset'] - r['start_shift']) for r in complete_bees)
+    print '     Start skew across bees:\t%.3f [sec] (%.3f after alignment)' % (max(start_offsets) - min(start_offsets), residual)
 
-    print '\nMission Assessment: Swarm annihilated target.'
+    # Bees report one mean latency per second, so only the mean is per message
+    latency = series.histogram()
+    print '     Mean latency across all messages:\t%.1f [ms]' % latency.mean()
+    print '     Per-second mean latencies of bees:\tp50 %.1f, p95 %.1f, p99 %.1f, max %.1f [ms]' % (
+        latency.percentile(50), latency.percentile(95), latency.percentile(99), latency.max or 0.0)
 
+    # Only rate-limited bees have a schedule to fall behind
+    summary = aggregate.summarize(series)
+    if summary['scheduled_messages']:
+        print '     Schedule-corrected mean latency:\t%.1f [ms]' % summary['corrected_latency_mean']
+        print '     Schedule-corrected per-second means:\tp50 %.1f, p95 %.1f, p99 %.1f, max %.1f [ms]' % (
+            summary['corrected_latency_p50'], summary['corrected_latency_p95'],
+            summary['corrected_latency_p99'], summary['corrected_latency_max'])
+        print '     Shortfall against the schedule:\t%i of %i messages (%.2f%%)' % (summary['shortfall'],
+            summary['scheduled_messages'], 100 * summary['shortfall_rate'])
 
-def attack(host, port, number, duration, concurrent, ramp_up_time, rate, no_ssl, debug_mode):
+    _print_table(series)
+
+    return series
+
+def _count(value):
+    return '%i' % value if value == int(value) else '%.1f' % value
+
+def _corrected(summary):
     """
-    Test the root url of this site.
+    The schedule-corrected p99 and shortfall of a summary, for the lines
+    that report its uncorrected latencies, if it had a schedule.
     """
+    if not summary['scheduled_messages']:
+        return ''
+    return ', corrected p99 of second means %.1f [ms], shortfall %.2f%%' % (summary['corrected_latency_p99'], 100 * summary['shortfall_rate'])
 
-    if debug_mode:
-        username, key_name, instance_ids = 'ubuntu', 'aws', True
-        print 'Running in debug mode, executing locally for one instance on port 8001'
+def _print_table(series, phases=None):
+    """
+    Print the swarm's per-second results, with the phase of each second if given.
+
+    A series kept in buckets of several seconds prints one line per bucket,
+    holding its per-second averages. The percentiles are those of the
+    bees' per-second mean latencies (see aggregate.SwarmSeries). The
+    shortfall and corrected percentiles follow the measured ones (see
+    aggregate.Schedule); without a rate they match.
+    """
+    header = 'Seconds passed,Connections attempted,Actual connections,Messages attempted p/s,Actual Messages p/s,Connection Errors p/s,Misfires p/s,Average latency(ms),p50 of bee means(ms),p95 of bee means(ms),p99 of bee means(ms),Shortfall p/s,Corrected p50 of bee means(ms),Corrected p99 of bee means(ms)'
+    if phases:
+        header += ',Phase'
+    if series.bucket > 1:
+        print '\nCollective bee performance report (per-second averages over %is buckets):\n%s' % (series.bucket, header)
     else:
-        username, key_name, instance_ids = _read_server_list()
+        print '\nCollective bee performance report:\n%s' % header
+
+    for i in series.sorted_seconds():
+        row = series.row(i)
+        second_latency = series.histogram_at(i)
+        corrected_latency = series.histogram_at(i, corrected=True)
+        messages_attempted = 'max' if row[aggregate.UNLIMITED_BEES] else _count(row[aggregate.MESSAGES_ATTEMPTED])
+        line = '%s,%s,%s,%s,%s,%s,%s,%.1f,%.1f,%.1f,%.1f,%s,%.1f,%.1f' % (i,
+            _count(row[aggregate.CONNECTIONS_ATTEMPTED]), _count(row[aggregate.ACTUAL_CONNECTIONS]), messages_attempted,
+            _count(row[aggregate.ACTUAL_MESSAGES]), _count(row[aggregate.CONNECTION_ERRORS]), _count(row[aggregate.MISFIRES]),
+            series.mean_latency(i), second_latency.percentile(50), second_latency.percentile(95), second_latency.percentile(99),
+            _count(row[aggregate.SHORTFALL]), corrected_latency.percentile(50), corrected_latency.percentile(99))
+        if phases:
+            line += ',%s' % ';'.join(phase['name'] for phase in phases
+                if phase['first_second'] < i + series.bucket and i <= phase['last_second'])
+        print line
+
+def _print_targets(params, results, targets):
+    """
+    Print throughput, errors and latency for each target attacked by its own
+    bees, from the `targets` series swarm.run() kept by host.
 
-    if not instance_ids:
-        print 'No bees are ready to attack.'
-        return
+    Returns the summary of each target by host, or None if every bee
+    attacked the same host list.
+    """
+    hosts = uniq([p['host'] for p in params])
+    if len(hosts) < 2:
+        return None
+
+    print '\nResults by target:'
+    summaries = {}
+    for host in hosts:
+        bees = [r for p, r in zip(params, results) if p['host'] == host]
+        complete_bees = [r for r in bees if not _failed(r)]
+        if not complete_bees:
+            print '     %s:\tno bees of %i completed' % (host, len(bees))
+            continue
+
+        summary = aggregate.summarize(targets[host])
+        summaries[host] = summary
+        print '     %s:\t%i of %i bees, %.1f msg/s, error rate %.4f, p50 %.1f, p95 %.1f, p99 %.1f of second means [ms]%s' % (host,
+            len(complete_bees), len(bees), summary['messages_per_second'], summary['error_rate'],
+            summary['latency_p50'], summary['latency_p95'], summary['latency_p99'], _corrected(summary))
+
+    return summaries
+
+def _print_shares(params, results, duration):
+    """
+    Print the load planned for each bee next to what it achieved.
+    """
+    print '\nPlanned vs. achieved load per bee:'
+    for p, result in zip(params, results):
+        planned = 'max' if p['rate'] is None else '%i' % p['rate']
+        if result is None:
+            achieved = 'timed out'
+        elif isinstance(result, swarm.Straggler):
+            achieved = '%i msg before it was left behind' % result.messages()
+        elif isinstance(result, swarm.REQUEST_ERRORS):
+            achieved = 'failed'
+        elif duration:
+            achieved = '%.1f msg/s' % result['average_per_second']
+        else:
+            achieved = '%i msg' % result['request_count']
+
+        if duration:
+            planned = '%s msg/s' % planned
+        else:
+            planned = '%i msg' % p['num_requests']
 
+        print '     Bee %i (%s, weight %.4g): planned %s, achieved %s' % (p['i'], p['instance_type'] or 'unknown type', p['weight'], planned, achieved)
+
+def _calibrate(params, seconds):
+    """
+    Fire an unthrottled probe from every bee for a few seconds and return
+    the rate each achieved, to weight the shares of the real attack by.
+    Bees that fail the probe get no weight and so no share.
+    """
+    print 'Calibrating the swarm with a %is probe.' % seconds
+
+    probe = [dict(p, rate=None, duration=seconds, num_requests=0) for p in params]
+    with tracing.span('calibrate', seconds=seconds):
+        results = swarm.run(probe)
+
+    weights = []
+    for p, result in zip(params, results):
+        if _failed(result):
+            weights.append(0.0)
+            print '     Bee %i failed the probe.' % p['i']
+        else:
+            weights.append(result['average_per_second'])
+            print '     Bee %i: %.1f msg/s' % (p['i'], result['average_per_second'])
+
+    return weights
+
+def _check_health(hive, instances, debug_mode, agent_timeout):
+    """
+    Probe the agents of the bees about to attack and return those fit to,
+    recording the others as unhealthy on the roster.
+    """
+    print 'Checking the bees\' agents.'
+
+    results = health.run(instances, swarm.DEBUG_AGENT_PORT if debug_mode else swarm.AGENT_PORT, agent_timeout)
+
+    fit = []
+    for instance, result in zip(instances, results):
+        if health.healthy(result):
+            fit.append(instance)
+        else:
+            print 'Bee %s will sit this attack out: %s' % (instance.id, health.describe(result))
+        if hive:
+            hive.mark(instance.id, health.healthy(result))
+
+    if hive and len(fit) < len(instances):
+        _write_server_list(hive)
+
+    return fit
+
+def _assemble(debug_mode, roster_ttl, check_health=False, agent_timeout=health.PROBE_TIMEOUT):
+    """
+    Gather the bees that are fit to attack, leaving out those whose agents
+    are unhealthy if `check_health` is on.
+
+    Returns the roster (None in debug mode), the ssh username and key name
+    and the bees, or None if there are no bees to attack with.
+    """
     if debug_mode:
+        print 'Running in debug mode, executing locally for one instance on port 8001'
         instances = [DebugInstance('1', 'localhost')]
-    else:
-        print 'Connecting to the hive.'
+        if check_health:
+            instances = _check_health(None, instances, debug_mode, agent_timeout)
+        if not instances:
+            print 'No bees are ready to attack.'
+            return None
+        return None, 'ubuntu', 'aws', instances
 
-        ec2_connection = boto.connect_ec2()
-        print 'Assembling bees.'
+    with tracing.span('roster.load'):
+        hive = _read_server_list()
 
-        reservations = ec2_connection.get_all_instances(instance_ids=instance_ids)
+    if not hive:
+        print 'No bees are ready to attack.'
+        return None
 
-        instances = []
+    _refresh_server_list(hive, roster_ttl)
 
-        for reservation in reservations:
-            instances.extend(reservation.instances)
+    print 'Assembling bees.'
 
-    instance_count = len(instances)
-    requests_per_instance = int(float(number) / instance_count)
+    instances = [entry for entry in hive.entries if entry.healthy]
 
-    if duration:
-        action_description = 'rounds for %ss' % duration
-    else:
-        action_description = '%s rounds' % requests_per_instance
+    if len(instances) < len(hive):
+        print '%i bees are not running and will sit this attack out.' % (len(hive) - len(instances))
 
-    if concurrent:
-        connections_description = connections_per_instance = int(float(concurrent) / instance_count)
-    else:
-        connections_per_instance = None
-        connections_description = 'unlimited'
+    if check_health and instances:
+        instances = _check_health(hive, instances, debug_mode, agent_timeout)
 
-    if rate:
-        rate_per_instance = int(float(rate) / instance_count)
-    else:
-        rate_per_instance = False
+    if not instances:
+        print 'No bees are ready to attack.'
+        return None
 
-    print 'Each of %i bees will fire %s, using %s concurrent connections.' % (instance_count, action_description, connections_description)
+    return hive, hive.username, hive.key_name, instances
 
+def _plan(instances, weights, host, port, number, concurrent, rate, duration, ramp_up_time, no_ssl, username, key_name, debug_mode, targets=shard.ALL_TARGETS, target_weights=None):
+    """
+    Build the swarm parameters of every bee that has a share of the attack,
+    handing out the hosts of a comma-separated `host` by `targets`.
+    """
+    shares = shard.plan(weights, number, concurrent, rate, duration)
+    chosen = [(instance, share) for instance, share in zip(instances, shares) if share is not None]
+    hosts = shard.assign_targets(host.split(','), [share['weight'] for instance, share in chosen], targets, target_weights)
     params = []
 
-    for i, instance in enumerate(instances):
+    for (instance, share), bee_host in zip(chosen, hosts):
         params.append({
-            'i': i,
+            'i': len(params),
             'instance_id': instance.id,
             'instance_name': instance.public_dns_name,
-            'host': host,
+            'instance_type': getattr(instance, 'instance_type', None),
+            'agent_port': getattr(instance, 'agent_port', None),
+            'weight': share['weight'],
+            'host': bee_host,
             'port': port,
-            'concurrent_requests': connections_per_instance,
-            'num_requests': requests_per_instance,
+            'concurrent_requests': share['concurrent_requests'],
+            'num_requests': share['num_requests'],
             'ramp_up_time': ramp_up_time,
-            'rate': rate_per_instance,
+            'rate': share['rate'],
             'duration': duration,
             'no_ssl': no_ssl,
             'username': username,
@@ -423,31 +476,505 @@ def attack(host, port, number, duration, concurrent, ramp_up_time, rate, no_ssl,
             'debug_mode': debug_mode
         })
 
-    print 'Stinging URL so it will be cached for the attack.'
+    if len(params) < len(instances):
+        print '%i bees have no share of the attack and will sit it out.' % (len(instances) - len(params))
+
+    attacked = set(','.join(hosts).split(','))
+    unattacked = [target for target in host.split(',') if target not in attacked]
+    if unattacked:
+        print 'Too few bees to attack every target; %s will not be attacked.' % ', '.join(unattacked)
+
+    return params
 
-    # Ping url so it will be cached for testing
-    if no_ssl:
-        ssl_suffix = ''
+def _sting(host, port, no_ssl, warm_paths=preflight.WARM_PATHS, warm_timeout=preflight.WARM_TIMEOUT, warm_retries=preflight.WARM_RETRIES, max_warm_latency=None):
+    """
+    Prime every url on every target at once so they are cached for the attack.
+
+    Returns whether the targets are ready: every url answered and, with
+    `max_warm_latency`, answered warm within that many milliseconds.
+    """
+    print 'Stinging URLs so they will be cached for the attack.'
+
+    with tracing.span('sting', hosts=host):
+        results = preflight.run(host.split(','), port, no_ssl, warm_paths, warm_timeout, warm_retries)
+    preflight.print_results(results)
+
+    if not preflight.ready(results, max_warm_latency):
+        print 'The target is not ready for the attack.'
+        return False
+
+    return True
+
+def _exporters(metrics_port, statsd):
+    """
+    Set up the live metrics exporters asked for, or return None if the
+    Prometheus endpoint cannot be served.
+    """
+    exporters = []
+
+    if metrics_port:
+        try:
+            exporters.append(metrics.PrometheusExporter(metrics_port))
+        except socket.error, e:
+            print 'Could not serve metrics on port %i: %s' % (metrics_port, e)
+            return None
+        print 'Serving live metrics at http://127.0.0.1:%i/metrics' % metrics_port
+
+    if statsd:
+        host, port = metrics.parse_address(statsd)
+        exporters.append(metrics.StatsdExporter(host, port))
+        print 'Pushing live metrics to StatsD at %s:%i' % (host, port)
+
+    return exporters
+
+def _baseline(thresholds, archive_dir):
+    """
+    Load the summary of the archived run the thresholds compare against, if any.
+    """
+    if not (thresholds and thresholds.get('baseline')):
+        return None
+
+    baseline_path = archive.find(thresholds['baseline'], archive_dir or archive.RUNS_DIRECTORY)
+    if not baseline_path:
+        raise slo.SLOError('No archived run found for baseline %s' % thresholds['baseline'])
+    return archive.Run(baseline_path).summary
+
+def _mark_failures(hive, params, results):
+    """
+    Record on the roster which bees failed, so they are described again
+    before the next attack.
+    """
+    if not hive:
+        return
+
+    for p, result in zip(params, results):
+        hive.mark(p['instance_id'], not _failed(result))
+    _write_server_list(hive)
+
+def attack(host, port, number, duration, concurrent, ramp_up_time, rate, no_ssl, debug_mode, live=False, live_window=swarm.LIVE_WINDOW, long_poll=None, sync_start=False, archive_dir=archive.RUNS_DIRECTORY, thresholds=None, verdict_file=None, roster_ttl=roster.ROSTER_TTL, calibrate=None, targets=shard.ALL_TARGETS, target_weights=None, warm_paths=preflight.WARM_PATHS, warm_timeout=preflight.WARM_TIMEOUT, warm_retries=preflight.WARM_RETRIES, max_warm_latency=None, grace=swarm.STRAGGLER_GRACE, bucket=1, metrics_port=None, statsd=None, check_health=False, agent_timeout=health.PROBE_TIMEOUT):
+    """
+    Test the root url of this site.
+
+    The hosts of a comma-separated `host` are handed to the bees by the
+    `targets` strategy (see shard.assign_targets) and, unless every bee
+    attacks all of them, reported on one by one as well as in total.
+
+    Before the attack every one of `warm_paths` is primed on every target
+    at once. If any cannot be fetched, or answers slower than
+    `max_warm_latency` milliseconds once warm, the attack is called off.
+
+    The requested totals are shared out exactly, weighted by instance type
+    or, when `calibrate` is a number of seconds, by the rate each bee
+    reaches in an unthrottled probe of that length.
+
+    Each bee's rows are folded into the swarm's series as soon as they are
+    read; with `bucket` above one, it keeps one row per that many seconds.
+    While the attack runs, the swarm's, each target's and each bee's
+    metrics are served for Prometheus on `metrics_port` and/or pushed to
+    the `statsd` HOST[:PORT], if given.
+
+    When `thresholds` are given the aggregated results are judged against
+    them and the verdict is returned (and written to `verdict_file`).
+    """
+    baseline = _baseline(thresholds, archive_dir)
+    attack_parameters = {
+        'host': host,
+        'port': port,
+        'number': number,
+        'duration': duration,
+        'concurrent': concurrent,
+        'ramp_up_time': ramp_up_time,
+        'rate': rate,
+        'no_ssl': no_ssl
+        }
+
+    swarm_ready = _assemble(debug_mode, roster_ttl, check_health, agent_timeout)
+    if not swarm_ready:
+        return
+    hive, username, key_name, instances = swarm_ready
+
+    attack_parameters['shares'] = 'calibrated' if calibrate else 'instance type'
+    attack_parameters['targets'] = targets
+
+    def plan(weights):
+        return _plan(instances, weights, host, port, number, concurrent, rate, duration, ramp_up_time, no_ssl, username, key_name, debug_mode, targets, target_weights)
+
+    params = plan([shard.instance_weight(instance) for instance in instances])
+
+    if not _sting(host, port, no_ssl, warm_paths, warm_timeout, warm_retries, max_warm_latency):
+        return
+
+    if calibrate:
+        measured = dict(zip([p['instance_id'] for p in params], _calibrate(params, calibrate)))
+        if not any(measured.values()):
+            print 'No bees survived calibration.'
+            return
+        params = plan([measured.get(instance.id, 0.0) for instance in instances])
+
+    instance_count = len(params)
+
+    if duration:
+        action_description = 'rounds for %ss' % duration
     else:
-        ssl_suffix = 's'
+        action_description = '%s rounds' % number
 
-    hosts_array = host.split(',')
-    for i, host in enumerate(hosts_array):
-        print '   sting url %i: http%s://%s:%s/' % (i, ssl_suffix, host, port)
-        urllib2.urlopen('http%s://%s:%s/' % (ssl_suffix, host, port))
+    if concurrent:
+        connections_description = concurrent
+    else:
+        connections_description = 'unlimited'
+
+    print 'The swarm of %i bees will fire %s, using %s concurrent connections in all.' % (instance_count, action_description, connections_description)
+
+    exporters = _exporters(metrics_port, statsd)
+    if exporters is None:
+        return
 
     print 'Organizing the swarm.'
 
-    # Spin up processes for connecting to EC2 instances
-    pool = Pool(len(params))
-    results = pool.map(_attack, params)
+    series = aggregate.SwarmSeries(bucket, swarm.expected_length(duration, ramp_up_time))
+    target_series = {}
+    try:
+        results = swarm.run(params, live, live_window, long_poll, sync_start, grace=grace, series=series, targets=target_series, exporters=exporters)
+    finally:
+        metrics.close(exporters)
 
     print 'Offensive complete.'
 
-    _print_results(results)
+    _mark_failures(hive, params, results)
+
+    with tracing.span('results'):
+        series = _print_results(results, series)
+        target_summaries = _print_targets(params, results, target_series)
+        _print_shares(params, results, duration)
+        summary = aggregate.summarize(series) if series else None
+    if summary and target_summaries:
+        summary['targets'] = target_summaries
+
+    verdict = None
+    if thresholds:
+        failed_bees = len([r for r in results if _failed(r)])
+        verdict = slo.evaluate(summary, thresholds, failed_bees, instance_count, baseline)
+
+        print '\nService level objectives:'
+        slo.print_verdict(verdict)
+
+        if verdict_file:
+            slo.write(verdict, verdict_file)
+
+    if verdict and not verdict['passed']:
+        print '\nMission Assessment: Swarm failed its objectives.'
+    elif series:
+        print '\nMission Assessment: Swarm annihilated target.'
+
+    if series and archive_dir:
+        attack_parameters['bees'] = instance_count
+        with tracing.span('archive'):
+            path = archive.save(series, summary, params, results, attack_parameters, archive_dir, verdict)
+        print 'Results archived in %s' % path
+
+    print 'The swarm is awaiting new orders.'
+
+    return verdict
+
+def attack_plan(phases, no_ssl, debug_mode, sync_start=False, archive_dir=archive.RUNS_DIRECTORY, thresholds=None, verdict_file=None, roster_ttl=roster.ROSTER_TTL, bucket=1, metrics_port=None, statsd=None, check_health=False, agent_timeout=health.PROBE_TIMEOUT):
+    """
+    Run the phases of a workload plan back to back on the same bees.
+
+    Each phase is shared out and run like an attack of its own, but the
+    agent connections stay open between phases and every phase's rows are
+    placed on one timeline that starts with the first phase, so the whole
+    session merges into a single series, in buckets of `bucket` seconds,
+    annotated with its phases. Each phase starts on a fresh bucket, so no
+    bucket holds the seconds of two phases. Live metrics are exported throughout, as
+    for attack().
+
+    When `thresholds` are given the session as a whole is judged against
+    them and the verdict is returned (and written to `verdict_file`).
+    """
+    baseline = _baseline(thresholds, archive_dir)
+
+    swarm_ready = _assemble(debug_mode, roster_ttl, check_health, agent_timeout)
+    if not swarm_ready:
+        return
+    hive, username, key_name, instances = swarm_ready
+    weights = [shard.instance_weight(instance) for instance in instances]
+
+    stung = set()
+    for phase in phases:
+        if (phase['host'], phase['port']) not in stung:
+            if not _sting(phase['host'], phase['port'], no_ssl):
+                return
+            stung.add((phase['host'], phase['port']))
+
+    series = aggregate.SwarmSeries(bucket, sum(swarm.expected_length(phase['duration'], phase['ramp_up_time']) for phase in phases))
+    connections = {}
+    all_params = []
+    all_results = []
+    failed_bees = set()
+
+    exporters = _exporters(metrics_port, statsd)
+    if exporters is None:
+        return
+
+    print 'Organizing the swarm for %i phases.' % len(phases)
+
+    try:
+        for phase in phases:
+            print '\nPhase %s: %s msg/s for %ss against %s:%s, using %s concurrent connections.' % (phase['name'],
+                phase['rate'] or 'max', phase['duration'], phase['host'], phase['port'], phase['concurrent'] or 'unlimited')
+
+            params = _plan(instances, weights, phase['host'], phase['port'], 0, phase['concurrent'], phase['rate'], phase['duration'],
+                phase['ramp_up_time'], no_ssl, username, key_name, debug_mode)
+            for p in params:
+                p['phase'] = phase['name']
+
+            results = swarm.run(params, sync_start=sync_start, connections=connections, series=series, exporters=exporters)
+            _mark_failures(hive, params, results)
+
+            all_params.extend(params)
+            all_results.extend(results)
+            failed_bees.update(p['instance_id'] for p, r in zip(params, results) if _failed(r))
+
+            complete_bees = [r for r in results if not _failed(r)]
+            phase['first_second'] = phase['last_second'] = None
+            if not complete_bees:
+                print 'No bees completed phase %s.' % phase['name']
+                continue
+
+            # The series' epoch is the first phase's start, so every phase
+            # lands on the session's timeline where it ran
+            phase['first_second'] = min(r['start_shift'] for r in complete_bees)
+            phase['last_second'] = series.last_second()
+    finally:
+        swarm.close(connections)
+        metrics.close(exporters)
+
+    print 'Offensive complete.'
+
+    ran = [phase for phase in phases if phase['first_second'] is not None]
+    if not ran:
+        print '     No bees completed the mission. Apparently your bees are peace-loving hippies.'
+        return
+
+    print '\nPhases:'
+    for phase in ran:
+        phase_summary = aggregate.summarize(series, range(phase['first_second'], phase['last_second'] + 1))
+        print '     %s (seconds %i-%i):\t%.1f msg/s, error rate %.4f, p50 %.1f, p99 %.1f of second means [ms]%s' % (phase['name'],
+            phase['first_second'], phase['last_second'], phase_summary['messages_per_second'], phase_summary['error_rate'],
+            phase_summary['latency_p50'], phase_summary['latency_p99'], _corrected(phase_summary))
+
+    _print_table(series, ran)
+    summary = aggregate.summarize(series)
+
+    verdict = None
+    if thresholds:
+        verdict = slo.evaluate(summary, thresholds, len(failed_bees), len(instances), baseline)
+
+        print '\nService level objectives:'
+        slo.print_verdict(verdict)
+
+        if verdict_file:
+            slo.write(verdict, verdict_file)
+
+    if verdict and not verdict['passed']:
+        print '\nMission Assessment: Swarm failed its objectives.'
+    else:
+        print '\nMission Assessment: Swarm annihilated target.'
+
+    if archive_dir:
+        attack_parameters = {
+            'phases': phases,
+            'no_ssl': no_ssl,
+            'bees': len(instances)
+            }
+        with tracing.span('archive'):
+            path = archive.save(series, summary, all_params, all_results, attack_parameters, archive_dir, verdict)
+        print 'Results archived in %s' % path
+
+    print 'The swarm is awaiting new orders.'
+
+    return verdict
+
+def probe(host, port, concurrent, duration, rate, ramp_up_time, no_ssl, debug_mode, thresholds=None, growth=PROBE_GROWTH, precision=PROBE_PRECISION, max_steps=PROBE_MAX_STEPS, roster_ttl=roster.ROSTER_TTL, check_health=False, agent_timeout=health.PROBE_TIMEOUT):
+    """
+    Find the highest rate the target sustains.
+
+    Short attacks of `duration` seconds are run at growing rates, starting
+    at `rate` and multiplying by `growth`, until one fails. The rate is
+    then bisected between the last step that passed and the first that
+    failed until they are within `precision` of each other, or until
+    `max_steps` attacks have been run. A step passes when it meets the
+    error-rate and latency `thresholds`, laid over PROBE_THRESHOLDS, and
+    the swarm achieved at least PROBE_MIN_ACHIEVED of the rate asked for.
+    Agent connections are kept open from one step to the next.
+
+    Returns the highest rate that passed, or None.
+    """
+    unused = [name for name in thresholds or {} if name not in PROBE_THRESHOLD_NAMES]
+    if unused:
+        raise slo.SLOError('Thresholds that do not apply to a probe step: %s' % ', '.join(sorted(unused)))
+    thresholds = slo.merge(PROBE_THRESHOLDS, **(thresholds or {}))
+    duration = duration or PROBE_DURATION
+
+    swarm_ready = _assemble(debug_mode, roster_ttl, check_health, agent_timeout)
+    if not swarm_ready:
+        return None
+    hive, username, key_name, instances = swarm_ready
+    weights = [shard.instance_weight(instance) for instance in instances]
+
+    if not _sting(host, port, no_ssl):
+        return None
+
+    connections = {}
+    steps = []
+
+    def step(step_rate):
+        print '\nProbe step %i: %i msg/s for %is.' % (len(steps) + 1, step_rate, duration)
+
+        params = _plan(instances, weights, host, port, step_rate * duration, concurrent, step_rate, duration, ramp_up_time, no_ssl, username, key_name, debug_mode)
+        series = aggregate.SwarmSeries(expected_seconds=swarm.expected_length(duration, ramp_up_time))
+        results = swarm.run(params, connections=connections, series=series)
+        _mark_failures(hive, params, results)
+
+        complete_bees = [r for r in results if not _failed(r)]
+        summary = aggregate.summarize(series) if complete_bees else None
+        verdict = slo.evaluate(summary, thresholds, len(results) - len(complete_bees), len(results))
+
+        achieved = summary['messages_per_second'] if summary else 0.0
+        passed = verdict['passed'] and achieved >= step_rate * PROBE_MIN_ACHIEVED
+
+        slo.print_verdict(verdict)
+        print '     %-4s achieved %.1f of %i msg/s' % ('ok' if achieved >= step_rate * PROBE_MIN_ACHIEVED else 'FAIL', achieved, step_rate)
+
+        steps.append({
+            'rate': step_rate,
+            'passed': passed,
+            'summary': summary
+            })
+        return passed
+
+    good = None
+    bad = None
+    current = rate or PROBE_START_RATE
+
+    try:
+        # Grow exponentially until the target falls over...
+        while len(steps) < max_steps:
+            if not step(current):
+                bad = current
+                break
+            good = current
+            current = int(math.ceil(current * growth))
+
+        # ...then close in on the knee
+        while bad and len(steps) < max_steps and bad - (good or 0) > max(1, (good or bad) * precision):
+            middle = ((good or 0) + bad) // 2
+            if middle <= (good or 0):
+                break
+            if step(middle):
+                good = middle
+            else:
+                bad = middle
+    finally:
+        swarm.close(connections)
+
+    print '\nThroughput and latency by rate:\nRate,Achieved p/s,Error rate,p50 of second means(ms),p95 of second means(ms),p99 of second means(ms),Result'
+    for s in sorted(steps, key=lambda s: s['rate']):
+        summary = s['summary'] or {}
+        print '%i,%.1f,%.4f,%.1f,%.1f,%.1f,%s' % (s['rate'], summary.get('messages_per_second', 0.0), summary.get('error_rate', 1.0),
+            summary.get('latency_p50', 0.0), summary.get('latency_p95', 0.0), summary.get('latency_p99', 0.0), 'pass' if s['passed'] else 'fail')
+
+    if good is None:
+        print '\nMission Assessment: The target could not sustain even %i msg/s.' % bad
+    elif bad is None:
+        print '\nMission Assessment: The target sustained %i msg/s, the highest rate probed.' % good
+    else:
+        print '\nMission Assessment: The target sustains up to %i msg/s (it failed at %i msg/s).' % (good, bad)
 
     print 'The swarm is awaiting new orders.'
 
+    return good
+
+COMPARE_METRICS = (
+    ('Messages per second', 'messages_per_second', '%.1f'),
+    ('Peak messages per second', 'peak_messages_per_second', '%i'),
+    ('Total messages', 'messages', '%i'),
+    ('Connection errors', 'connection_errors', '%i'),
+    ('Misfires', 'misfires', '%i'),
+    ('Error rate', 'error_rate', '%.4f'),
+    ('Mean latency (ms)', 'latency_mean', '%.1f'),
+    ('p50 of second means (ms)', 'latency_p50', '%.1f'),
+    ('p95 of second means (ms)', 'latency_p95', '%.1f'),
+    ('p99 of second means (ms)', 'latency_p99', '%.1f'),
+    ('Corrected p99, second means', 'corrected_latency_p99', '%.1f'),
+    ('Shortfall rate', 'shortfall_rate', '%.4f'),
+    )
+COMPARE_CURVE_ROWS = 20
+
+def _curve(run, bucket):
+    """
+    Average throughput and message-weighted latency of a run in buckets of seconds.
+    """
+    seconds = run.column('seconds')
+    messages = run.column('actual_messages')
+    latency = run.column('latency_mean')
+
+    curve = {}
+    for second, count, mean in zip(seconds, messages, latency):
+        totals = curve.setdefault(second // bucket, [0, 0, 0.0])
+        totals[0] += 1
+        totals[1] += count
+        totals[2] += count * mean
+
+    return dict((b, (float(t[1]) / t[0], t[2] / t[1] if t[1] else 0.0)) for b, t in curve.items())
+
+def compare(run_a, run_b, archive_dir=archive.RUNS_DIRECTORY):
+    """
+    Compare two archived attacks.
+    """
+    paths = [archive.find(run_a, archive_dir), archive.find(run_b, archive_dir)]
+    for name, path in zip((run_a, run_b), paths):
+        if not path:
+            print 'No archived run found for %s' % name
+            return
+
+    a, b = [archive.Run(path) for path in paths]
+
+    print 'Comparing run %s (A) with run %s (B).' % (a.run_id, b.run_id)
+    for run in (a, b):
+        parameters = run.parameters
+        if 'phases' in parameters:
+            print '     %s: %s bees, %i phases (%s), %s seconds' % (run.run_id, parameters.get('bees'), len(parameters['phases']),
+                ', '.join(phase['name'] for phase in parameters['phases']), run.summary['seconds'])
+        else:
+            print '     %s: %s bees against %s:%s, rate %s, concurrent %s, %s seconds' % (run.run_id,
+                parameters.get('bees'), parameters['host'], parameters['port'], parameters['rate'], parameters['concurrent'], run.summary['seconds'])
+
+    print '\n%-28s %14s %14s %14s %9s' % ('Metric', 'A', 'B', 'Delta', 'Delta %')
+    for label, key, value_format in COMPARE_METRICS:
+        # Runs archived before a metric was added do not have it
+        if key not in a.summary or key not in b.summary:
+            continue
+        value_a = a.summary[key]
+        value_b = b.summary[key]
+        delta = value_b - value_a
+        percent = '%+.1f%%' % (100.0 * delta / value_a) if value_a else 'n/a'
+        print '%-28s %14s %14s %14s %9s' % (label, value_format % value_a, value_format % value_b, ('%+' + value_format[1:]) % delta, percent)
+
+    bucket = max(1, -(-max(a.length, b.length) // COMPARE_CURVE_ROWS))
+    try:
+        curve_a = _curve(a, bucket)
+        curve_b = _curve(b, bucket)
+    except archive.ArchiveError, e:
+        print '\nCould not read the per-second results: %s' % e
+        return
+
+    print '\nThroughput and latency every %is:\nSeconds,A messages p/s,B messages p/s,A latency(ms),B latency(ms)' % bucket
+    for i in sorted(set(curve_a.keys()) | set(curve_b.keys())):
+        rate_a, latency_a = curve_a.get(i, (0.0, 0.0))
+        rate_b, latency_b = curve_b.get(i, (0.0, 0.0))
+        print '%i,%.1f,%.1f,%.1f,%.1f' % (i * bucket, rate_a, rate_b, latency_a, latency_b)
+
 
 def uniq(seq):
     seen = set()
@@ -0,0 +1,311 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# A stand-in for the load agent that runs on every bee.
+#
+# It answers /start, /report and /time with the same text the real agent
+# sends, but synthesizes the per-second results instead of attacking
+# anything, so the coordinator can be exercised and benchmarked offline:
+#
+#     python -m beeswithmachineguns.fake_agent --port 8001
+#     bees attack --debug -o localhost -p 80 -d 10 --no_ssl
+#
+# Each local address the agent is reached on (127.0.0.1, 127.0.0.2, ...)
+# behaves as a separate bee, so one agent can stand in for a whole swarm.
+#
+# Reports honour "since" (only the rows after that second) and are gzipped
+# for clients that accept it, unless --no_delta or --no_gzip say otherwise.
+
+from optparse import OptionParser
+import BaseHTTPServer
+import math
+import random
+import SocketServer
+import threading
+import time
+import urlparse
+import zlib
+
+from report_parser import TABLE_HEADER
+
+DEFAULT_PORT = 8001
+
+class AgentConfig(object):
+    """
+    How the synthesized bees behave.
+    """
+
+    def __init__(self, rate=1000, latency=20.0, jitter=5.0, error_rate=0.0, misfire_rate=0.0,
+            start_delay=0.0, report_delay=0.0, clock_offset=0.0, partial=True, seed=0, capacity=None, stall=(),
+            delta=True, gzip=True):
+        self.rate = rate
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.misfire_rate = misfire_rate
+        self.start_delay = start_delay
+        self.report_delay = report_delay
+        self.clock_offset = clock_offset
+        self.partial = partial
+        self.seed = seed
+        self.capacity = capacity
+        self.stall = stall
+        self.delta = delta
+        self.gzip = gzip
+
+class LoadTest(object):
+    """
+    A synthesized load test on one fake bee.
+    """
+
+    def __init__(self, test_id, query, config, started_at, seed):
+        self.id = test_id
+        self.config = config
+        self.started_at = started_at
+        self.seed = seed
+
+        self.concurrent = int(query.get('concurrent') or 100)
+        self.rate = int(query['rate']) if query.get('rate') else None
+
+        per_second = self.rate or config.rate
+        if query.get('duration'):
+            # The ramp-up runs ahead of the full-rate duration
+            self.length = int(query['duration']) + int(query.get('ramp_up_time') or 0)
+        else:
+            self.length = max(1, int(math.ceil(float(query.get('number') or per_second) / per_second)))
+
+        self.rows = []
+
+    def elapsed_seconds(self, now):
+        return min(max(int(now - self.started_at), 0), self.length)
+
+    def complete(self, now):
+        return self.elapsed_seconds(now) >= self.length
+
+    def fill(self, now):
+        """
+        Synthesize the rows of every second completed so far.
+        """
+        config = self.config
+        while len(self.rows) < self.elapsed_seconds(now):
+            second = len(self.rows)
+            rng = random.Random(self.seed * 100003 + second)
+
+            connection_errors = int(round(self.concurrent * config.error_rate * rng.random() * 2))
+            attempted = self.rate or config.rate
+            misfires = int(round(attempted * config.misfire_rate * rng.random() * 2))
+            mean_latency = config.latency
+
+            # Past its capacity the target queues and then drops the excess
+            if config.capacity and attempted > config.capacity:
+                misfires += attempted - config.capacity
+                mean_latency *= float(attempted) / config.capacity
+
+            actual = max(0, int(attempted * rng.uniform(0.95, 1.0)) - misfires)
+            latency = max(1, int(round(rng.gauss(mean_latency, config.jitter))))
+
+            self.rows.append('%i,%i,%i,%s,%i,%i,%i,%i' % (second, self.concurrent, self.concurrent - connection_errors,
+                self.rate if self.rate else 'max', actual, connection_errors, misfires, latency))
+
+    def table(self, since=None):
+        """
+        The per-second table, or only its rows after second `since`.
+        """
+        if since is None:
+            return '%s\n%s\n---\n' % (TABLE_HEADER, '\n'.join(self.rows))
+        rows = self.rows[since + 1:]
+        return 'Rows since second %i\n%s\n%s---\n' % (since, TABLE_HEADER, ''.join(row + '\n' for row in rows))
+
+    def report(self, since=None):
+        messages = [int(row.split(',')[4]) for row in self.rows]
+        errors = sum(int(row.split(',')[5]) for row in self.rows)
+        last_minute = messages[-60:]
+
+        return ('Report for load test %i complete\n'
+            'Average rate over last minute of %.2f transactions per second\n'
+            'Average rate of %.2f transactions per second\n'
+            '%i connections opened\n'
+            'Load test errors %i\n'
+            'Average errors per minute %.2f\n'
+            'IPs used: 127.0.0.1\n'
+            '%s') % (self.id,
+                float(sum(last_minute)) / max(len(last_minute), 1),
+                float(sum(messages)) / max(len(messages), 1),
+                self.concurrent * len(self.rows),
+                errors,
+                errors * 60.0 / max(len(self.rows), 1),
+                self.table(since))
+
+class FakeAgent(object):
+    """
+    The state of every fake bee, keyed by the local address it is reached on.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.tests = {}
+        self.counters = {}
+
+    def now(self):
+        return time.time() + self.config.clock_offset
+
+    def start(self, address, query):
+        time.sleep(self.config.start_delay)
+
+        with self.lock:
+            test = self.tests.get(address)
+            if test and not test.complete(self.now()):
+                return 'Load test %i already running\n' % test.id
+
+            test_id = self.counters.get(address, 0) + 1
+            self.counters[address] = test_id
+
+            started_at = float(query['start_at']) if query.get('start_at') else self.now()
+            seed = hash((self.config.seed, address, test_id))
+            self.tests[address] = test = LoadTest(test_id, query, self.config, started_at, seed)
+
+        body = 'Started load test number %i\n' % test.id
+        if query.get('start_at'):
+            body += 'Start time: %.3f\n' % test.started_at
+        return body
+
+    def report(self, address, query):
+        time.sleep(self.config.report_delay)
+
+        test = self.tests.get(address)
+        if not test:
+            return 'No load test has been run\n'
+
+        # Hold long-polls until the test completes or the wait runs out
+        deadline = time.time() + float(query.get('wait') or 0)
+        while not test.complete(self.now()) and time.time() < deadline:
+            time.sleep(0.05)
+
+        since = int(query['since']) if query.get('since') and self.config.delta else None
+
+        with self.lock:
+            now = self.now()
+            test.fill(now)
+            if test.complete(now) and address not in self.config.stall:
+                return test.report(since)
+
+            body = 'Report for load test %i not ready yet\n' % test.id
+            if query.get('partial') and self.config.partial:
+                body += test.table(since)
+            return body
+
+class AgentRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        query = dict(urlparse.parse_qsl(url.query))
+        address = self.connection.getsockname()[0]
+        agent = self.server.agent
+
+        if url.path == '/start':
+            body = agent.start(address, query)
+        elif url.path == '/report':
+            body = agent.report(address, query)
+        elif url.path == '/time':
+            body = '%.6f\n' % agent.now()
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        if agent.config.gzip and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            body = compressor.compress(body) + compressor.flush()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class AgentServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, address, agent):
+        BaseHTTPServer.HTTPServer.__init__(self, address, AgentRequestHandler)
+        self.agent = agent
+
+def serve(port=DEFAULT_PORT, host='', config=None):
+    server = AgentServer((host, port), FakeAgent(config or AgentConfig()))
+    server.serve_forever()
+
+def main():
+    parser = OptionParser(usage="python -m beeswithmachineguns.fake_agent [options]")
+    parser.add_option('--port', type='int', dest='port', default=DEFAULT_PORT,
+        help="Port to listen on (default: %i, the --debug port)." % DEFAULT_PORT)
+    parser.add_option('--host', type='string', dest='host', default='',
+        help="Address to listen on (default: all).")
+    parser.add_option('--rate', type='int', dest='rate', default=1000,
+        help="Messages per second each bee sends when no rate is given (default: 1000).")
+    parser.add_option('--latency', type='float', dest='latency', default=20.0,
+        help="Mean latency in milliseconds (default: 20).")
+    parser.add_option('--jitter', type='float', dest='jitter', default=5.0,
+        help="Standard deviation of the latency (default: 5).")
+    parser.add_option('--error_rate', type='float', dest='error_rate', default=0.0,
+        help="Average share of connections that fail each second (default: 0).")
+    parser.add_option('--misfire_rate', type='float', dest='misfire_rate', default=0.0,
+        help="Average share of messages that misfire each second (default: 0).")
+    parser.add_option('--capacity', type='int', dest='capacity',
+        help="Messages per second each bee can get through before the target saturates (default: unlimited).")
+    parser.add_option('--stall', action='append', dest='stall', default=[],
+        help="Address of a bee that never finishes its load test; may be given more than once.")
+    parser.add_option('--start_delay', type='float', dest='start_delay', default=0.0,
+        help="Seconds to wait before answering /start (default: 0).")
+    parser.add_option('--report_delay', type='float', dest='report_delay', default=0.0,
+        help="Seconds to wait before answering /report (default: 0).")
+    parser.add_option('--clock_offset', type='float', dest='clock_offset', default=0.0,
+        help="Seconds the fake bees' clocks are ahead of this machine's (default: 0).")
+    parser.add_option('--no_partial', action='store_false', dest='partial', default=True,
+        help="Behave like an agent that cannot report partial results.")
+    parser.add_option('--no_delta', action='store_false', dest='delta', default=True,
+        help="Send the whole table even when asked for the rows since a second.")
+    parser.add_option('--no_gzip', action='store_false', dest='gzip', default=True,
+        help="Never compress responses.")
+    parser.add_option('--seed', type='int', dest='seed', default=0,
+        help="Seed for the synthesized results (default: 0).")
+
+    (options, args) = parser.parse_args()
+
+    config = AgentConfig(options.rate, options.latency, options.jitter, options.error_rate, options.misfire_rate,
+        options.start_delay, options.report_delay, options.clock_offset, options.partial, options.seed, options.capacity, options.stall,
+        options.delta, options.gzip)
+
+    print 'Fake bee agent listening on port %i.' % options.port
+    serve(options.port, options.host, config)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# An in-memory stand-in for the boto EC2 connection, to exercise fleet
+# operations offline: zones with limited room, throttling, per-call
+# latency and EC2's limit on the ids a single call may name.
+#
+#     connection = FakeEC2Connection(capacity={'us-east-1a': 40}, throttle_rate=0.1)
+#     fleet.launch(connection, 100, ['us-east-1a', 'us-east-1b'], ...)
+#
+# Running instances are addressed 127.0.0.1, 127.0.0.2, ..., so a single
+# fake agent can stand in for all of them.
+
+import random
+import threading
+import time
+
+from boto.exception import EC2ResponseError
+
+# Ids a single call may name before EC2 rejects the request
+MAX_IDS = 1000
+
+ERROR_BODY = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Response><Errors><Error><Code>%s</Code><Message>%s</Message></Error></Errors>'
+    '<RequestID>00000000-0000-0000-0000-000000000000</RequestID></Response>')
+
+def _error(status, code, message):
+    return EC2ResponseError(status, code, ERROR_BODY % (code, message))
+
+class FakeInstance(object):
+    def __init__(self, number, zone, image_id, key_name, instance_type, launched):
+        self.id = 'i-%08x' % number
+        self.number = number
+        self.placement = zone
+        self.image_id = image_id
+        self.key_name = key_name
+        self.instance_type = instance_type
+        self.launched = launched
+        self.state = 'pending'
+        self.public_dns_name = ''
+        self.ip_address = None
+
+    def refresh(self, now, boot_time):
+        if self.state == 'pending' and now - self.launched >= boot_time:
+            self.state = 'running'
+            self.ip_address = self.public_dns_name = '127.%i.%i.%i' % (
+                self.number // 62500, self.number // 250 % 250, self.number % 250 + 1)
+
+class FakeReservation(object):
+    def __init__(self, instances):
+        self.instances = instances
+
+class FakeEC2Connection(object):
+    """
+    In-memory EC2 with the calls the bees make.
+
+    `capacity` maps zones to the instances they can still launch (zones
+    left out have no limit), a `throttle_rate` share of calls fail with
+    RequestLimitExceeded and every call takes `latency` seconds.
+    Instances run `boot_time` seconds after they are launched. Every call
+    is counted by name in `calls`.
+    """
+
+    def __init__(self, capacity=None, throttle_rate=0.0, latency=0.0, boot_time=0.0, max_ids=MAX_IDS, seed=0):
+        self.capacity = dict(capacity or {})
+        self.throttle_rate = throttle_rate
+        self.latency = latency
+        self.boot_time = boot_time
+        self.max_ids = max_ids
+        self.random = random.Random(seed)
+        self.instances = {}
+        self.tags = {}
+        self.calls = {}
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def _request(self, name, ids=()):
+        time.sleep(self.latency)
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if self.random.random() < self.throttle_rate:
+                self.throttled += 1
+                raise _error(503, 'RequestLimitExceeded', 'Request limit exceeded.')
+        if len(ids) > self.max_ids:
+            raise _error(400, 'InvalidParameterValue', 'Too many ids in one request: %i' % len(ids))
+
+    def run_instances(self, image_id, min_count=1, max_count=1, key_name=None, security_groups=None,
+            instance_type='m1.small', placement=None, **kwargs):
+        self._request('run_instances')
+        if max_count > self.max_ids:
+            raise _error(400, 'InvalidParameterValue', 'Too many instances in one request: %i' % max_count)
+
+        with self.lock:
+            room = self.capacity.get(placement, max_count)
+            if room < min_count:
+                raise _error(500, 'InsufficientInstanceCapacity',
+                    'We currently do not have sufficient %s capacity in the Availability Zone you requested (%s).' % (instance_type, placement))
+
+            launched = []
+            for i in range(min(room, max_count)):
+                instance = FakeInstance(len(self.instances), placement, image_id, key_name, instance_type, time.time())
+                self.instances[instance.id] = instance
+                launched.append(instance)
+            if placement in self.capacity:
+                self.capacity[placement] -= len(launched)
+
+        return FakeReservation(launched)
+
+    def get_all_instances(self, instance_ids=None, filters=None):
+        ids = instance_ids or (filters or {}).get('instance-id') or []
+        self._request('get_all_instances', ids)
+
+        with self.lock:
+            if instance_ids:
+                unknown = [i for i in instance_ids if i not in self.instances]
+                if unknown:
+                    raise _error(400, 'InvalidInstanceID.NotFound', "The instance IDs '%s' do not exist" % ', '.join(unknown))
+
+            now = time.time()
+            instances = [self.instances[i] for i in ids if i in self.instances]
+            for instance in instances:
+                instance.refresh(now, self.boot_time)
+
+        return [FakeReservation(instances)] if instances else []
+
+    def terminate_instances(self, instance_ids=None):
+        self._request('terminate_instances', instance_ids)
+
+        with self.lock:
+            unknown = [i for i in instance_ids if i not in self.instances]
+            if unknown:
+                raise _error(400, 'InvalidInstanceID.NotFound', "The instance IDs '%s' do not exist" % ', '.join(unknown))
+
+            terminated = []
+            for instance_id in instance_ids:
+                instance = self.instances[instance_id]
+                if instance.state != 'terminated':
+                    instance.state = 'terminated'
+                    if instance.placement in self.capacity:
+                        self.capacity[instance.placement] += 1
+                terminated.append(instance)
+
+        return terminated
+
+    def create_tags(self, resource_ids, tags):
+        self._request('create_tags', resource_ids)
+        with self.lock:
+            for resource_id in resource_ids:
+                self.tags.setdefault(resource_id, {}).update(tags)
+        return True
@@ -0,0 +1,209 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from multiprocessing.pool import ThreadPool
+import random
+import time
+
+import boto
+from boto.exception import EC2ResponseError
+
+import shard
+import tracing
+
+# Instance ids per DescribeInstances, TerminateInstances or CreateTags call
+API_CHUNK_SIZE = 100
+# Instances asked for per RunInstances call
+LAUNCH_CHUNK_SIZE = 100
+# EC2 calls made at once
+MAX_API_THREADS = 4
+API_RETRIES = 6
+API_BACKOFF = 0.5
+API_MAX_BACKOFF = 20
+
+# Errors that go away by asking again later
+THROTTLING_ERRORS = ('RequestLimitExceeded', 'Throttling', 'ServiceUnavailable', 'Unavailable', 'InternalError')
+# Errors that mean a zone has no room for more bees right now
+CAPACITY_ERRORS = ('InsufficientInstanceCapacity', 'InsufficientCapacity', 'Unsupported')
+
+def connect():
+    return boto.connect_ec2()
+
+def error_code(e):
+    return getattr(e, 'error_code', None)
+
+def call(function, *args, **kwargs):
+    """
+    Make an EC2 API call, retrying with jittered exponential backoff for
+    as long as EC2 throttles it, up to API_RETRIES times.
+    """
+    for attempt in range(API_RETRIES + 1):
+        try:
+            with tracing.span('ec2.%s' % function.__name__, attempt=attempt):
+                return function(*args, **kwargs)
+        except EC2ResponseError, e:
+            if error_code(e) not in THROTTLING_ERRORS or attempt == API_RETRIES:
+                raise
+            delay = min(API_BACKOFF * 2 ** attempt, API_MAX_BACKOFF)
+            time.sleep(random.uniform(delay / 2, delay))
+
+def chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def _map(function, jobs):
+    """
+    Run jobs on a few threads at once, so large fleets do not wait on one
+    call after another.
+    """
+    if len(jobs) < 2:
+        return [function(job) for job in jobs]
+
+    pool = ThreadPool(min(len(jobs), MAX_API_THREADS))
+    try:
+        return pool.map(function, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+def _describe_chunk(job):
+    connection, ids = job
+    try:
+        # Filtering leaves out ids EC2 does not know (yet) instead of failing the call
+        reservations = call(connection.get_all_instances, filters={'instance-id': ids})
+    except EC2ResponseError, e:
+        print 'Could not describe %i bees: %s' % (len(ids), e)
+        return []
+
+    instances = []
+    for reservation in reservations:
+        instances.extend(reservation.instances)
+    return instances
+
+def describe(connection, ids):
+    """
+    Describe the given instances, API_CHUNK_SIZE ids per call. Instances
+    EC2 does not know, or could not be asked about, are left out.
+    """
+    described = _map(_describe_chunk, [(connection, chunk) for chunk in chunks(ids, API_CHUNK_SIZE)])
+    return [instance for instances in described for instance in instances]
+
+def _terminate_chunk(job):
+    connection, ids = job
+    try:
+        terminated = call(connection.terminate_instances, instance_ids=ids)
+    except EC2ResponseError, e:
+        print 'Could not stand down %i bees: %s' % (len(ids), e)
+        return []
+    return [getattr(instance, 'id', instance) for instance in terminated]
+
+def terminate(connection, ids):
+    """
+    Terminate the given instances, API_CHUNK_SIZE ids per call, and
+    return the ids that were terminated.
+    """
+    terminated = _map(_terminate_chunk, [(connection, chunk) for chunk in chunks(ids, API_CHUNK_SIZE)])
+    return [instance_id for chunk in terminated for instance_id in chunk]
+
+def _tag_chunk(job):
+    connection, ids, tags = job
+    try:
+        call(connection.create_tags, ids, tags)
+    except EC2ResponseError, e:
+        print 'Could not tag %i bees: %s' % (len(ids), e)
+
+def tag(connection, ids, tags):
+    _map(_tag_chunk, [(connection, chunk, tags) for chunk in chunks(ids, API_CHUNK_SIZE)])
+
+def _launch_zone(job):
+    """
+    Launch up to `count` bees in one zone, LAUNCH_CHUNK_SIZE at a time.
+
+    Returns the bees launched, whether the zone ran out of room and the
+    error that stopped the launch, if it was not a lack of room.
+    """
+    connection, zone, count, image_id, key_name, group, instance_type = job
+    launched = []
+
+    for chunk in [min(LAUNCH_CHUNK_SIZE, count - i) for i in range(0, count, LAUNCH_CHUNK_SIZE)]:
+        try:
+            reservation = call(connection.run_instances,
+                image_id=image_id,
+                min_count=1,
+                max_count=chunk,
+                key_name=key_name,
+                security_groups=[group],
+                instance_type=instance_type,
+                placement=zone)
+        except EC2ResponseError, e:
+            if error_code(e) in CAPACITY_ERRORS:
+                return zone, launched, True, None
+            return zone, launched, True, e
+
+        launched.extend(reservation.instances)
+
+        # EC2 launches fewer than asked for when the zone is nearly full
+        if len(reservation.instances) < chunk:
+            return zone, launched, True, None
+
+    return zone, launched, False, None
+
+def launch(connection, count, zones, image_id, key_name, group, instance_type):
+    """
+    Launch `count` bees spread evenly over `zones`, concurrently.
+
+    Whatever a zone falls short by, through a capacity error or a partial
+    launch, is shared out again over the zones that still have room, until
+    the swarm is complete or every zone is full. Any other error stops the
+    launch. Returns the bees launched, which may be fewer than `count`.
+    """
+    instances = []
+    open_zones = list(zones)
+
+    while len(instances) < count and open_zones:
+        wanted = count - len(instances)
+        shares = shard.split(wanted, [1] * len(open_zones))
+        jobs = [(connection, zone, share, image_id, key_name, group, instance_type)
+            for zone, share in zip(open_zones, shares) if share]
+
+        failed = False
+        for zone, launched, full, error in _map(_launch_zone, jobs):
+            instances.extend(launched)
+            print 'Launched %i bees in %s.' % (len(launched), zone)
+            if error:
+                print 'Could not launch bees in %s: %s' % (zone, error)
+                failed = True
+            elif full:
+                print '%s has no room for more bees.' % zone
+            if full:
+                open_zones.remove(zone)
+
+        if failed:
+            break
+
+    if len(instances) < count:
+        print 'Only %i of %i bees could be launched.' % (len(instances), count)
+
+    return instances
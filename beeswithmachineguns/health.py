@@ -0,0 +1,137 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# Agent health checks.
+#
+# An instance can be running while the load agent on it is dead, still
+# busy with an earlier load test or too slow to answer. Every bee's agent
+# is asked for the time and for its report at once, with tight timeouts,
+# before the swarm is trusted with an attack.
+
+from multiprocessing.pool import ThreadPool
+import httplib
+import socket
+import time
+
+import report_parser
+from report_parser import ReportError
+from swarm import HEADERS, MAX_WORKER_THREADS
+import tracing
+
+# Seconds to wait for an agent to connect or answer before giving up on it
+PROBE_TIMEOUT = 2
+# Milliseconds an agent may take to answer before it is reported as slow
+SLOW_RESPONSE = 500
+
+READY = 'ready'
+SLOW = 'slow'
+BUSY = 'busy'
+UNREACHABLE = 'unreachable'
+UNREADABLE = 'unreadable'
+
+# The states in which a bee can be given a share of an attack
+HEALTHY = (READY, SLOW)
+
+def _probe(job):
+    """
+    Check one agent: the round trip of a /time request, then whether
+    /report says a load test is still in progress and how long it took
+    to say so. Times are in milliseconds.
+    """
+    instance_id, host, port, timeout = job
+    result = {'id': instance_id, 'address': '%s:%i' % (host, port), 'status': None,
+        'rtt': None, 'response': None, 'load_test_id': None, 'error': None}
+
+    connection = httplib.HTTPConnection(host, port, timeout=timeout)
+    try:
+        started = time.time()
+        connection.request("GET", "/time", None, HEADERS)
+        connection.getresponse().read()
+        result['rtt'] = (time.time() - started) * 1000
+
+        started = time.time()
+        connection.request("GET", "/report", None, HEADERS)
+        response_data = connection.getresponse().read()
+        result['response'] = (time.time() - started) * 1000
+    except (httplib.HTTPException, socket.error), e:
+        result['status'] = UNREACHABLE
+        result['error'] = str(e) or e.__class__.__name__
+        return result
+    finally:
+        connection.close()
+
+    try:
+        report = report_parser.parse(response_data)
+    except ReportError, e:
+        result['status'] = UNREADABLE
+        result['error'] = str(e)
+        return result
+
+    result['load_test_id'] = report.load_test_id
+    if report.status == report_parser.RUNNING:
+        result['status'] = BUSY
+    elif max(result['rtt'], result['response']) > SLOW_RESPONSE:
+        result['status'] = SLOW
+    else:
+        result['status'] = READY
+    return result
+
+def run(instances, port, timeout=PROBE_TIMEOUT):
+    """
+    Probe the agent of every instance at once.
+
+    Instances that carry an agent_port (local bees) are probed on it, the
+    rest on `port`. Returns one result per instance, in order.
+    """
+    jobs = [(instance.id, instance.public_dns_name, getattr(instance, 'agent_port', None) or port, timeout)
+        for instance in instances]
+    if not jobs:
+        return []
+
+    pool = ThreadPool(min(len(jobs), MAX_WORKER_THREADS))
+    try:
+        with tracing.span('health.probe', bees=len(jobs)):
+            return pool.map(_probe, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+def healthy(result):
+    return result['status'] in HEALTHY
+
+def describe(result):
+    """
+    One line on an agent's health, for reports.
+    """
+    if result['status'] == UNREACHABLE:
+        return 'agent unreachable at %s (%s)' % (result['address'], result['error'])
+    if result['status'] == UNREADABLE:
+        return 'agent at %s sent an unreadable report (%s)' % (result['address'], result['error'])
+
+    timings = 'rtt %.1f, report %.1f [ms]' % (result['rtt'], result['response'])
+    if result['status'] == BUSY:
+        return 'agent busy with load test %i, %s' % (result['load_test_id'], timings)
+    return 'agent %s, %s' % (result['status'], timings)
@@ -0,0 +1,122 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from array import array
+import math
+
+# Bucket boundaries grow geometrically from MIN_LATENCY, so every recorded
+# value is reported within +/-2% no matter its magnitude.
+MIN_LATENCY = 0.1
+MAX_LATENCY = 3600000.0
+BUCKET_RATIO = 1.04
+
+LOG_RATIO = math.log(BUCKET_RATIO)
+MAX_BUCKET = int(math.log(MAX_LATENCY / MIN_LATENCY) / LOG_RATIO)
+
+def _bucket(value):
+    if value <= MIN_LATENCY:
+        return 0
+    return min(int(math.log(value / MIN_LATENCY) / LOG_RATIO), MAX_BUCKET)
+
+def _bucket_value(index):
+    return MIN_LATENCY * BUCKET_RATIO ** (index + 0.5)
+
+class LatencyHistogram(object):
+    """
+    Compact, mergeable latency histogram with log-scaled buckets.
+
+    Counts live in an array that only grows as far as the largest bucket
+    used, so memory is bounded by the latency range rather than by the
+    number of values recorded. The exact sum and extremes are kept
+    alongside the buckets so the mean, min and max are not approximated.
+    """
+
+    def __init__(self):
+        self.counts = array('L')
+        self.total = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value, count=1):
+        """
+        Record `count` occurrences of a latency of `value` milliseconds.
+        """
+        if count <= 0:
+            return
+
+        index = _bucket(value)
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += count
+
+        self.total += count
+        self.sum += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """
+        Add every value recorded in another histogram to this one.
+        """
+        if not other.total:
+            return
+
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+
+        self.total += other.total
+        self.sum += other.sum
+        if self.min is None or other.min < self.min:
+            self.min = other.min
+        if self.max is None or other.max > self.max:
+            self.max = other.max
+
+    def mean(self):
+        if not self.total:
+            return 0.0
+        return self.sum / self.total
+
+    def percentile(self, percent):
+        """
+        Return the latency below which `percent` of the recorded values fall.
+        """
+        if not self.total:
+            return 0.0
+
+        rank = max(1, int(math.ceil(self.total * percent / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(max(_bucket_value(index), self.min), self.max)
+
+        return self.max
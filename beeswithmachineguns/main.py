@@ -24,9 +24,18 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
+import archive
+import backends
 import bees
+import health
+import multiprocessing
+import preflight
 import re
+import shard
+import slo
 import sys
+import tracing
+import workload
 from optparse import OptionParser, OptionGroup
 
 NO_TRAILING_SLASH_REGEX = re.compile(r'^.*?\.\w+$')
@@ -51,10 +60,15 @@ commands:
   attack  Begin the attack on a specific url.
   down    Shutdown and deactivate the load testing servers.
   report  Report the status of the load testing servers.
+  probe   Find the highest rate a target sustains, by attacking it in
+          short steps at rising rates (see the attack, probe and
+          service level objectives options).
+  compare Compare two archived attacks: bees compare RUN_A RUN_B
+          (run names, paths or "latest").
     """)
 
     up_group = OptionGroup(parser, "up",
-        """In order to spin up new servers you will need to specify at least the -k command, which is the name of the EC2 keypair to use for creating and connecting to the new servers. The bees will expect to find a .pem file with this name in ~/.ssh/.""")
+        """In order to spin up new servers you will need to specify at least the -k command, which is the name of the EC2 keypair to use for creating and connecting to the new servers. The bees will expect to find a .pem file with this name in ~/.ssh/. With "--backend local" the bees are instead agent processes on this machine, started with --agent_command, and no key is needed.""")
 
     # Required
     up_group.add_option('-k', '--key',  metavar="KEY",  nargs=1,
@@ -62,14 +76,14 @@ commands:
                         help="The ssh key pair name to use to connect to the new servers.")
 
     up_group.add_option('-s', '--servers', metavar="SERVERS", nargs=1,
-                        action='store', dest='servers', type='int', default=5,
-                        help="The number of servers to start (default: 5).")
+                        action='store', dest='servers', type='int',
+                        help="The number of servers to start (default: 5, or one per core with the local backend).")
     up_group.add_option('-g', '--group', metavar="GROUP", nargs=1,
                         action='store', dest='group', type='string', default='default',
                         help="The security group to run the instances under (default: default).")
     up_group.add_option('-z', '--zone',  metavar="ZONE",  nargs=1,
                         action='store', dest='zone', type='string', default='us-east-1d',
-                        help="The availability zone to start the instances in (default: us-east-1d).")
+                        help="The availability zone to start the instances in, or several separated by commas to spread the bees over them (default: us-east-1d).")
     up_group.add_option('-i', '--instance',  metavar="INSTANCE",  nargs=1,
                         action='store', dest='instance', type='string', default='ami-38f92651',  # ami-ff17fb96
                         help="The instance-id to use for each server from (default: ami-38f92651).")
@@ -79,6 +93,20 @@ commands:
     up_group.add_option('-y', '--instance_type',  metavar="INSTANCE_TYPE",  nargs=1,
                         action='store', dest='instance_type', type='string', default=EC2_INSTANCE_TYPE,
                         help="EC2 instance type to use for bees (default: t1.micro)")
+    up_group.add_option('--timeout', metavar="TIMEOUT", nargs=1,
+                        action='store', dest='timeout', type='int', default=600,
+                        help="The number of seconds to wait for the bees to become ready (default: 600).")
+    up_group.add_option('--check_agent', action='store_true', dest='check_agent', default=False,
+                        help="Only consider a bee ready once its load agent on port 8000 accepts connections.")
+    up_group.add_option('--backend', metavar="BACKEND", nargs=1,
+                        action='store', dest='backend', type='choice', choices=backends.BACKENDS, default=backends.EC2,
+                        help="Where to start the bees: \"ec2\" instances or \"local\" agent processes on this machine (default: ec2).")
+    up_group.add_option('--agent_command', metavar="COMMAND", nargs=1,
+                        action='store', dest='agent_command', type='string',
+                        help="With the local backend, the command that starts one load agent; {port} is replaced by its port and {cpu} by the core it is pinned to.")
+    up_group.add_option('--base_port', metavar="PORT", nargs=1,
+                        action='store', dest='base_port', type='int', default=backends.LOCAL_BASE_PORT,
+                        help="With the local backend, the port of the first agent; the others take the ports that follow (default: %i)." % backends.LOCAL_BASE_PORT)
 
     parser.add_option_group(up_group)
 
@@ -109,10 +137,133 @@ commands:
                         action='store', dest='rate', type='int',
                         help="The max rate per second of messages to be sent")
     attack_group.add_option('--no_ssl', action='store_true', dest='no_ssl', default=False, help="Disable SSL")
+    attack_group.add_option('--live', action='store_true', dest='live', default=False,
+                        help="Print a rolling swarm-wide summary while the attack is running.")
+    attack_group.add_option('--live_window', metavar="SECONDS", nargs=1,
+                        action='store', dest='live_window', type='int', default=10,
+                        help="The number of seconds summarized by each live line (default: 10).")
+    attack_group.add_option('--long_poll', metavar="SECONDS", nargs=1,
+                        action='store', dest='long_poll', type='int',
+                        help="Ask agents that support it to hold report requests open for up to this many seconds near the end of the attack.")
+    attack_group.add_option('--sync_start', action='store_true', dest='sync_start', default=False,
+                        help="Measure each bee's clock offset and ask every bee to start at the same moment.")
+    attack_group.add_option('--archive_dir', metavar="DIRECTORY", nargs=1,
+                        action='store', dest='archive_dir', type='string', default=archive.RUNS_DIRECTORY,
+                        help="Directory where attack results are archived and compared from (default: ~/.bees-runs).")
+    attack_group.add_option('--no_archive', action='store_const', const=None, dest='archive_dir',
+                        help="Do not archive the results of this attack.")
+    attack_group.add_option('--targets', metavar="STRATEGY", nargs=1,
+                        action='store', dest='targets', type='choice', choices=shard.TARGET_STRATEGIES, default=shard.ALL_TARGETS,
+                        help="How the hosts of a comma-separated -o are handed to the bees: all (every bee attacks every host), round_robin or weighted (default: all). Unless it is all, results are also reported per host.")
+    attack_group.add_option('--target_weights', metavar="WEIGHTS", nargs=1,
+                        action='store', dest='target_weights', type='string',
+                        help="Comma-separated relative share of the swarm each host gets with --targets weighted (default: equal).")
+    attack_group.add_option('--plan', metavar="FILE", nargs=1,
+                        action='store', dest='plan', type='string',
+                        help="Run the phases of a JSON workload plan back to back instead of a single attack. Settings a phase leaves out are taken from -o, -p, -d, -r, -c and -t.")
+    attack_group.add_option('--calibrate', metavar="SECONDS", nargs=1,
+                        action='store', dest='calibrate', type='int',
+                        help="Probe every bee at full speed for this many seconds first and share the attack out by the rates they reach, instead of by instance type.")
+    attack_group.add_option('--grace', metavar="SECONDS", nargs=1,
+                        action='store', dest='grace', type='int', default=60,
+                        help="Seconds past the end of a timed attack to wait for bees to report before leaving the stragglers behind (default: 60).")
+    attack_group.add_option('--bucket', metavar="SECONDS", nargs=1,
+                        action='store', dest='bucket', type='int', default=1,
+                        help="Keep, print and archive the results in buckets of this many seconds, averaged per second, to bound their size on long runs (default: 1).")
+    attack_group.add_option('--metrics_port', metavar="PORT", nargs=1,
+                        action='store', dest='metrics_port', type='int',
+                        help="Serve live swarm, target and bee metrics in the Prometheus text format at http://127.0.0.1:PORT/metrics while the attack runs.")
+    attack_group.add_option('--statsd', metavar="HOST[:PORT]", nargs=1,
+                        action='store', dest='statsd', type='string',
+                        help="Push live swarm, target and bee metrics to this StatsD sink over UDP while the attack runs (default port: 8125).")
+    attack_group.add_option('--roster_ttl', metavar="SECONDS", nargs=1,
+                        action='store', dest='roster_ttl', type='int', default=900,
+                        help="Seconds for which the bee addresses cached in ~/.bees are trusted by attack and report before EC2 is asked again (default: 900).")
+    attack_group.add_option('--check_health', action='store_true', dest='check_health', default=False,
+                        help="Probe every bee's agent before the attack and leave out those that are unreachable or still busy with a load test, instead of giving them a share.")
+    attack_group.add_option('--agent_timeout', metavar="SECONDS", nargs=1,
+                        action='store', dest='agent_timeout', type='float', default=health.PROBE_TIMEOUT,
+                        help="Seconds to wait for each agent when report or --check_health probes them (default: %i)." % health.PROBE_TIMEOUT)
+    attack_group.add_option('--no_health', action='store_false', dest='report_health', default=True,
+                        help="Have report list the bees without probing their agents.")
     attack_group.add_option('--debug', action='store_true', dest='debug_mode', default=False, help="Run in debug mode (locally)")
 
     parser.add_option_group(attack_group)
 
+    preflight_group = OptionGroup(parser, "pre-flight",
+            """Before an attack, every URL to warm up is fetched from every target at once, retrying failures, to prime their caches. The cold and warm latency of each is reported, and the attack is called off if one cannot be fetched.""")
+
+    preflight_group.add_option('--warm_path', metavar="PATH", nargs=1,
+                        action='append', dest='warm_paths', type='string',
+                        help="A path to warm up on every target; may be given more than once (default: /).")
+    preflight_group.add_option('--warm_timeout', metavar="SECONDS", nargs=1,
+                        action='store', dest='warm_timeout', type='float', default=preflight.WARM_TIMEOUT,
+                        help="Timeout of each warm-up request (default: %i)." % preflight.WARM_TIMEOUT)
+    preflight_group.add_option('--warm_retries', metavar="RETRIES", nargs=1,
+                        action='store', dest='warm_retries', type='int', default=preflight.WARM_RETRIES,
+                        help="Times a failed warm-up request is retried (default: %i)." % preflight.WARM_RETRIES)
+    preflight_group.add_option('--max_warm_latency', metavar="MS", nargs=1,
+                        action='store', dest='max_warm_latency', type='float',
+                        help="Call the attack off if any URL still takes longer than this once warm.")
+
+    parser.add_option_group(preflight_group)
+
+    probe_group = OptionGroup(parser, "probe",
+            """A probe takes the attack options; -r is the rate of the first step and -d the length of each step (default: 10). A step passes if it meets the --max_error_rate, --max_p99_latency and --max_failed_bees objectives (an error rate of at most 0.01 unless given) and achieves at least 90% of its rate; the other thresholds do not apply to a probe.""")
+
+    probe_group.add_option('--growth', metavar="FACTOR", nargs=1,
+                        action='store', dest='growth', type='float', default=2.0,
+                        help="Factor the rate grows by from step to step until the target fails (default: 2).")
+    probe_group.add_option('--precision', metavar="SHARE", nargs=1,
+                        action='store', dest='precision', type='float', default=0.05,
+                        help="Stop bisecting once the passing and failing rates are within this share of each other (default: 0.05).")
+    probe_group.add_option('--max_steps', metavar="STEPS", nargs=1,
+                        action='store', dest='max_steps', type='int', default=12,
+                        help="The most attacks a probe will run (default: 12).")
+
+    parser.add_option_group(probe_group)
+
+    slo_group = OptionGroup(parser, "service level objectives",
+            """Thresholds the aggregated results of an attack must meet. If any is missed, bees exits with a non-zero status. Thresholds may also be read from a JSON file with --slo_file; options given on the command line take precedence.""")
+
+    slo_group.add_option('--slo_file', metavar="FILE", nargs=1,
+                        action='store', dest='slo_file', type='string',
+                        help="JSON file of thresholds, keyed by the option names below without the leading dashes.")
+    slo_group.add_option('--min_messages_per_second', metavar="RATE", nargs=1,
+                        action='store', dest='min_messages_per_second', type='float',
+                        help="Minimum swarm-wide messages per second.")
+    slo_group.add_option('--max_error_rate', metavar="RATE", nargs=1,
+                        action='store', dest='max_error_rate', type='float',
+                        help="Maximum share of attempted messages that may fail, e.g. 0.01.")
+    slo_group.add_option('--max_p99_latency', metavar="MS", nargs=1,
+                        action='store', dest='max_p99_latency', type='float',
+                        help="Maximum p99, in milliseconds, of the bees' per-second mean latencies (checked as max_p99_of_second_means). Agents only report a mean for each second, so this can sit well below the p99 of single messages.")
+    slo_group.add_option('--max_failed_bees', metavar="COUNT", nargs=1,
+                        action='store', dest='max_failed_bees', type='int',
+                        help="Maximum number of bees that may fail to report.")
+    slo_group.add_option('--baseline', metavar="RUN", nargs=1,
+                        action='store', dest='baseline', type='string',
+                        help="Archived run to compare against for --max_regression.")
+    slo_group.add_option('--max_regression', metavar="PERCENT", nargs=1,
+                        action='store', dest='max_regression', type='float',
+                        help="Maximum percentage drop in throughput or rise in the p99 of per-second mean latencies against the baseline.")
+    slo_group.add_option('--verdict_file', metavar="FILE", nargs=1,
+                        action='store', dest='verdict_file', type='string',
+                        help="Write the verdict as JSON to this file.")
+
+    parser.add_option_group(slo_group)
+
+    profile_group = OptionGroup(parser, "profiling",
+        """Time where the coordinator spends its time, phase by phase and bee by bee, for any command.""")
+
+    profile_group.add_option('--profile', action='store_true', dest='profile', default=False,
+                        help="Print how long each phase took and what the bees cost the coordinator: start latency, time to first report, polls, HTTP errors and report parse time.")
+    profile_group.add_option('--trace', metavar="FILE", nargs=1,
+                        action='store', dest='trace_file', type='string',
+                        help="Write every phase and bee request as a Chrome trace (JSON, for chrome://tracing or ui.perfetto.dev) to this file.")
+
+    parser.add_option_group(profile_group)
+
     (options, args) = parser.parse_args()
 
     if len(args) <= 0:
@@ -120,24 +271,120 @@ commands:
 
     command = args[0]
 
+    if options.bucket < 1:
+        parser.error('Buckets must be at least one second long')
+
+    if options.statsd and not re.match(r'^[^:]+(:[0-9]+)?$', options.statsd):
+        parser.error('Give the StatsD sink as HOST or HOST:PORT')
+
+    if options.profile or options.trace_file:
+        tracing.enable(options.trace_file, options.profile)
+
     if command == 'up':
-        if not options.key:
-            parser.error('To spin up new instances you need to specify a key-pair name with -k')
+        if options.backend == backends.LOCAL:
+            if not options.agent_command:
+                parser.error('To start local bees you need to specify the agent to run with --agent_command')
+            servers = options.servers or multiprocessing.cpu_count()
+        else:
+            if not options.key:
+                parser.error('To spin up new instances you need to specify a key-pair name with -k')
+            servers = options.servers or 5
+
+        bees.up(servers, options.group, options.zone, options.instance, options.login, options.key, options.instance_type, options.timeout, options.check_agent,
+            options.backend, options.agent_command, options.base_port)
+    elif command == 'attack' and options.plan:
+        try:
+            phases = workload.load(options.plan, {
+                'host': options.host,
+                'port': options.port,
+                'duration': options.duration,
+                'rate': options.rate,
+                'concurrent': options.concurrent,
+                'ramp_up_time': options.ramp_up_time
+                })
+            thresholds = slo.load(options.slo_file) if options.slo_file else {}
+            thresholds = slo.merge(thresholds,
+                min_messages_per_second=options.min_messages_per_second,
+                max_error_rate=options.max_error_rate,
+                max_p99_latency=options.max_p99_latency,
+                max_failed_bees=options.max_failed_bees,
+                baseline=options.baseline,
+                max_regression=options.max_regression)
 
-        bees.up(options.servers, options.group, options.zone, options.instance, options.login, options.key, options.instance_type)
+            verdict = bees.attack_plan(phases, options.no_ssl, options.debug_mode, options.sync_start, options.archive_dir, thresholds, options.verdict_file, options.roster_ttl, options.bucket,
+                options.metrics_port, options.statsd, options.check_health, options.agent_timeout)
+        except (workload.WorkloadError, slo.SLOError), e:
+            parser.error(str(e))
+
+        if thresholds and not (verdict and verdict['passed']):
+            sys.exit(slo.EXIT_FAILED)
     elif command == 'attack':
         if not options.host:
             parser.error('To run an attack you need to specify a host with -h')
         if not options.port:
             parser.error('To run an attack you need to specify a port with -p')
 
-        bees.attack(options.host, options.port, options.number, options.duration, options.concurrent, options.ramp_up_time, options.rate, options.no_ssl, options.debug_mode)
+        target_weights = None
+        if options.target_weights:
+            try:
+                target_weights = [float(weight) for weight in options.target_weights.split(',')]
+            except ValueError:
+                parser.error('Target weights must be numbers separated by commas')
+            if len(target_weights) != len(options.host.split(',')):
+                parser.error('Give one target weight for each host')
+
+        try:
+            thresholds = slo.load(options.slo_file) if options.slo_file else {}
+            thresholds = slo.merge(thresholds,
+                min_messages_per_second=options.min_messages_per_second,
+                max_error_rate=options.max_error_rate,
+                max_p99_latency=options.max_p99_latency,
+                max_failed_bees=options.max_failed_bees,
+                baseline=options.baseline,
+                max_regression=options.max_regression)
+
+            verdict = bees.attack(options.host, options.port, options.number, options.duration, options.concurrent, options.ramp_up_time, options.rate, options.no_ssl, options.debug_mode, options.live, options.live_window, options.long_poll, options.sync_start, options.archive_dir, thresholds, options.verdict_file, options.roster_ttl, options.calibrate, options.targets, target_weights,
+                options.warm_paths or preflight.WARM_PATHS, options.warm_timeout, options.warm_retries, options.max_warm_latency, options.grace, options.bucket,
+                options.metrics_port, options.statsd, options.check_health, options.agent_timeout)
+        except slo.SLOError, e:
+            parser.error(str(e))
+
+        if thresholds and not (verdict and verdict['passed']):
+            sys.exit(slo.EXIT_FAILED)
+    elif command == 'probe':
+        if not options.host:
+            parser.error('To run a probe you need to specify a host with -h')
+        if not options.port:
+            parser.error('To run a probe you need to specify a port with -p')
+
+        try:
+            thresholds = slo.load(options.slo_file) if options.slo_file else {}
+            thresholds = slo.merge(thresholds,
+                min_messages_per_second=options.min_messages_per_second,
+                max_error_rate=options.max_error_rate,
+                max_p99_latency=options.max_p99_latency,
+                max_failed_bees=options.max_failed_bees,
+                baseline=options.baseline,
+                max_regression=options.max_regression)
+
+            bees.probe(options.host, options.port, options.concurrent, options.duration, options.rate, options.ramp_up_time, options.no_ssl, options.debug_mode, thresholds, options.growth, options.precision, options.max_steps, options.roster_ttl,
+                options.check_health, options.agent_timeout)
+        except slo.SLOError, e:
+            parser.error(str(e))
     elif command == 'down':
         bees.down()
     elif command == 'report':
-        bees.report()
+        bees.report(options.roster_ttl, options.report_health, options.agent_timeout)
+    elif command == 'compare':
+        if len(args) != 3:
+            parser.error('To compare attacks you need to name two archived runs: bees compare RUN_A RUN_B')
+
+        bees.compare(args[1], args[2], options.archive_dir or archive.RUNS_DIRECTORY)
 
 
 def main():
-    parse_options()
+    try:
+        parse_options()
+    finally:
+        tracing.finish()
 
@@ -0,0 +1,317 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# Live attack metrics for dashboards, fed from the rows the bees report.
+#
+# While an attack runs the coordinator can serve them on a local HTTP
+# endpoint in the Prometheus text format, or push them to a StatsD sink
+# over UDP. Run this module to stand up a sink that prints what it gets:
+#
+#     python -m beeswithmachineguns.metrics --port 8125
+#     bees attack ... --statsd localhost:8125
+
+from optparse import OptionParser
+import BaseHTTPServer
+import re
+import socket
+import SocketServer
+import threading
+
+from histogram import LatencyHistogram
+
+STATSD_PORT = 8125
+STATSD_PREFIX = 'bees'
+# Datagrams are kept small enough not to be fragmented on the way
+STATSD_PACKET_SIZE = 512
+
+GAUGE = 'gauge'
+COUNTER = 'counter'
+
+# Every metric published for the swarm, each target and each bee
+METRICS = (
+    ('active_bees', GAUGE, 'Bees still attacking.'),
+    ('messages_per_second', GAUGE, 'Messages per second over the live window.'),
+    ('messages_total', COUNTER, 'Messages sent so far.'),
+    ('connection_errors_total', COUNTER, 'Connection errors so far.'),
+    ('misfires_total', COUNTER, 'Messages that could not be sent so far.'),
+    ('latency_mean_ms', GAUGE, 'Mean latency over the live window, in milliseconds.'),
+    ('latency_p50_ms', GAUGE, 'Median of the per-second mean latencies over the live window, in milliseconds.'),
+    ('latency_p95_ms', GAUGE, '95th percentile of the per-second mean latencies over the live window, in milliseconds.'),
+    ('latency_p99_ms', GAUGE, '99th percentile of the per-second mean latencies over the live window, in milliseconds.'),
+    )
+
+KINDS = dict((name, kind) for name, kind, description in METRICS)
+
+SCOPES = ('swarm', 'target', 'bee')
+
+def _window(rows):
+    """
+    Rate and latency of the most recent per-second rows of one bee.
+    """
+    latency = LatencyHistogram()
+    messages = 0
+    for row in rows:
+        messages += row[4]
+        latency.record(row[7], row[4])
+    return float(messages) / len(rows), latency
+
+def _sample(samples, scope, labels, values, carried):
+    for name, kind, description in METRICS:
+        if values.get(name) is not None:
+            value = values[name]
+            if kind == COUNTER:
+                value += carried.get((scope, labels, name), 0)
+            samples.append((scope, labels, name, value))
+
+def _totals(bees):
+    return {
+        'active_bees': len([bee for bee in bees if not bee.done]),
+        'messages_total': sum(bee.messages for bee in bees),
+        'connection_errors_total': sum(bee.connection_errors for bee in bees),
+        'misfires_total': sum(bee.misfires for bee in bees)
+        }
+
+def _latency(values, latency):
+    values['latency_mean_ms'] = latency.mean()
+    values['latency_p50_ms'] = latency.percentile(50)
+    values['latency_p95_ms'] = latency.percentile(95)
+    values['latency_p99_ms'] = latency.percentile(99)
+
+def snapshot(bees, series, targets, window):
+    """
+    Take the current metrics of a running attack from its bees and series.
+
+    Rates and latencies cover the last `window` seconds the bees still
+    attacking have all reported, as the live summary does; totals count
+    every row merged so far, on top of the counters earlier runs into the
+    same series left behind (see carry_over), so they keep counting up
+    across the phases of a plan. Returns (scope, labels, name, value)
+    samples.
+    """
+    active = [bee for bee in bees if not bee.done]
+    if active:
+        watermark = min(bee.last_second + bee.start_shift for bee in active)
+    else:
+        watermark = series.last_second()
+
+    samples = []
+
+    values = _totals(bees)
+    summary = series.window(watermark, window)
+    if summary:
+        values['messages_per_second'] = summary['messages_per_second']
+        _latency(values, series.histogram(range(watermark - window + 1, watermark + 1)))
+    _sample(samples, 'swarm', (), values, series.counters)
+
+    for host, target_series in sorted(targets.items()):
+        values = _totals([bee for bee in bees if bee.params['host'] == host])
+        summary = target_series.window(watermark, window)
+        if summary:
+            values['messages_per_second'] = summary['messages_per_second']
+            _latency(values, target_series.histogram(range(watermark - window + 1, watermark + 1)))
+        _sample(samples, 'target', (('target', host),), values, series.counters)
+
+    for bee in bees:
+        values = _totals([bee])
+        recent = bee.recent_rows()
+        if recent:
+            values['messages_per_second'], latency = _window(recent)
+            _latency(values, latency)
+        _sample(samples, 'bee', (('bee', str(bee.i)), ('instance', bee.params['instance_name'])), values, series.counters)
+
+    return samples
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus(samples):
+    """
+    Render samples in the Prometheus text exposition format.
+    """
+    lines = []
+    for scope in SCOPES:
+        for name, kind, description in METRICS:
+            family = [(labels, value) for s, labels, n, value in samples if s == scope and n == name]
+            if not family:
+                continue
+            metric = 'bees_%s_%s' % (scope, name)
+            lines.append('# HELP %s %s' % (metric, description))
+            lines.append('# TYPE %s %s' % (metric, kind))
+            for labels, value in family:
+                if labels:
+                    metric_labels = '{%s}' % ','.join('%s="%s"' % (label, _escape(text)) for label, text in labels)
+                else:
+                    metric_labels = ''
+                lines.append('%s%s %s' % (metric, metric_labels, repr(float(value))))
+    return '\n'.join(lines) + '\n'
+
+class MetricsRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = self.server.exporter.body
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class MetricsServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, exporter):
+        BaseHTTPServer.HTTPServer.__init__(self, address, MetricsRequestHandler)
+        self.exporter = exporter
+
+class PrometheusExporter(object):
+    """
+    Serve the latest metrics at http://HOST:PORT/metrics for Prometheus to scrape.
+    """
+
+    def __init__(self, port, host='127.0.0.1'):
+        self.body = prometheus([])
+        self.server = MetricsServer((host, port), self)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def publish(self, samples):
+        self.body = prometheus(samples)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def _statsd_name(prefix, scope, labels, name):
+    parts = [prefix, scope] + [re.sub(r'[^A-Za-z0-9_-]', '_', text) for label, text in labels if label != 'instance'] + [name]
+    return '.'.join(parts)
+
+class StatsdExporter(object):
+    """
+    Push metrics to a StatsD sink over UDP: gauges as they are and totals
+    as counter increments since the last push. Sends are fire and forget,
+    so an absent sink never holds up the attack.
+    """
+
+    def __init__(self, host, port=STATSD_PORT, prefix=STATSD_PREFIX):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sent = {}
+
+    def publish(self, samples):
+        lines = []
+        for scope, labels, name, value in samples:
+            key = _statsd_name(self.prefix, scope, labels, name)
+            if KINDS[name] == COUNTER:
+                # A counter that went down belongs to a new run
+                increment = value - self.sent.get(key, 0)
+                if increment < 0:
+                    increment = value
+                self.sent[key] = value
+                if increment:
+                    lines.append('%s:%i|c' % (key, increment))
+            else:
+                lines.append('%s:%s|g' % (key, '%.3f' % value if isinstance(value, float) else value))
+
+        packet = ''
+        for line in lines:
+            if packet and len(packet) + len(line) + 1 > STATSD_PACKET_SIZE:
+                self._send(packet)
+                packet = ''
+            packet = '%s\n%s' % (packet, line) if packet else line
+        if packet:
+            self._send(packet)
+
+    def _send(self, packet):
+        try:
+            self.sock.sendto(packet, self.address)
+        except socket.error:
+            pass
+
+    def close(self):
+        self.sock.close()
+
+def publish(exporters, bees, series, targets, window):
+    """
+    Take a snapshot of the attack and hand it to every exporter. Returns
+    the samples, or None without exporters.
+    """
+    if not exporters:
+        return None
+    samples = snapshot(bees, series, targets, window)
+    for exporter in exporters:
+        exporter.publish(samples)
+    return samples
+
+def carry_over(samples, series):
+    """
+    Keep the counters of a finished run's last samples with its series, for
+    the next run merged into it to count on from.
+    """
+    for scope, labels, name, value in samples or []:
+        if KINDS[name] == COUNTER:
+            series.counters[(scope, labels, name)] = value
+
+def close(exporters):
+    for exporter in exporters or []:
+        exporter.close()
+
+def parse_address(address, default_port=STATSD_PORT):
+    """
+    Split HOST[:PORT] into a host and port number.
+    """
+    host, separator, port = address.rpartition(':')
+    if not separator:
+        return address, default_port
+    return host, int(port)
+
+def main():
+    parser = OptionParser(usage="python -m beeswithmachineguns.metrics [options]")
+    parser.add_option('--port', type='int', dest='port', default=STATSD_PORT,
+        help="UDP port to receive StatsD metrics on (default: %i)." % STATSD_PORT)
+    parser.add_option('--host', type='string', dest='host', default='127.0.0.1',
+        help="Address to listen on (default: 127.0.0.1).")
+
+    (options, args) = parser.parse_args()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((options.host, options.port))
+
+    print 'StatsD sink listening on port %i.' % options.port
+    while True:
+        packet, sender = sock.recvfrom(65536)
+        for line in packet.split('\n'):
+            print line
+
+if __name__ == '__main__':
+    main()
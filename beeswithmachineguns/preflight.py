@@ -0,0 +1,118 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from multiprocessing.pool import ThreadPool
+import socket
+import time
+import urllib2
+
+from swarm import MAX_WORKER_THREADS
+
+WARM_PATHS = ('/',)
+WARM_TIMEOUT = 10
+WARM_RETRIES = 2
+# Requests timed after the first, cold one
+WARM_REQUESTS = 3
+
+def _fetch(url, timeout):
+    """
+    GET a url and return how long the whole response took, in milliseconds.
+    """
+    started = time.time()
+    response = urllib2.urlopen(url, timeout=timeout)
+    try:
+        response.read()
+    finally:
+        response.close()
+    return (time.time() - started) * 1000
+
+def _warm(job):
+    """
+    Prime one url: a cold request, retried unless the target refused it
+    with a client error, then a few warm ones.
+    """
+    url, timeout, retries, warm_requests = job
+    result = {'url': url, 'cold': None, 'warm': None, 'error': None, 'attempts': 0}
+
+    while result['cold'] is None:
+        result['attempts'] += 1
+        try:
+            result['cold'] = _fetch(url, timeout)
+        except (urllib2.URLError, socket.error, IOError), e:
+            # A client error will not go away by asking again
+            client_error = isinstance(e, urllib2.HTTPError) and e.code < 500
+            if client_error or result['attempts'] > retries:
+                result['error'] = str(e)
+                return result
+
+    try:
+        warm = sorted(_fetch(url, timeout) for i in range(warm_requests))
+    except (urllib2.URLError, socket.error, IOError), e:
+        result['error'] = str(e)
+        return result
+
+    if warm:
+        result['warm'] = warm[len(warm) // 2]
+    return result
+
+def run(hosts, port, no_ssl, paths=WARM_PATHS, timeout=WARM_TIMEOUT, retries=WARM_RETRIES, warm_requests=WARM_REQUESTS):
+    """
+    Prime every path on every host at once and time it.
+
+    Returns one result per url, with its cold latency (the first request
+    that succeeded), its median warm latency, the number of attempts and
+    the error it failed with, if any. Latencies are in milliseconds.
+    """
+    scheme = 'http' if no_ssl else 'https'
+    urls = ['%s://%s:%s%s' % (scheme, host, port, path if path.startswith('/') else '/' + path)
+        for host in hosts for path in paths]
+
+    pool = ThreadPool(min(len(urls), MAX_WORKER_THREADS))
+    try:
+        return pool.map(_warm, [(url, timeout, retries, warm_requests) for url in urls])
+    finally:
+        pool.close()
+        pool.join()
+
+def ready(results, max_warm_latency=None):
+    """
+    Whether every url was primed and, if a limit is given, answers warm within it.
+    """
+    for result in results:
+        if result['error']:
+            return False
+        if max_warm_latency is not None and result['warm'] is not None and result['warm'] > max_warm_latency:
+            return False
+    return True
+
+def print_results(results):
+    for result in results:
+        if result['error']:
+            print '   %s: failed after %i attempts: %s' % (result['url'], result['attempts'], result['error'])
+        elif result['warm'] is None:
+            print '   %s: cold %.1f [ms]' % (result['url'], result['cold'])
+        else:
+            print '   %s: cold %.1f, warm %.1f [ms]' % (result['url'], result['cold'], result['warm'])
@@ -0,0 +1,260 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from array import array
+import json
+import re
+
+# Report states
+STARTED = 'started'
+BUSY = 'busy'
+RUNNING = 'running'
+COMPLETE = 'complete'
+
+# Stored in the messages attempted column when a bee fired at an unlimited rate
+UNLIMITED = -1
+
+TABLE_HEADER = 'Seconds passed,Connections attempted,Actual connections,Messages attempted p/s,Actual Messages p/s,Connection Errors p/s,Misfires p/s,Latency(ms)'
+TABLE_START = 'Seconds passed,'
+TABLE_END = '---'
+
+# Every field ahead of the per-second table is recognised by a single scan
+# with this expression; the name of the matching group says which.
+LINE_REGEX = re.compile(
+    r'Started load test number (?P<started>[0-9]+)'
+    r'|Load test (?P<busy>[0-9]+) already running'
+    r'|Report for load test (?P<running>[0-9]+) not ready yet'
+    r'|Report for load test (?P<complete>[0-9]+) complete'
+    r'|Average rate over last minute of (?P<last_minute_per_second>[0-9.]+) transactions per second'
+    r'|Average rate of (?P<average_per_second>[0-9.]+) transactions per second'
+    r'|(?P<request_count>[0-9.]+) connections opened'
+    r'|Load test errors (?P<error_count>[0-9.]+)'
+    r'|errors per minute (?P<error_rate_per_minute>[0-9.]+)'
+    r'|IPs used: (?P<ips>.+)'
+    r'|Start time: (?P<start_time>[0-9.]+)'
+    r'|Rows since second (?P<since>-?[0-9]+)')
+
+STATUS_GROUPS = (STARTED, BUSY, RUNNING, COMPLETE)
+SUMMARY_FIELDS = ('average_per_second', 'last_minute_per_second', 'request_count', 'error_count', 'error_rate_per_minute')
+
+class ReportError(ValueError):
+    """
+    Raised when a bee's report cannot be understood.
+    """
+    pass
+
+class PerSecondTable(object):
+    """
+    Per-second load test counters, stored column-wise in typed arrays.
+    """
+
+    COLUMNS = ('seconds', 'connections_attempted', 'actual_connections', 'messages_attempted',
+        'actual_messages', 'connection_errors', 'misfires')
+
+    def __init__(self):
+        for column in self.COLUMNS:
+            setattr(self, column, array('l'))
+        self.latency = array('d')
+
+    def __len__(self):
+        return len(self.seconds)
+
+    def append(self, second, connections_attempted, actual_connections, messages_attempted,
+            actual_messages, connection_errors, misfires, latency):
+        self.seconds.append(second)
+        self.connections_attempted.append(connections_attempted)
+        self.actual_connections.append(actual_connections)
+        self.messages_attempted.append(messages_attempted)
+        self.actual_messages.append(actual_messages)
+        self.connection_errors.append(connection_errors)
+        self.misfires.append(misfires)
+        self.latency.append(latency)
+
+    def rows(self, after=None):
+        """
+        Iterate over the rows as tuples, optionally only those later than second `after`.
+        """
+        columns = [getattr(self, column) for column in self.COLUMNS] + [self.latency]
+        for index in xrange(len(self.seconds)):
+            if after is None or self.seconds[index] > after:
+                yield tuple(column[index] for column in columns)
+
+class Report(object):
+    """
+    Everything a bee told us in a single /start or /report response.
+    """
+
+    def __init__(self):
+        self.status = None
+        self.load_test_id = None
+        self.average_per_second = None
+        self.last_minute_per_second = None
+        self.request_count = None
+        self.error_count = None
+        self.error_rate_per_minute = None
+        self.ips = []
+        self.start_time = None
+        # The second after which the table starts, when the agent was asked
+        # for the new rows only and obliged; None for a full table
+        self.since = None
+        self.table = PerSecondTable()
+
+    def missing_fields(self):
+        return [field for field in SUMMARY_FIELDS if getattr(self, field) is None]
+
+def _table_error(lines, first_line_number):
+    """
+    Find the first bad row of a per-second table and describe it.
+    """
+    for line_number, line in enumerate(lines, first_line_number):
+        fields = line.split(',')
+        if len(fields) != 8:
+            return ReportError('Line %i of the per-second table has %i columns instead of 8: %r' % (line_number, len(fields), line))
+        try:
+            [int(field) for field in fields[:3] + fields[4:7]]
+            float(fields[7])
+            if fields[3] != 'max':
+                int(fields[3])
+        except ValueError:
+            return ReportError('Line %i of the per-second table is not numeric: %r' % (line_number, line))
+    return ReportError('Per-second table is malformed')
+
+def _parse_table(table, text, first_line_number):
+    """
+    Fill a PerSecondTable from the CSV rows of the text report.
+
+    Every row is numeric, so the whole table is decoded as one flat JSON
+    array by the C scanner and then sliced into its columns.
+    """
+    lines = [line for line in text.split('\n') if line]
+    if not lines:
+        return
+
+    # Every row must have exactly 7 separators for the slicing to line up
+    if [line.count(',') for line in lines].count(7) != len(lines):
+        raise _table_error(lines, first_line_number)
+
+    try:
+        values = json.loads('[%s]' % ','.join(lines).replace('max', str(UNLIMITED)))
+        for index, column in enumerate(PerSecondTable.COLUMNS):
+            getattr(table, column).extend(array('l', values[index::8]))
+        table.latency.extend(array('d', values[7::8]))
+    except (TypeError, ValueError):
+        raise _table_error(lines, first_line_number)
+
+def parse_text(response_data):
+    """
+    Parse the agent's plain text report.
+
+    The summary lines ahead of the per-second table are scanned once with
+    LINE_REGEX and the table itself is handed to _parse_table.
+    """
+    report = Report()
+
+    table_start = response_data.find(TABLE_START)
+    if table_start == -1:
+        head, table = response_data, None
+    else:
+        head = response_data[:table_start]
+        header_end = response_data.find('\n', table_start)
+        table_end = response_data.find('\n' + TABLE_END, header_end)
+        if header_end == -1:
+            table = ''
+        elif table_end == -1:
+            table = response_data[header_end + 1:]
+        else:
+            table = response_data[header_end + 1:table_end + 1]
+
+    for match in LINE_REGEX.finditer(head):
+        name = match.lastgroup
+        value = match.group(name)
+
+        if name in STATUS_GROUPS:
+            report.status = name
+            report.load_test_id = int(value)
+        elif name == 'ips':
+            report.ips = value.strip().split(',')
+        elif name == 'since':
+            report.since = int(value)
+        else:
+            setattr(report, name, float(value))
+
+    if table:
+        _parse_table(report.table, table, head.count('\n') + 2)
+
+    return report
+
+def parse_json(response_data):
+    """
+    Parse a JSON report, for agents that offer one.
+
+    The document mirrors the text report: a "status" and "load_test_id",
+    the summary fields under their report names, an optional "start_time"
+    in the agent's epoch seconds, "ips" as a list, "since" if only the
+    rows after that second were sent, and the
+    per-second table as a list of 8-item "seconds" rows, with null for an
+    unlimited message rate.
+    """
+    try:
+        document = json.loads(response_data)
+    except ValueError, e:
+        raise ReportError('Report is not valid JSON: %s' % e)
+
+    if not isinstance(document, dict):
+        raise ReportError('JSON report is not an object')
+
+    report = Report()
+    report.status = document.get('status')
+    report.load_test_id = document.get('load_test_id')
+    report.ips = document.get('ips', [])
+    if document.get('start_time') is not None:
+        report.start_time = float(document['start_time'])
+    if document.get('since') is not None:
+        report.since = int(document['since'])
+
+    for field in SUMMARY_FIELDS:
+        if document.get(field) is not None:
+            setattr(report, field, float(document[field]))
+
+    for line_number, row in enumerate(document.get('seconds', []), 1):
+        if len(row) != 8:
+            raise ReportError('Row %i of the per-second table has %i columns instead of 8' % (line_number, len(row)))
+        try:
+            report.table.append(int(row[0]), int(row[1]), int(row[2]),
+                UNLIMITED if row[3] in (None, 'max') else int(row[3]),
+                int(row[4]), int(row[5]), int(row[6]), float(row[7]))
+        except (TypeError, ValueError):
+            raise ReportError('Row %i of the per-second table is not numeric: %r' % (line_number, row))
+
+    return report
+
+def parse(response_data):
+    """
+    Parse a /start or /report response in either of the agent's formats.
+    """
+    if response_data.lstrip().startswith('{'):
+        return parse_json(response_data)
+    return parse_text(response_data)
@@ -0,0 +1,175 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import json
+import os
+import time
+
+ROSTER_VERSION = 3
+
+# Seconds for which a bee's recorded endpoint and state are trusted
+ROSTER_TTL = 900
+
+ENTRY_FIELDS = ('id', 'public_dns_name', 'ip_address', 'zone', 'instance_type', 'state', 'healthy', 'checked',
+    'agent_port', 'pid', 'cpu')
+
+class RosterEntry(object):
+    """
+    What was last known about one bee. Stands in for its boto instance.
+    """
+
+    def __init__(self, id, public_dns_name=None, ip_address=None, zone=None, instance_type=None,
+            state=None, healthy=None, checked=None, agent_port=None, pid=None, cpu=None):
+        self.id = id
+        self.public_dns_name = public_dns_name
+        self.ip_address = ip_address
+        self.zone = zone
+        self.instance_type = instance_type
+        self.state = state
+        self.healthy = healthy
+        self.checked = checked
+        # Set by the local backend: the agent's own port, process and core
+        self.agent_port = agent_port
+        self.pid = pid
+        self.cpu = cpu
+
+    def update(self, instance, now=None):
+        """
+        Record the endpoint and state of a freshly described boto instance.
+        """
+        self.public_dns_name = instance.public_dns_name
+        self.ip_address = instance.ip_address
+        self.zone = instance.placement
+        self.instance_type = instance.instance_type
+        self.state = instance.state
+        self.healthy = instance.state == 'running'
+        self.checked = now or time.time()
+
+    def stale(self, ttl, now=None):
+        """
+        Whether this entry has to be described again before it can be used.
+        """
+        if not self.public_dns_name or self.checked is None or self.healthy is False:
+            return True
+        return (now or time.time()) - self.checked > ttl
+
+    def to_json(self):
+        return dict((field, getattr(self, field)) for field in ENTRY_FIELDS)
+
+class Roster(object):
+    """
+    The bees brought up by "bees up", with the credentials to reach them
+    and the backend that brought them up.
+    """
+
+    def __init__(self, username, key_name, entries=None, backend='ec2'):
+        self.username = username
+        self.key_name = key_name
+        self.entries = entries or []
+        self.backend = backend
+
+    def __len__(self):
+        return len(self.entries)
+
+    def ids(self):
+        return [entry.id for entry in self.entries]
+
+    def get(self, instance_id):
+        for entry in self.entries:
+            if entry.id == instance_id:
+                return entry
+        return None
+
+    def stale(self, ttl=ROSTER_TTL, now=None):
+        """
+        Return the entries that are unknown, unhealthy or older than `ttl` seconds.
+        """
+        now = now or time.time()
+        return [entry for entry in self.entries if entry.stale(ttl, now)]
+
+    def update(self, instances, now=None):
+        """
+        Refresh the entries of freshly described boto instances.
+        """
+        now = now or time.time()
+        for instance in instances:
+            entry = self.get(instance.id)
+            if entry is None:
+                entry = RosterEntry(instance.id)
+                self.entries.append(entry)
+            entry.update(instance, now)
+
+    def mark(self, instance_id, healthy):
+        entry = self.get(instance_id)
+        if entry:
+            entry.healthy = healthy
+
+def _load_legacy(f):
+    """
+    Read the original roster: username, key name and one instance id per line.
+    """
+    username = f.readline().strip()
+    key_name = f.readline().strip()
+    instance_ids = [line.strip() for line in f.read().split('\n') if line.strip()]
+    return Roster(username, key_name, [RosterEntry(instance_id) for instance_id in instance_ids])
+
+def load(path):
+    """
+    Read a roster in either format, or return None if there is none.
+
+    Entries read from a legacy roster carry no endpoints, so they are all
+    stale until they have been described once.
+    """
+    if not os.path.isfile(path):
+        return None
+
+    with open(path, 'r') as f:
+        if f.read(1) != '{':
+            f.seek(0)
+            return _load_legacy(f)
+
+        f.seek(0)
+        document = json.load(f)
+
+    entries = [RosterEntry(**dict((str(k), v) for k, v in bee.items() if k in ENTRY_FIELDS)) for bee in document['bees']]
+    return Roster(document['username'], document['key_name'], entries, document.get('backend', 'ec2'))
+
+def save(roster, path):
+    """
+    Write the roster atomically, so a crash never leaves the bees unaccounted for.
+    """
+    document = {
+        'version': ROSTER_VERSION,
+        'username': roster.username,
+        'key_name': roster.key_name,
+        'backend': roster.backend,
+        'bees': [entry.to_json() for entry in roster.entries]
+        }
+
+    temporary = '%s.tmp' % path
+    with open(temporary, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    os.rename(temporary, path)
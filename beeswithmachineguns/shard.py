@@ -0,0 +1,148 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# Relative load each instance type can generate, by EC2 compute units.
+# Types not listed here count as one unit.
+INSTANCE_WEIGHTS = {
+    't1.micro': 1.0,
+    'm1.small': 1.0,
+    'm1.medium': 2.0,
+    'c1.medium': 5.0,
+    'm1.large': 4.0,
+    'm2.xlarge': 6.5,
+    'm1.xlarge': 8.0,
+    'm3.xlarge': 13.0,
+    'm2.2xlarge': 13.0,
+    'c1.xlarge': 20.0,
+    'm3.2xlarge': 26.0,
+    'm2.4xlarge': 26.0,
+    'cc1.4xlarge': 33.5,
+    'cc2.8xlarge': 88.0,
+    }
+DEFAULT_WEIGHT = 1.0
+
+def instance_weight(instance):
+    return INSTANCE_WEIGHTS.get(getattr(instance, 'instance_type', None), DEFAULT_WEIGHT)
+
+def split(total, weights):
+    """
+    Share `total` out in proportion to `weights` by the largest remainder
+    method, so that the whole numbers handed out add up to exactly `total`.
+    """
+    weight_sum = float(sum(weights))
+    if weight_sum <= 0:
+        weights = [1.0] * len(weights)
+        weight_sum = float(len(weights))
+
+    quotas = [total * weight / weight_sum for weight in weights]
+    shares = [int(quota) for quota in quotas]
+
+    # Ties go to the heavier bee, then to the first
+    by_remainder = sorted(range(len(weights)), key=lambda i: (shares[i] - quotas[i], -weights[i], i))
+    for i in by_remainder[:total - sum(shares)]:
+        shares[i] += 1
+
+    return shares
+
+def plan(weights, number, concurrent=None, rate=None, duration=None):
+    """
+    Plan each bee's share of an attack.
+
+    Returns one entry per bee: a dict of its weight, 'num_requests',
+    'concurrent_requests' (None for unlimited) and 'rate' (None for
+    unlimited), or None for a bee left out because it has no weight or
+    there is not enough work to give every bee a share of each limit.
+    """
+    candidates = [i for i in range(len(weights)) if weights[i] > 0]
+
+    limits = [total for total in (None if duration else number, concurrent, rate) if total]
+    active = len(candidates)
+    if limits:
+        active = min(active, min(limits))
+
+    # Only the heaviest bees take part when there is not enough to go round
+    chosen = sorted(sorted(candidates, key=lambda i: -weights[i])[:active])
+    chosen_weights = [weights[i] for i in chosen]
+
+    # A limit of zero means unlimited to the agent, so every bee that takes
+    # part gets at least one of each before the rest is shared out.
+    def share_out(total):
+        if total < active:
+            return split(total, chosen_weights)
+        return [1 + share for share in split(total - active, chosen_weights)]
+
+    numbers = share_out(number)
+    connections = share_out(concurrent) if concurrent else [None] * active
+    rates = share_out(rate) if rate else [None] * active
+
+    shares = [None] * len(weights)
+    for j, i in enumerate(chosen):
+        shares[i] = {
+            'weight': weights[i],
+            'num_requests': numbers[j],
+            'concurrent_requests': connections[j],
+            'rate': rates[j]
+            }
+    return shares
+
+# How the targets of a comma-separated host list are handed to the bees
+ALL_TARGETS = 'all'
+ROUND_ROBIN = 'round_robin'
+WEIGHTED = 'weighted'
+TARGET_STRATEGIES = (ALL_TARGETS, ROUND_ROBIN, WEIGHTED)
+
+def assign_targets(hosts, weights, strategy=ALL_TARGETS, target_weights=None):
+    """
+    Choose the host, or comma-separated hosts, each bee attacks.
+
+    With ALL_TARGETS every bee attacks every host, as the agent would on
+    its own. ROUND_ROBIN deals the hosts out to the bees in turn. WEIGHTED
+    gives each host a share of the swarm's capacity (the bees' `weights`)
+    in proportion to its `target_weights`, equal by default, handing the
+    heaviest bees out first to whichever host is furthest below its share.
+    """
+    if strategy == ALL_TARGETS or len(hosts) == 1:
+        return [','.join(hosts)] * len(weights)
+
+    if strategy == ROUND_ROBIN:
+        return [hosts[i % len(hosts)] for i in range(len(weights))]
+
+    target_weights = target_weights or [1.0] * len(hosts)
+    if len(target_weights) != len(hosts):
+        raise ValueError('%i target weights given for %i targets' % (len(target_weights), len(hosts)))
+
+    capacity = float(sum(weights))
+    target_sum = float(sum(target_weights))
+    wanted = [capacity * weight / target_sum for weight in target_weights]
+    assigned = [0.0] * len(hosts)
+
+    assignment = [None] * len(weights)
+    for i in sorted(range(len(weights)), key=lambda i: (-weights[i], i)):
+        target = max(range(len(hosts)), key=lambda t: (wanted[t] - assigned[t], -t))
+        assignment[i] = hosts[target]
+        assigned[target] += weights[i]
+
+    return assignment
@@ -0,0 +1,142 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import json
+
+# Exit status of "bees attack" when the verdict is a failure
+EXIT_FAILED = 1
+
+# Thresholds understood in an SLO file or on the command line. Agents
+# report one mean latency per bee per second, so max_p99_latency limits
+# the p99 of those means (checked as max_p99_of_second_means), which can
+# sit well below the p99 of single messages.
+THRESHOLDS = ('min_messages_per_second', 'max_error_rate', 'max_p99_latency',
+    'max_failed_bees', 'baseline', 'max_regression')
+
+class SLOError(ValueError):
+    """
+    Raised for an SLO file that cannot be used.
+    """
+    pass
+
+def load(path):
+    """
+    Read thresholds from a JSON file, e.g.
+
+        {"min_messages_per_second": 5000, "max_error_rate": 0.01,
+         "max_p99_latency": 250, "baseline": "latest", "max_regression": 10}
+    """
+    try:
+        with open(path, 'r') as f:
+            thresholds = json.load(f)
+    except (IOError, ValueError), e:
+        raise SLOError('Could not read SLO file %s: %s' % (path, e))
+
+    if not isinstance(thresholds, dict):
+        raise SLOError('SLO file %s must contain a JSON object' % path)
+
+    unknown = [key for key in thresholds if key not in THRESHOLDS]
+    if unknown:
+        raise SLOError('Unknown thresholds in SLO file %s: %s' % (path, ', '.join(sorted(unknown))))
+
+    return thresholds
+
+def merge(thresholds, **overrides):
+    """
+    Overlay thresholds given on the command line on those from a file.
+    """
+    merged = dict(thresholds)
+    for key, value in overrides.items():
+        if value is not None:
+            merged[key] = value
+    return merged
+
+def _check(checks, name, actual, limit, passed):
+    checks.append({
+        'name': name,
+        'actual': actual,
+        'threshold': limit,
+        'passed': passed
+        })
+
+def evaluate(summary, thresholds, failed_bees, total_bees, baseline=None):
+    """
+    Judge an attack's aggregated results against its thresholds.
+
+    `summary` is the output of aggregate.summarize() (None when no bee
+    completed) and `baseline` the summary of the run to compare against,
+    if any. Regression is the percentage drop in messages per second or
+    rise in the p99 of per-second mean latencies relative to the baseline,
+    whichever is worse.
+    Returns a JSON-serializable verdict.
+    """
+    checks = []
+
+    if summary is None:
+        _check(checks, 'completed_bees', 0, 1, False)
+    else:
+        if thresholds.get('min_messages_per_second') is not None:
+            limit = thresholds['min_messages_per_second']
+            _check(checks, 'min_messages_per_second', summary['messages_per_second'], limit, summary['messages_per_second'] >= limit)
+
+        if thresholds.get('max_error_rate') is not None:
+            limit = thresholds['max_error_rate']
+            _check(checks, 'max_error_rate', summary['error_rate'], limit, summary['error_rate'] <= limit)
+
+        if thresholds.get('max_p99_latency') is not None:
+            limit = thresholds['max_p99_latency']
+            _check(checks, 'max_p99_of_second_means', summary['latency_p99'], limit, summary['latency_p99'] <= limit)
+
+        if baseline and thresholds.get('max_regression') is not None:
+            limit = thresholds['max_regression']
+            regressions = [0.0]
+            if baseline['messages_per_second']:
+                regressions.append(100.0 * (baseline['messages_per_second'] - summary['messages_per_second']) / baseline['messages_per_second'])
+            if baseline['latency_p99']:
+                regressions.append(100.0 * (summary['latency_p99'] - baseline['latency_p99']) / baseline['latency_p99'])
+            regression = max(regressions)
+            _check(checks, 'max_regression', regression, limit, regression <= limit)
+
+    if thresholds.get('max_failed_bees') is not None:
+        limit = thresholds['max_failed_bees']
+        _check(checks, 'max_failed_bees', failed_bees, limit, failed_bees <= limit)
+
+    return {
+        'passed': all(check['passed'] for check in checks),
+        'checks': checks,
+        'summary': summary,
+        'baseline': baseline,
+        'failed_bees': failed_bees,
+        'total_bees': total_bees
+        }
+
+def print_verdict(verdict):
+    for check in verdict['checks']:
+        print '     %-4s %s: %.4g (threshold %.4g)' % ('ok' if check['passed'] else 'FAIL', check['name'], check['actual'], check['threshold'])
+
+def write(verdict, path):
+    with open(path, 'w') as f:
+        json.dump(verdict, f, indent=2, sort_keys=True)
@@ -0,0 +1,771 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from collections import deque
+from email.utils import mktime_tz, parsedate_tz
+from multiprocessing.pool import ThreadPool
+import httplib
+import json
+import math
+import Queue
+import socket
+import threading
+import time
+import urllib
+import zlib
+
+import aggregate
+import metrics
+import report_parser
+from report_parser import ReportError
+import tracing
+
+AGENT_PORT = 8000
+DEBUG_AGENT_PORT = 8001
+MAX_HTTP_ERRORS = 10
+MAX_WORKER_THREADS = 50
+REPORT_POLL_INTERVAL = 3
+MIN_POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 30
+HTTP_ERROR_RETRY_INTERVAL = 1
+LIVE_WINDOW = 10
+# Seconds between metrics snapshots handed to the exporters
+METRICS_INTERVAL = 1
+CLOCK_SAMPLES = 5
+SYNC_START_LEAD = 2
+# Seconds a single agent request may block on the network
+REQUEST_TIMEOUT = 30
+# Seconds after the expected end of the attack before bees still running
+# are given up on as stragglers
+STRAGGLER_GRACE = 60
+STRAGGLER_TIMEOUT = 5
+HEADERS = {"Accept": "application/json, text/plain;q=0.9"}
+# Live polls ask only for the rows after the last second seen, and every
+# request accepts a gzipped body; agents that support neither send the
+# whole report uncompressed, as before.
+DELTA_REPORTS = True
+COMPRESS_REPORTS = True
+GZIP_HEADERS = dict(HEADERS)
+GZIP_HEADERS['Accept-Encoding'] = 'gzip'
+# Errors a request to an agent fails with; a bee that could not be started
+# finishes with one of them as its result
+REQUEST_ERRORS = (httplib.HTTPException, socket.error)
+
+def expected_length(duration, ramp_up_time):
+    """
+    Seconds a load test is expected to run: its duration with the ramp-up
+    on top, or 0 if it has no duration to expect an end from.
+    """
+    if not duration:
+        return 0
+    return duration + (ramp_up_time or 0)
+
+class Bee(object):
+    """
+    Coordinator-side state for a single bee taking part in an attack.
+    """
+
+    def __init__(self, params):
+        self.params = params
+        self.i = params['i']
+        self.port = params.get('agent_port') or (DEBUG_AGENT_PORT if params['debug_mode'] else AGENT_PORT)
+        self.load_test_id = None
+        self.http_errors = 0
+        self.next_poll = 0
+        self.done = False
+        self.result = None
+        self.live = False
+        self.series = None
+        self.target_series = None
+        self.last_second = -1
+        self.connection = None
+        self.response = None
+        self.started_at = None
+        self.start_at = None
+        self.start_offset = 0.0
+        self.start_shift = 0
+        self.clock_offset = None
+        self.rtt = None
+        self.long_poll = None
+        self.late_polls = 0
+        self.in_flight = False
+        self.track = self.i + 1
+        self.start_sent = None
+        self.start_latency = None
+        self.first_report = None
+        self.polls = 0
+        self.parse_time = 0.0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self.messages = 0
+        self.connection_errors = 0
+        self.misfires = 0
+        self.recent = deque(maxlen=LIVE_WINDOW)
+        # Guards the running totals and recent rows, which a worker thread
+        # updates while the coordinator reads them for the metrics
+        self.lock = threading.Lock()
+        self.schedule = aggregate.Schedule()
+
+    def finish(self, result):
+        # A poll that returns after the bee was left behind changes nothing
+        if self.done:
+            return
+        self.result = result
+        self.done = True
+
+    def request(self, url, timeout=REQUEST_TIMEOUT):
+        """
+        GET a url from the bee's agent over a persistent connection, giving
+        up on a connect or read that blocks for `timeout` seconds.
+
+        A reused connection the agent has since dropped is replaced once
+        before the error is passed on. A gzipped body is decompressed, and
+        the bytes received and decoded are counted either way.
+        """
+        reused = self.connection is not None
+        if not reused:
+            self.connection = httplib.HTTPConnection(self.params['instance_name'], self.port, timeout=timeout)
+        elif self.connection.sock:
+            self.connection.sock.settimeout(timeout)
+
+        try:
+            self.connection.request("GET", url, None, GZIP_HEADERS if COMPRESS_REPORTS else HEADERS)
+            self.response = self.connection.getresponse()
+            response_data = self.response.read()
+        except (httplib.HTTPException, socket.error):
+            self.close()
+            if not reused:
+                raise
+
+            return self.request(url, timeout)
+
+        self.bytes_received += len(response_data)
+        if self.response.getheader('content-encoding') == 'gzip':
+            try:
+                response_data = zlib.decompress(response_data, 16 + zlib.MAX_WBITS)
+            except zlib.error, e:
+                raise httplib.HTTPException('Undecodable gzip response: %s' % e)
+        self.bytes_decoded += len(response_data)
+        return response_data
+
+    def recent_rows(self):
+        """
+        A copy of the bee's latest rows, safe to read while it is polled.
+        """
+        with self.lock:
+            return list(self.recent)
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    def measure_clock(self):
+        """
+        Estimate how far the agent's clock is ahead of ours, NTP style.
+
+        The agent's time is read from /time, or from the Date header of the
+        response for agents without that endpoint, and compared with the
+        midpoint of the request. The sample with the shortest round trip wins.
+        """
+        best = None
+
+        for sample in range(CLOCK_SAMPLES):
+            sent = time.time()
+            response_data = self.request('/time')
+            received = time.time()
+
+            agent_time = _agent_time(self.response, response_data)
+            if agent_time is None:
+                return
+
+            rtt = received - sent
+            if best is None or rtt < best[0]:
+                best = (rtt, agent_time - (sent + received) / 2)
+
+        self.rtt, self.clock_offset = best
+
+    def expected_end(self):
+        """
+        When the bee is expected to finish, if it has a duration.
+        """
+        return self.started_at + expected_length(self.params['duration'], self.params.get('ramp_up_time'))
+
+    def remaining(self):
+        """
+        Seconds left until the bee is expected to finish, if it has a duration.
+        """
+        if not self.params['duration']:
+            return 0
+        return self.expected_end() - time.time()
+
+    def poll_interval(self):
+        """
+        Work out how long to wait before asking for the report again.
+
+        Polls are sparse while the test is in full swing and close in on the
+        expected end time (start plus ramp-up and duration), then back off again from
+        MIN_POLL_INTERVAL if the bee runs late. In live mode the interval is
+        capped at REPORT_POLL_INTERVAL so the rolling summary keeps moving.
+        """
+        if not self.params['duration']:
+            return REPORT_POLL_INTERVAL
+
+        remaining = self.remaining()
+        if remaining > 0:
+            ceiling = REPORT_POLL_INTERVAL if self.live else MAX_POLL_INTERVAL
+            return min(max(remaining / 2, MIN_POLL_INTERVAL), ceiling)
+
+        self.late_polls += 1
+        return min(MIN_POLL_INTERVAL * 2 ** (self.late_polls - 1), REPORT_POLL_INTERVAL)
+
+    def report_url(self):
+        """
+        Build the /report url for the next poll.
+
+        Live mode asks for the rows completed so far along with the progress
+        message, or only those after the last second seen once there is one.
+        Once the expected end is within the long-poll window, the agent is
+        asked to hold the request until the report is complete.
+        """
+        query = {}
+        if self.live:
+            query['partial'] = 'true'
+            if DELTA_REPORTS and self.last_second >= 0:
+                query['since'] = self.last_second
+        if self.long_poll and self.remaining() <= self.long_poll:
+            query['wait'] = self.long_poll
+
+        if not query:
+            return "/report"
+        return "/report?%s" % urllib.urlencode(query)
+
+
+class Straggler(object):
+    """
+    What is known of a bee that missed the collection deadline: the rows
+    it had completed, as a PerSecondTable, or None if it did not say.
+    """
+
+    def __init__(self, i, load_test_id, table=None):
+        self.i = i
+        self.load_test_id = load_test_id
+        self.table = table
+
+    def seconds(self):
+        return len(self.table) if self.table else 0
+
+    def messages(self):
+        return sum(self.table.actual_messages) if self.table else 0
+
+    def mean_latency(self):
+        if not self.messages():
+            return 0.0
+        return sum(latency * messages for latency, messages in zip(self.table.latency, self.table.actual_messages)) / self.messages()
+
+def _agent_time(response, response_data):
+    """
+    Read the agent's clock from a /time response, in epoch seconds.
+    """
+    if response.status == 200:
+        try:
+            return float(response_data.strip())
+        except ValueError:
+            pass
+        try:
+            return float(json.loads(response_data)['time'])
+        except (ValueError, KeyError, TypeError):
+            pass
+
+    # The Date header only has whole seconds, so aim for the middle of one
+    date = response.getheader('date')
+    if date and parsedate_tz(date):
+        return mktime_tz(parsedate_tz(date)) + 0.5
+
+    return None
+
+# Bee operations, run concurrently on the worker pool
+
+def _parse(bee, response_data):
+    """
+    Parse a bee's response, timing it for the trace.
+    """
+    started = time.time()
+    try:
+        return report_parser.parse(response_data)
+    finally:
+        ended = time.time()
+        bee.parse_time += ended - started
+        tracing.record('parse', started, ended, track=bee.track, size=len(response_data))
+
+def _measure_clock(bee):
+    try:
+        bee.measure_clock()
+    except (httplib.HTTPException, socket.error), e:
+        print 'Bee %i could not report its clock: %s' % (bee.i, e)
+
+    if bee.clock_offset is None:
+        print 'Bee %i has no readable clock, its start will not be synchronized.' % bee.i
+
+def _start(bee):
+    """
+    Ask a bee to start its load test.
+    """
+    params = bee.params
+
+    print 'Bee %i is joining the swarm.' % bee.i
+
+    querystring_params = urllib.urlencode({
+        'host': params['host'],
+        'port': params['port'],
+        'concurrent': params['concurrent_requests'] if params['concurrent_requests'] else '',
+        'number': params['num_requests'],
+        'ramp_up_time': params['ramp_up_time'] if params['ramp_up_time'] else '',
+        'no_ssl': 'true' if params['no_ssl'] else '',
+        'rate': params['rate'] if params['rate'] else '',
+        'duration': params['duration'] if params['duration'] else ''
+        })
+
+    if bee.start_at:
+        querystring_params += '&%s' % urllib.urlencode({'start_at': '%.3f' % bee.start_at})
+
+    attack_url = "/start?%s" % querystring_params
+
+    if bee.i == 0:
+        print 'Attack URL: %s' % attack_url
+
+    sent = bee.start_sent = time.time()
+
+    try:
+        response_data = bee.request(attack_url)
+    except REQUEST_ERRORS, e:
+        tracing.record('start', sent, time.time(), track=bee.track, error=str(e))
+        print "Request error for host %s" % params['instance_name']
+        print e
+        bee.close()
+        bee.finish(e)
+        return
+
+    bee.start_latency = time.time() - sent
+    tracing.record('start', sent, sent + bee.start_latency, track=bee.track)
+
+    try:
+        report = _parse(bee, response_data)
+    except ReportError, e:
+        print 'Bee %i sent an unreadable response to the start request: %s' % (bee.i, e)
+        bee.finish(None)
+        return
+
+    if report.status == report_parser.BUSY:
+        print 'Bee %i is already running a load test' % bee.i
+        bee.finish(None)
+        return
+
+    if report.status != report_parser.STARTED:
+        print 'Bee %i appears to be offline and has not started the load test' % bee.i
+        print 'Response: %s' % response_data
+        bee.finish(None)
+        return
+
+    bee.load_test_id = report.load_test_id
+
+    # Agents that honour start_at say when they will start; for the rest the
+    # best guess is the middle of the /start round trip.
+    if report.start_time is not None:
+        bee.started_at = report.start_time - (bee.clock_offset or 0)
+    else:
+        bee.started_at = (sent + time.time()) / 2
+    bee.next_poll = max(bee.started_at, time.time()) + bee.poll_interval()
+
+    print 'Bee %i is firing his machine gun (load test #%i, host: %s). Bang bang!' % (bee.i, bee.load_test_id, params['instance_name'])
+
+def _poll(bee):
+    """
+    Make a single /report request to a bee and act on the answer.
+    """
+    report_url = bee.report_url()
+    long_polling = 'wait=' in report_url
+    requested_at = time.time()
+    bee.polls += 1
+
+    try:
+        response_data = bee.request(report_url, REQUEST_TIMEOUT + (bee.long_poll if long_polling else 0))
+    except Exception, e:
+        tracing.record('poll', requested_at, time.time(), track=bee.track, url=report_url, error=str(e))
+        bee.http_errors += 1
+        if bee.http_errors == MAX_HTTP_ERRORS:
+            print 'Bee %i is unresponsive and has suffered %i http errors' % (bee.i, MAX_HTTP_ERRORS)
+            bee.finish(None)
+        bee.next_poll = time.time() + HTTP_ERROR_RETRY_INTERVAL
+        return
+
+    tracing.record('poll', requested_at, time.time(), track=bee.track, url=report_url)
+    if bee.first_report is None:
+        bee.first_report = time.time() - bee.start_sent
+
+    # A bee left behind while this poll was out keeps what it had
+    if bee.done:
+        return
+
+    try:
+        report = _parse(bee, response_data)
+    except ReportError, e:
+        print 'Bee %i sent a malformed report for load test %i: %s' % (bee.i, bee.load_test_id, e)
+        bee.finish(None)
+        return
+
+    if report.load_test_id != bee.load_test_id:
+        report.status = None
+
+    if report.status == report_parser.RUNNING:
+        if bee.live:
+            _merge_new_rows(bee, report)
+
+        if long_polling and time.time() - requested_at >= bee.long_poll / 2.0:
+            # The agent held the request, so go straight back for the next one
+            bee.next_poll = time.time()
+        else:
+            if long_polling:
+                print 'Bee %i does not support long-polling, falling back to polling.' % bee.i
+                bee.long_poll = None
+            bee.next_poll = time.time() + bee.poll_interval()
+    elif report.status == report_parser.COMPLETE:
+        result = _summarize(bee, report, response_data)
+        if result is not None:
+            _merge_new_rows(bee, report)
+        bee.finish(result)
+    else:
+        print 'Bee %i is not responding to report requests correctly' % bee.i
+        print 'Response for load test %i: %s' % (bee.load_test_id, response_data)
+        bee.finish(None)
+
+def _merge_new_rows(bee, report):
+    """
+    Fold the seconds a bee has completed since its last poll into the swarm's
+    series, so the parsed table can be dropped as soon as the poll is done.
+    """
+    rows = list(report.table.rows(after=bee.last_second))
+    if rows:
+        corrected = [bee.schedule.correct(row) for row in rows]
+        bee.last_second = bee.series.add_rows(rows, bee.start_shift, corrected)
+        if bee.target_series:
+            bee.target_series.add_rows(rows, bee.start_shift, corrected)
+
+        # Running totals and the latest rows of the bee, for the metrics
+        with bee.lock:
+            for row in rows:
+                bee.messages += row[4]
+                bee.connection_errors += row[5]
+                bee.misfires += row[6]
+            bee.recent.extend(rows)
+
+def _summarize(bee, report, response_data):
+    """
+    Turn a completed report into the result dictionary used by the summary.
+    """
+    if report.request_count is None:
+        print 'Bee %i lost sight of the target (connection timed out).' % bee.i
+        print 'Response was: %s' % response_data
+        return None
+
+    missing_fields = report.missing_fields()
+    if missing_fields:
+        print 'Bee %i sent an incomplete report, missing: %s' % (bee.i, ', '.join(missing_fields))
+        return None
+
+    print 'Bee %i is out of ammo.' % bee.i
+
+    return {
+        'average_per_second': report.average_per_second,
+        'last_minute_per_second': report.last_minute_per_second,
+        'request_count': report.request_count,
+        'error_count': report.error_count,
+        'error_rate_per_minute': report.error_rate_per_minute,
+        'ips': report.ips,
+        # A delta report's table starts after the seconds already merged
+        'seconds': len(report.table) + (report.since + 1 if report.since is not None else 0),
+        'start_time': bee.started_at,
+        'start_offset': bee.start_offset,
+        'start_shift': bee.start_shift
+        }
+
+# Coordinator
+
+def _print_live(bees, series, live_window, last_printed, targets=None):
+    """
+    Print a rolling summary once every bee still attacking has reported a new second,
+    followed by one for each of the `targets` series, if given.
+
+    Returns the last second printed.
+    """
+    active = [bee for bee in bees if not bee.done]
+    if not active:
+        return last_printed
+
+    watermark = min(bee.last_second + bee.start_shift for bee in active)
+    if watermark <= last_printed:
+        return last_printed
+
+    summary = series.window(watermark, live_window)
+    if summary:
+        print 'Swarm @ %is: %i connections, %.1f messages/s, %i errors, %i misfires, %.1fms latency, %.1fms p99 of second means (last %is)' % (
+            watermark, summary['connections'], summary['messages_per_second'],
+            summary['errors'], summary['misfires'], summary['latency'], summary['latency_p99'], live_window)
+
+    for host, target_series in sorted((targets or {}).items()):
+        summary = target_series.window(watermark, live_window)
+        if summary:
+            print '    %s: %.1f messages/s, %i errors, %i misfires, %.1fms latency, %.1fms p99 of second means' % (host,
+                summary['messages_per_second'], summary['errors'], summary['misfires'], summary['latency'], summary['latency_p99'])
+
+    return watermark
+
+def _poll_and_notify(bee, completed):
+    """
+    Poll a bee on a worker thread and hand it back to the coordinator loop.
+    """
+    try:
+        _poll(bee)
+    except Exception, e:
+        print 'Bee %i could not be polled: %s' % (bee.i, e)
+        bee.finish(None)
+    finally:
+        bee.in_flight = False
+        completed.put(bee)
+
+def _leave_behind(bee):
+    """
+    Give up on a bee that missed the deadline, keeping what it has done so far.
+
+    Its partial rows are asked for once, on a connection of its own since a
+    hung poll may still hold the usual one, with a short timeout.
+    """
+    table = None
+    connection = httplib.HTTPConnection(bee.params['instance_name'], bee.port, timeout=STRAGGLER_TIMEOUT)
+    try:
+        connection.request("GET", "/report?partial=true", None, HEADERS)
+        report = report_parser.parse(connection.getresponse().read())
+        if report.load_test_id == bee.load_test_id:
+            table = report.table
+    except (httplib.HTTPException, socket.error, ReportError):
+        pass
+    finally:
+        connection.close()
+
+    print 'Bee %i missed the deadline and was left behind.' % bee.i
+    bee.finish(Straggler(bee.i, bee.load_test_id, table))
+
+def _deadline(bees, grace):
+    """
+    The time by which every bee is expected to have reported, or None if
+    some bee has no duration to expect an end from.
+    """
+    started = [bee for bee in bees if bee.started_at is not None]
+    if not started or not all(bee.params['duration'] for bee in started):
+        return None
+    return max(bee.expected_end() for bee in started) + grace
+
+def _align_starts(bees, series):
+    """
+    Place every started bee on a common timeline.
+
+    Each bee's rows are shifted by the whole number of seconds between its
+    start and the series' epoch, so that a given second means the same
+    moment for every bee when their rows are merged. A series without an
+    epoch yet takes the earliest start in the swarm as its own; one
+    carried over from an earlier run keeps it, so later runs follow on.
+    A later run starts on a fresh bucket of the series, after the seconds
+    already merged, so no bucket mixes the rows of two runs.
+    """
+    started = [bee for bee in bees if bee.started_at is not None]
+    if not started:
+        return
+
+    first_start = min(bee.started_at for bee in started)
+    if series.epoch is None:
+        series.epoch = first_start
+        run_shift = 0
+    else:
+        bucket = series.bucket
+        run_shift = max(int(math.ceil(first_start - series.epoch)), series.last_second() + 1)
+        run_shift = -(-run_shift // bucket) * bucket
+    for bee in started:
+        bee.start_offset = run_shift + bee.started_at - first_start
+        bee.start_shift = int(round(bee.start_offset))
+
+def run(params, live=False, live_window=LIVE_WINDOW, long_poll=None, sync_start=False, connections=None, grace=STRAGGLER_GRACE,
+        series=None, targets=None, exporters=None):
+    """
+    Drive the load test on every bee from this process.
+
+    A bounded pool of worker threads fans out the /start requests and then
+    services /report polls as each bee falls due, so the coordinator's
+    footprint does not grow with the size of the swarm. The loop wakes up
+    whenever a poll completes or the next bee is due. Returns one result
+    per bee, in the same order as params.
+
+    Each bee's per-second rows are merged into `series`, an
+    aggregate.SwarmSeries, as soon as its report is parsed, and into the
+    series of its host in the `targets` dict as well when the bees attack
+    different hosts; neither keeps any bee's rows once merged. A series
+    passed in from an earlier run is added to, on the same timeline.
+
+    In live mode each poll also collects the seconds a bee has completed so
+    far, merges only the new ones and prints a rolling summary of the last
+    `live_window` seconds, for the whole swarm and for each target.
+
+    With `exporters` (see the metrics module), the bees are polled for
+    their rows as in live mode and a snapshot of the swarm, each target
+    and each bee is published every METRICS_INTERVAL seconds.
+
+    With `long_poll` set, polls close to a bee's expected end ask its agent
+    to wait up to that many seconds for the report to complete.
+
+    With `sync_start` set, every bee's clock offset is measured first and
+    all of them are asked to start at the same moment, expressed in their
+    own clock. Either way, each bee's rows are aligned on the swarm's
+    timeline by its start time before they are merged.
+
+    Every agent request times out after REQUEST_TIMEOUT seconds. Bees that
+    have not reported `grace` seconds after the attack was due to end are
+    left behind as stragglers, with whatever partial rows they will still
+    give, so that one hung bee does not hold up the rest of the results.
+
+    `connections` is a dict, kept by the caller across consecutive runs on
+    the same swarm, that agent connections are taken from and left open
+    in, so that later runs do not connect to every bee again.
+
+    When tracing is enabled, each stage of the run and every request to a
+    bee is recorded as a span, and each bee's costs once the run is over.
+    """
+    began = time.time()
+    bees = [Bee(p) for p in params]
+    run_number = tracing.new_run()
+    for bee in bees:
+        tracing.name_track(bee.track, 'bee %i (%s)' % (bee.i, bee.params['instance_name']))
+
+    if connections is not None:
+        for bee in bees:
+            bee.connection = connections.pop((bee.params['instance_name'], bee.port), None)
+
+    if series is None:
+        series = aggregate.SwarmSeries()
+    for bee in bees:
+        bee.live = live or bool(exporters)
+        bee.series = series
+        bee.long_poll = long_poll
+        bee.recent = deque(maxlen=live_window)
+
+    # Bees split between targets are also followed target by target
+    if targets is None:
+        targets = {}
+    if len(set(bee.params['host'] for bee in bees)) > 1:
+        for bee in bees:
+            bee.target_series = targets.setdefault(bee.params['host'], aggregate.SwarmSeries(series.bucket))
+    last_printed = -1
+
+    workers = min(len(bees), MAX_WORKER_THREADS)
+    with tracing.span('swarm.pool', workers=workers):
+        pool = ThreadPool(workers)
+    completed = Queue.Queue()
+
+    try:
+        if sync_start:
+            print 'Synchronizing clocks with the swarm.'
+            with tracing.span('swarm.clock_sync'):
+                pool.map(_measure_clock, bees)
+
+            # Leave enough time for the /start requests to reach every bee
+            slowest = max([bee.rtt for bee in bees if bee.rtt is not None] or [0])
+            start_at = time.time() + SYNC_START_LEAD + slowest * len(bees) / workers
+            for bee in bees:
+                if bee.clock_offset is not None:
+                    bee.start_at = start_at + bee.clock_offset
+
+        with tracing.span('swarm.start', bees=len(bees)):
+            pool.map(_start, bees)
+        _align_starts(bees, series)
+        deadline = _deadline(bees, grace)
+
+        polling = time.time()
+        published = 0
+        active = [bee for bee in bees if not bee.done]
+        while active:
+            now = time.time()
+            if deadline and now > deadline:
+                with tracing.span('swarm.leave_behind', bees=len(active)):
+                    pool.map(_leave_behind, active)
+                break
+
+            for bee in active:
+                if not bee.in_flight and bee.next_poll <= now:
+                    bee.in_flight = True
+                    pool.apply_async(_poll_and_notify, (bee, completed))
+
+            # Block until a poll comes back or the next idle bee is due. The
+            # wait is capped so that Ctrl-C is still noticed.
+            idle = [bee for bee in active if not bee.in_flight]
+            timeout = min(bee.next_poll for bee in idle) - time.time() if idle else REPORT_POLL_INTERVAL
+            if deadline:
+                timeout = min(timeout, deadline - time.time())
+            try:
+                completed.get(True, min(max(timeout, 0.01), REPORT_POLL_INTERVAL))
+            except Queue.Empty:
+                pass
+
+            if live:
+                last_printed = _print_live(bees, series, live_window, last_printed, targets)
+
+            if exporters and time.time() - published >= METRICS_INTERVAL:
+                metrics.publish(exporters, bees, series, targets, live_window)
+                published = time.time()
+
+            active = [bee for bee in active if not bee.done]
+        tracing.record('swarm.poll', polling, time.time(), tracing.PHASE)
+        metrics.carry_over(metrics.publish(exporters, bees, series, targets, live_window), series)
+    finally:
+        pool.close()
+        pool.join()
+        for bee in bees:
+            if connections is not None and bee.connection:
+                connections[(bee.params['instance_name'], bee.port)] = bee.connection
+                bee.connection = None
+            bee.close()
+            tracing.bee(run=run_number, i=bee.i, instance_name=bee.params['instance_name'],
+                start_latency=bee.start_latency, first_report=bee.first_report, polls=bee.polls,
+                http_errors=bee.http_errors, parse_time=bee.parse_time, started_at=bee.started_at,
+                bytes_received=bee.bytes_received, bytes_decoded=bee.bytes_decoded)
+        tracing.record('swarm.run', began, time.time(), tracing.PHASE, bees=len(bees))
+
+    return [bee.result for bee in bees]
+
+def close(connections):
+    """
+    Close the agent connections kept open across runs by run().
+    """
+    for connection in connections.values():
+        connection.close()
+    connections.clear()
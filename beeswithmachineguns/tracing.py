@@ -0,0 +1,232 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from contextlib import contextmanager
+import json
+import threading
+import time
+
+# Track of the coordinator's own phases; bee i is drawn on track i + 1
+COORDINATOR = 0
+
+# Span categories
+PHASE = 'phase'
+BEE = 'bee'
+
+# Slowest bees named in the profile
+PROFILE_SLOWEST = 5
+
+class Tracer(object):
+    """
+    Timed spans of the coordinator's work, kept as Chrome trace events
+    (chrome://tracing or https://ui.perfetto.dev read the written file).
+
+    Spans come from the coordinator and from the worker threads that talk
+    to the bees, so they are recorded under a lock.
+    """
+
+    def __init__(self):
+        self.began = time.time()
+        self.events = []
+        self.bees = []
+        self.runs = 0
+        self.tracks = set()
+        self.lock = threading.Lock()
+
+    def add(self, name, category, start, end, track=COORDINATOR, args=None):
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': int((start - self.began) * 1000000),
+            'dur': int((end - start) * 1000000),
+            'pid': 1,
+            'tid': track,
+            'args': args or {}
+            }
+        with self.lock:
+            self.events.append(event)
+
+    def name_track(self, track, name):
+        with self.lock:
+            if track in self.tracks:
+                return
+            self.tracks.add(track)
+            self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': track, 'args': {'name': name}})
+
+    def add_bee(self, stats):
+        with self.lock:
+            self.bees.append(stats)
+
+    def phases(self):
+        """
+        Calls, total and longest time of every coordinator phase, in the
+        order they first ran.
+        """
+        phases = {}
+        order = []
+        for event in self.events:
+            if event.get('cat') != PHASE:
+                continue
+            if event['name'] not in phases:
+                phases[event['name']] = [0, 0.0, 0.0]
+                order.append(event['name'])
+            totals = phases[event['name']]
+            totals[0] += 1
+            totals[1] += event['dur'] / 1000000.0
+            totals[2] = max(totals[2], event['dur'] / 1000000.0)
+        return [(name, phases[name][0], phases[name][1], phases[name][2]) for name in order]
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+_tracer = None
+_trace_path = None
+_profile = False
+
+def enable(trace_path=None, profile=False):
+    """
+    Start recording, to write a trace to `trace_path` and/or print a
+    profile when finish() is called.
+    """
+    global _tracer, _trace_path, _profile
+    _tracer = Tracer()
+    _trace_path = trace_path
+    _profile = profile
+    _tracer.name_track(COORDINATOR, 'coordinator')
+
+def enabled():
+    return _tracer is not None
+
+@contextmanager
+def span(name, category=PHASE, track=COORDINATOR, **args):
+    """
+    Time the enclosed block as a span, if tracing is enabled.
+    """
+    if _tracer is None:
+        yield
+        return
+
+    start = time.time()
+    try:
+        yield
+    finally:
+        _tracer.add(name, category, start, time.time(), track, args)
+
+def record(name, start, end, category=BEE, track=COORDINATOR, **args):
+    """
+    Record a span that has already been timed.
+    """
+    if _tracer is not None:
+        _tracer.add(name, category, start, end, track, args)
+
+def name_track(track, name):
+    if _tracer is not None:
+        _tracer.name_track(track, name)
+
+def new_run():
+    """
+    Number a swarm run, so the bees' stats can be told apart by run.
+    """
+    if _tracer is None:
+        return None
+    _tracer.runs += 1
+    return _tracer.runs
+
+def bee(**stats):
+    """
+    Record what one bee cost the coordinator over one run.
+    """
+    if _tracer is not None:
+        _tracer.add_bee(stats)
+
+def _spread(values):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[len(values) // 2], values[min(len(values) - 1, int(len(values) * 0.95))], values[-1]
+
+def print_profile(tracer):
+    """
+    Print where the coordinator's time went and what the bees cost it.
+    """
+    print '\nCoordinator profile (%.2fs in all):' % (time.time() - tracer.began)
+    print '     %-28s %6s %10s %10s %10s' % ('Phase', 'Calls', 'Total (s)', 'Mean (s)', 'Max (s)')
+    for name, calls, total, longest in tracer.phases():
+        print '     %-28s %6i %10.3f %10.3f %10.3f' % (name, calls, total, total / calls, longest)
+
+    started = [b for b in tracer.bees if b['start_latency'] is not None]
+    if not started:
+        return
+
+    print '\nBees (%i starts over %i runs):' % (len(started), len(set(b['run'] for b in tracer.bees)))
+
+    median, p95, longest = _spread(b['start_latency'] * 1000 for b in started)
+    print '     Start request latency:\tmedian %.1f, p95 %.1f, max %.1f [ms]' % (median, p95, longest)
+    slowest = sorted(started, key=lambda b: b['start_latency'], reverse=True)[:PROFILE_SLOWEST]
+    print '     Slowest to start:\t\t%s' % ', '.join('bee %i (%s) %.1fms' % (b['i'], b['instance_name'], b['start_latency'] * 1000) for b in slowest)
+
+    first_reports = _spread(b['first_report'] for b in started if b['first_report'] is not None)
+    if first_reports:
+        print '     Time to first report:\tmedian %.2f, p95 %.2f, max %.2f [s]' % first_reports
+
+    polls = [b['polls'] for b in started]
+    print '     Report polls:\t\t%i in all, %.1f per bee, at most %i' % (sum(polls), float(sum(polls)) / len(polls), max(polls))
+
+    errors = [b for b in started if b['http_errors']]
+    print '     HTTP errors:\t\t%i, on %i bees' % (sum(b['http_errors'] for b in errors), len(errors))
+
+    parse_times = [b['parse_time'] * 1000 for b in started]
+    print '     Report parse time:\t\t%.1f in all, at most %.1f per bee [ms]' % (sum(parse_times), max(parse_times))
+
+    received = sum(b['bytes_received'] for b in started)
+    decoded = sum(b['bytes_decoded'] for b in started)
+    print '     Report bytes:\t\t%i received, %i decoded, %.0f received per poll' % (received, decoded, float(received) / max(sum(polls), 1))
+
+    skews = {}
+    for b in started:
+        if b['started_at'] is not None:
+            skews.setdefault(b['run'], []).append(b['started_at'])
+    if skews:
+        print '     Start skew:\t\t\tat most %.3f [sec] in a run' % max(max(times) - min(times) for times in skews.values())
+
+def finish():
+    """
+    Write the trace and print the profile asked for by enable(), if any.
+    """
+    global _tracer
+    tracer = _tracer
+    if tracer is None:
+        return
+    _tracer = None
+
+    if _profile:
+        print_profile(tracer)
+
+    if _trace_path:
+        tracer.write(_trace_path)
+        print 'Trace written to %s' % _trace_path
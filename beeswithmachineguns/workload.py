@@ -0,0 +1,80 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import json
+
+# Settings a phase may give; the rest are taken from the command line
+PHASE_FIELDS = ('name', 'host', 'port', 'duration', 'rate', 'concurrent', 'ramp_up_time')
+
+class WorkloadError(ValueError):
+    """
+    Raised for a plan file that cannot be used.
+    """
+    pass
+
+def load(path, defaults):
+    """
+    Read the phases of a workload plan from a JSON file, e.g.
+
+        {"phases": [
+            {"name": "warm-up", "duration": 60, "rate": 500, "ramp_up_time": 30},
+            {"name": "plateau", "duration": 300, "rate": 2000},
+            {"name": "spike", "duration": 30, "rate": 8000, "concurrent": 4000},
+            {"name": "cool-down", "duration": 60, "rate": 500}
+        ]}
+
+    Settings a phase leaves out are taken from `defaults`. Every phase must
+    end up with a host, a port and a duration.
+    """
+    try:
+        with open(path, 'r') as f:
+            document = json.load(f)
+    except (IOError, ValueError), e:
+        raise WorkloadError('Could not read plan file %s: %s' % (path, e))
+
+    if not isinstance(document, dict) or not isinstance(document.get('phases'), list) or not document['phases']:
+        raise WorkloadError('Plan file %s must contain an object with a non-empty list of "phases"' % path)
+
+    phases = []
+    for index, settings in enumerate(document['phases'], 1):
+        if not isinstance(settings, dict):
+            raise WorkloadError('Phase %i of plan file %s is not an object' % (index, path))
+
+        unknown = [key for key in settings if key not in PHASE_FIELDS]
+        if unknown:
+            raise WorkloadError('Unknown settings in phase %i of plan file %s: %s' % (index, path, ', '.join(sorted(unknown))))
+
+        phase = dict(defaults)
+        phase['name'] = 'phase %i' % index
+        phase.update(settings)
+
+        for required in ('host', 'port', 'duration'):
+            if not phase.get(required):
+                raise WorkloadError('Phase %i of plan file %s has no %s' % (index, path, required))
+
+        phases.append(phase)
+
+    return phases
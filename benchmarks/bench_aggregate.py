@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+"""
+Memory and time taken to merge a long attack into the swarm series.
+
+Every bee's report is parsed and folded into an aggregate.SwarmSeries one
+bee at a time, as swarm.run does, and the series is then summarized.
+Each bucket length runs in a fresh child process so its peak memory can
+be measured on its own.
+
+Usage: python benchmarks/bench_aggregate.py [BEES] [SECONDS] [BUCKET,BUCKET,...]
+"""
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from beeswithmachineguns import aggregate, report_parser
+
+def make_report(seconds, seed):
+    rows = '\n'.join('%i,100,98,1000,%i,2,1,%.1f' % (s, 990 - (s + seed) % 7, 20 + (s * seed) % 13) for s in xrange(seconds))
+    return ('Report for load test 1 complete\n'
+        'Average rate over last minute of 990.5 transactions per second\n'
+        'Average rate of 985.2 transactions per second\n'
+        '%i connections opened\n'
+        'Load test errors 12\n'
+        'Average errors per minute 0.4\n'
+        'IPs used: 10.0.0.1\n'
+        '%s\n%s\n---\n') % (seconds * 98, report_parser.TABLE_HEADER, rows)
+
+def merge(bees, seconds, bucket):
+    began = time.time()
+    series = aggregate.SwarmSeries(bucket, seconds)
+    for i in xrange(bees):
+        report = report_parser.parse(make_report(seconds, i))
+        series.add_rows(report.table.rows(), i % 3)
+    merged = time.time()
+    summary = aggregate.summarize(series)
+
+    return {
+        'bucket': bucket,
+        'rows': len(series.sorted_seconds()),
+        'merge': merged - began,
+        'summarize': time.time() - merged,
+        'messages': summary['messages'],
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        }
+
+def main():
+    bees = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 3600
+    buckets = [int(b) for b in sys.argv[3].split(',')] if len(sys.argv) > 3 else [1, 10, 60]
+
+    print 'Merging %i bees x %i seconds:' % (bees, seconds)
+    print '  %6s %8s %10s %14s %13s' % ('bucket', 'rows', 'merge (s)', 'summarize (s)', 'peak RSS (MB)')
+    for bucket in buckets:
+        child = subprocess.Popen([sys.executable, __file__, '--child', str(bees), str(seconds), str(bucket)],
+            stdout=subprocess.PIPE)
+        result = json.loads(child.communicate()[0])
+        print '  %6i %8i %10.2f %14.3f %13.1f' % (result['bucket'], result['rows'], result['merge'],
+            result['summarize'], result['peak_rss_kb'] / 1024.0)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        print json.dumps(merge(int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4])))
+    else:
+        main()
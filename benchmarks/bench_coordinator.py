@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""
+Scaling benchmark of the coordinator against the fake bee agent.
+
+A fake agent is started on a spare port and swarms of increasing size are
+driven against it by swarm.run, each bee reaching the agent on its own
+loopback address so that it counts as a separate bee. Every swarm runs in
+a fresh child process so its peak memory can be measured on its own.
+
+Usage: python benchmarks/bench_coordinator.py [BEES,BEES,...] [DURATION] [PORT]
+"""
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from beeswithmachineguns import swarm
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def bee_params(count, duration):
+    params = []
+    for i in xrange(count):
+        params.append({
+            'i': i,
+            'instance_id': 'i-bench%04i' % i,
+            'instance_name': '127.0.%i.%i' % (i // 250, i % 250 + 1),
+            'host': 'localhost',
+            'port': 80,
+            'concurrent_requests': 10,
+            'num_requests': 0,
+            'ramp_up_time': 0,
+            'rate': 100,
+            'duration': duration,
+            'no_ssl': True,
+            'username': None,
+            'key_name': None,
+            'debug_mode': False
+        })
+    return params
+
+def run_swarm(count, duration, port):
+    """
+    Drive one swarm in this process and return its measurements.
+    """
+    swarm.AGENT_PORT = port
+    finished = []
+
+    finish = swarm.Bee.finish
+    def timed_finish(bee, result):
+        finished.append(time.time())
+        finish(bee, result)
+    swarm.Bee.finish = timed_finish
+
+    # The coordinator reports every bee's progress on stdout
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        began = time.time()
+        results = swarm.run(bee_params(count, duration))
+        ended = time.time()
+    finally:
+        sys.stdout = stdout
+
+    return {
+        'bees': count,
+        'complete': len([r for r in results if isinstance(r, dict)]),
+        'wall': ended - began,
+        'first_result': min(finished) - began if finished else None,
+        'last_result': max(finished) - began if finished else None,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        }
+
+def main():
+    counts = [int(c) for c in sys.argv[1].split(',')] if len(sys.argv) > 1 else [10, 100, 1000]
+    duration = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    port = int(sys.argv[3]) if len(sys.argv) > 3 else 8101
+
+    # Swarms of thousands of bees need more descriptors than the usual default
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    agent = subprocess.Popen([sys.executable, '-m', 'beeswithmachineguns.fake_agent', '--port', str(port)],
+        cwd=ROOT, stdout=open(os.devnull, 'w'))
+    time.sleep(1)
+
+    try:
+        print 'Swarms attacking for %is against the fake agent on port %i:' % (duration, port)
+        print '  %6s %9s %9s %12s %11s %13s' % ('bees', 'complete', 'wall (s)', 'first (s)', 'last (s)', 'peak RSS (MB)')
+        for count in counts:
+            child = subprocess.Popen([sys.executable, __file__, '--child', str(count), str(duration), str(port)],
+                stdout=subprocess.PIPE)
+            result = json.loads(child.communicate()[0])
+            print '  %6i %9i %9.2f %12.2f %11.2f %13.1f' % (result['bees'], result['complete'], result['wall'],
+                result['first_result'] or 0, result['last_result'] or 0, result['peak_rss_kb'] / 1024.0)
+    finally:
+        agent.terminate()
+        agent.wait()
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        print json.dumps(run_swarm(int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4])))
+    else:
+        main()
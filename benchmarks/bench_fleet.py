@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""
+Fleet operations on a large swarm against the in-memory fake EC2.
+
+Launches, describes and terminates a swarm spread over three zones, one
+of which runs out of room, with every call taking a fixed latency and a
+share of them throttled, one call at a time and then concurrently.
+
+Usage: python benchmarks/bench_fleet.py [BEES] [LATENCY] [THROTTLE_RATE]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from beeswithmachineguns import fake_ec2, fleet
+
+ZONES = ['us-east-1a', 'us-east-1b', 'us-east-1c']
+
+def run(bees, latency, throttle_rate, threads):
+    fleet.MAX_API_THREADS = threads
+    connection = fake_ec2.FakeEC2Connection(capacity={ZONES[0]: bees // 10}, throttle_rate=throttle_rate, latency=latency, seed=1)
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        began = time.time()
+        instances = fleet.launch(connection, bees, ZONES, 'ami-bench', 'bench', 'default', 'm1.large')
+        launched = time.time()
+        ids = [instance.id for instance in instances]
+        described = fleet.describe(connection, ids)
+        described_at = time.time()
+        terminated = fleet.terminate(connection, ids)
+        ended = time.time()
+    finally:
+        sys.stdout = stdout
+
+    return {
+        'threads': threads,
+        'launched': len(instances),
+        'described': len(described),
+        'terminated': len(terminated),
+        'launch': launched - began,
+        'describe': described_at - launched,
+        'terminate': ended - described_at,
+        'calls': sum(connection.calls.values()),
+        'throttled': connection.throttled
+        }
+
+def main():
+    bees = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    throttle_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+
+    # Keep the backoff in proportion to the simulated calls
+    fleet.API_BACKOFF = latency
+
+    print '%i bees over %s, %.0fms per call, %.0f%% of calls throttled:' % (bees, ', '.join(ZONES), latency * 1000, throttle_rate * 100)
+    print '  %7s %9s %11s %12s %13s %6s %10s' % ('threads', 'launched', 'launch (s)', 'describe (s)', 'terminate (s)', 'calls', 'throttled')
+    for threads in (1, fleet.MAX_API_THREADS):
+        result = run(bees, latency, throttle_rate, threads)
+        print '  %7i %9i %11.2f %12.2f %13.2f %6i %10i' % (result['threads'], result['launched'], result['launch'],
+            result['describe'], result['terminate'], result['calls'], result['throttled'])
+
+if __name__ == '__main__':
+    main()
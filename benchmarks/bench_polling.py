@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""
+Bytes transferred and parse time per live report poll, by test length.
+
+A fake agent is served on a local port with a load test that has already
+been running for the given number of seconds, and a bee polls it the way
+swarm.run does in live mode. The first poll catches up on every second;
+the polls after it are measured, against agents that send the whole
+table uncompressed (as before), a gzipped whole table, only the new rows,
+and only the new rows gzipped.
+
+Usage: python benchmarks/bench_polling.py [SECONDS,SECONDS,...] [POLLS]
+"""
+
+import os
+import sys
+import threading
+import time
+import urllib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from beeswithmachineguns import aggregate, fake_agent, report_parser, swarm
+
+MODES = (
+    ('full', False, False),
+    ('full, gzip', False, True),
+    ('delta', True, False),
+    ('delta, gzip', True, True)
+    )
+
+def serve(delta, gzip):
+    config = fake_agent.AgentConfig(delta=delta, gzip=gzip)
+    server = fake_agent.AgentServer(('127.0.0.1', 0), fake_agent.FakeAgent(config))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+def run(seconds, polls, delta, gzip):
+    server = serve(delta, gzip)
+    try:
+        bee = swarm.Bee({'i': 0, 'instance_name': '127.0.0.1', 'agent_port': server.server_address[1],
+            'debug_mode': False, 'duration': seconds + 3600})
+        bee.live = True
+        bee.series = aggregate.SwarmSeries()
+
+        started_at = time.time() - seconds
+        response_data = bee.request('/start?%s' % urllib.urlencode({'concurrent': 100, 'duration': seconds + 3600,
+            'start_at': '%.3f' % started_at}))
+        bee.load_test_id = report_parser.parse(response_data).load_test_id
+        bee.started_at = started_at
+
+        measured = []
+        for poll in range(polls + 1):
+            received, parse_time = bee.bytes_received, bee.parse_time
+            report = swarm._parse(bee, bee.request(bee.report_url()))
+            swarm._merge_new_rows(bee, report)
+            if poll:
+                measured.append((bee.bytes_received - received, bee.parse_time - parse_time))
+            time.sleep(0.5)
+        bee.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return {
+        'bytes': float(sum(m[0] for m in measured)) / len(measured),
+        'parse': sum(m[1] for m in measured) * 1000 / len(measured),
+        'last_second': bee.last_second
+        }
+
+def main():
+    lengths = [int(s) for s in sys.argv[1].split(',')] if len(sys.argv) > 1 else [60, 600, 3600]
+    polls = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    print 'Live report polls after the first, mean of %i:' % polls
+    print '  %8s %12s %14s %15s %12s' % ('seconds', 'agent', 'bytes / poll', 'parse (ms)', 'rows merged')
+    for seconds in lengths:
+        for name, delta, gzip in MODES:
+            result = run(seconds, polls, delta, gzip)
+            print '  %8i %12s %14.0f %15.3f %12i' % (seconds, name, result['bytes'], result['parse'], result['last_second'] + 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""
+Microbenchmark of the structured report parser against the regex scraping
+that _attack and _print_results used to do.
+
+Usage: python benchmarks/bench_report_parser.py [SECONDS] [REPEAT]
+"""
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from beeswithmachineguns import report_parser
+
+def make_report(seconds):
+    rows = '\n'.join('%i,100,98,1000,%i,2,1,%.1f' % (s, 990 - s % 7, 20 + s % 13) for s in xrange(seconds))
+    return ('Report for load test 1 complete\n'
+        'Average rate over last minute of 990.5 transactions per second\n'
+        'Average rate of 985.2 transactions per second\n'
+        '%i connections opened\n'
+        'Load test errors 12\n'
+        'Average errors per minute 0.4\n'
+        'IPs used: 10.0.0.1,10.0.0.2\n'
+        '%s\n%s\n---\n') % (seconds * 98, report_parser.TABLE_HEADER, rows)
+
+def legacy_parse(response_data):
+    """
+    The parsing previously done by _attack followed by _print_results.
+    """
+    response = {}
+    response['last_minute_per_second'] = float(re.search('Average\ rate\ over\ last\ minute\ of\ ([0-9.]+)\ transactions\ per\ second', response_data).group(1))
+    response['average_per_second'] = float(re.search('Average\ rate\ of\ ([0-9.]+)\ transactions\ per\ second', response_data).group(1))
+    response['request_count'] = float(re.search('([0-9.]+)\ connections\ opened', response_data).group(1))
+    response['error_count'] = float(re.search('Load test errors ([0-9.]+)', response_data).group(1))
+    response['error_rate_per_minute'] = float(re.search('errors per minute ([0-9.]+)', response_data).group(1))
+    response['ips'] = re.search('IPs\ used\:\ (.+)', response_data).group(1).split(',')
+    report = re.compile('Seconds passed.*Latency\(ms\)\n(.*)\n\-\-\-', re.MULTILINE|re.DOTALL).search(response_data)
+    response['report'] = report.group(1).split('\n')
+
+    rows = []
+    for row in response['report']:
+        row = row.split(',')
+        rows.append([int(row[0]), int(row[1]), int(row[2]), row[3] if row[3] == 'max' else int(row[3]),
+            int(row[4]), int(row[5]), int(row[6]), float(row[7])])
+    return response, rows
+
+def structured_parse(response_data):
+    return report_parser.parse(response_data)
+
+def main():
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 7200
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    response_data = make_report(seconds)
+    print 'Report of %i seconds (%i bytes), best of 3 x %i parses:' % (seconds, len(response_data), repeat)
+
+    for name, parse in (('regex', legacy_parse), ('structured', structured_parse)):
+        best = min(timeit.repeat(lambda: parse(response_data), repeat=3, number=repeat)) / repeat
+        print '  %-12s %8.2f ms per report' % (name, best * 1000)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from beeswithmachineguns import aggregate
+from beeswithmachineguns.report_parser import UNLIMITED
+
+def rows(seconds, attempted, messages, misfires, latency):
+    return [(second, 10, 10, attempted, messages, 0, misfires, latency) for second in range(seconds)]
+
+class ScheduleTest(unittest.TestCase):
+
+    def test_steady_shortfall_gives_steady_correction(self):
+        for misfires in (10, 0):
+            series = aggregate.SwarmSeries()
+            schedule = aggregate.Schedule()
+            table = rows(3600, 1000, 990, misfires, 20.0)
+            series.add_rows(table, 0, [schedule.correct(row) for row in table])
+
+            early = series.histogram([60], corrected=True)
+            late = series.histogram([3599], corrected=True)
+            self.assertEqual(early.percentile(99), late.percentile(99))
+            self.assertLess(series.histogram(corrected=True).percentile(99), 30)
+
+    def test_shortfall_is_charged_in_its_own_second(self):
+        series = aggregate.SwarmSeries()
+        series.add_rows(rows(1, 1000, 500, 500, 20.0))
+        histogram = series.histogram(corrected=True)
+        self.assertEqual(histogram.total, 1000)
+        self.assertAlmostEqual(histogram.mean(), (20.0 * 500 + 270.0 * 500) / 1000)
+
+    def test_late_messages_are_charged_the_backlog(self):
+        schedule = aggregate.Schedule()
+        schedule.correct((0, 10, 10, 100, 50, 0, 0, 20.0))
+        samples, shortfall = schedule.correct((1, 10, 10, 100, 150, 0, 0, 20.0))
+        self.assertEqual(samples, [(20.0, 100), (1020.0, 50)])
+        self.assertEqual(shortfall, [(0, -50)])
+        self.assertFalse(schedule.backlog)
+
+    def test_each_scheduled_message_is_counted_once(self):
+        series = aggregate.SwarmSeries()
+        series.add_rows([(0, 10, 10, 100, 50, 0, 0, 20.0), (1, 10, 10, 100, 150, 0, 0, 20.0)])
+        summary = aggregate.summarize(series)
+        self.assertEqual(series.histogram(corrected=True).total, summary['scheduled_messages'])
+        self.assertEqual(summary['shortfall'], 0)
+
+    def test_messages_never_sent_stay_in_the_shortfall(self):
+        series = aggregate.SwarmSeries()
+        series.add_rows([(0, 10, 10, 100, 50, 0, 20, 20.0), (1, 10, 10, 100, 110, 0, 0, 20.0)])
+        self.assertEqual(series.sums(0)[aggregate.SHORTFALL], 40)
+        self.assertEqual(series.sums(1)[aggregate.SHORTFALL], 0)
+        self.assertEqual(series.histogram(corrected=True).total, 180)
+
+    def test_unlimited_rate_is_not_corrected(self):
+        series = aggregate.SwarmSeries()
+        series.add_rows(rows(10, UNLIMITED, 990, 10, 20.0))
+        self.assertEqual(series.histogram(corrected=True).percentile(99), series.histogram().percentile(99))
+
+if __name__ == '__main__':
+    unittest.main()
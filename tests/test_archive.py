@@ -0,0 +1,40 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from beeswithmachineguns import aggregate, archive
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        series = aggregate.SwarmSeries()
+        series.add_rows([(second, 10, 10, 100, 97, 0, 0, 20.0) for second in range(3)])
+        self.path = archive.save(series, aggregate.summarize(series), [], [], {}, self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_columns_read_back(self):
+        run = archive.Run(archive.find('latest', self.directory))
+        self.assertEqual(list(run.column('seconds')), [0, 1, 2])
+        self.assertEqual(list(run.column('actual_messages')), [97, 97, 97])
+
+    def test_columns_of_another_item_size_are_refused(self):
+        manifest_path = os.path.join(self.path, archive.MANIFEST_FILENAME)
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        for column in manifest['columns']:
+            column['itemsize'] *= 2
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+
+        self.assertRaises(archive.ArchiveError, archive.Run(self.path).column, 'seconds')
+
+if __name__ == '__main__':
+    unittest.main()
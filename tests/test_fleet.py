@@ -0,0 +1,83 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from beeswithmachineguns import bees, fake_ec2, fleet, roster
+
+ZONES = ['us-east-1a', 'us-east-1b']
+
+class FlakyConnection(fake_ec2.FakeEC2Connection):
+    """
+    Fails every TerminateInstances call that names one of `failing`.
+    """
+
+    def __init__(self, failing, **kwargs):
+        fake_ec2.FakeEC2Connection.__init__(self, **kwargs)
+        self.failing = set(failing)
+
+    def terminate_instances(self, instance_ids=None):
+        if self.failing.intersection(instance_ids):
+            raise fake_ec2._error(500, 'InternalFailure', 'Could not terminate.')
+        return fake_ec2.FakeEC2Connection.terminate_instances(self, instance_ids)
+
+class FleetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = fleet.API_BACKOFF, fleet.API_CHUNK_SIZE, fleet.connect, bees.STATE_FILENAME
+        fleet.API_BACKOFF = 0
+        self.directory = tempfile.mkdtemp()
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def tearDown(self):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+        shutil.rmtree(self.directory)
+        fleet.API_BACKOFF, fleet.API_CHUNK_SIZE, fleet.connect, bees.STATE_FILENAME = self.settings
+
+    def test_shortfall_of_a_zone_is_launched_in_another(self):
+        connection = fake_ec2.FakeEC2Connection(capacity={ZONES[0]: 3})
+        instances = fleet.launch(connection, 10, ZONES, 'ami-test', 'test', 'default', 'm1.small')
+        self.assertEqual(len(instances), 10)
+        self.assertEqual(len([i for i in instances if i.placement == ZONES[0]]), 3)
+        self.assertEqual(len([i for i in instances if i.placement == ZONES[1]]), 7)
+
+    def test_throttled_calls_are_retried(self):
+        connection = fake_ec2.FakeEC2Connection(throttle_rate=0.3, seed=1)
+        instances = fleet.launch(connection, 250, ZONES, 'ami-test', 'test', 'default', 'm1.small')
+        ids = [instance.id for instance in instances]
+        self.assertEqual(len(fleet.describe(connection, ids)), 250)
+        self.assertEqual(sorted(fleet.terminate(connection, ids)), sorted(ids))
+        self.assertGreater(connection.throttled, 0)
+
+    def test_calls_name_at_most_a_chunk_of_ids(self):
+        connection = fake_ec2.FakeEC2Connection(max_ids=fleet.API_CHUNK_SIZE)
+        instances = fleet.launch(connection, 2 * fleet.API_CHUNK_SIZE + 1, ZONES[:1], 'ami-test', 'test', 'default', 'm1.small')
+        ids = [instance.id for instance in instances]
+        self.assertEqual(len(fleet.describe(connection, ids)), len(ids))
+        self.assertEqual(len(fleet.terminate(connection, ids)), len(ids))
+        self.assertEqual(connection.calls['get_all_instances'], 3)
+        self.assertEqual(connection.calls['terminate_instances'], 3)
+
+    def test_bees_not_stood_down_stay_on_the_roster(self):
+        fleet.API_CHUNK_SIZE = 2
+        bees.STATE_FILENAME = os.path.join(self.directory, '.bees')
+        connection = FlakyConnection([])
+        ids = [instance.id for instance in fleet.launch(connection, 4, ZONES[:1], 'ami-test', 'test', 'default', 'm1.small')]
+        roster.save(roster.Roster('ubuntu', 'test', [roster.RosterEntry(i) for i in ids]), bees.STATE_FILENAME)
+        fleet.connect = lambda: connection
+
+        connection.failing = set(ids[3:])
+        bees.down()
+        self.assertEqual(roster.load(bees.STATE_FILENAME).ids(), ids[2:])
+
+        connection.failing = set()
+        bees.down()
+        self.assertFalse(os.path.exists(bees.STATE_FILENAME))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from beeswithmachineguns import aggregate, metrics, swarm
+
+def bee(messages):
+    bee = swarm.Bee({'i': 0, 'instance_name': '127.0.0.1', 'debug_mode': False, 'host': 'target', 'duration': 10})
+    bee.messages = messages
+    return bee
+
+def values(samples, scope):
+    return dict((name, value) for sample_scope, labels, name, value in samples if sample_scope == scope)
+
+class MetricsTest(unittest.TestCase):
+
+    def test_counters_keep_counting_across_runs_into_one_series(self):
+        series = aggregate.SwarmSeries()
+        metrics.carry_over(metrics.snapshot([bee(500)], series, {}, 10), series)
+        samples = metrics.snapshot([bee(20)], series, {}, 10)
+
+        for scope in ('swarm', 'bee'):
+            self.assertEqual(values(samples, scope)['messages_total'], 520)
+            self.assertEqual(values(samples, scope)['active_bees'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from beeswithmachineguns import report_parser
+from beeswithmachineguns.report_parser import ReportError
+
+REPORT = '''Report for load test 3 complete
+Average rate of 97.5 transactions per second
+Average rate over last minute of 96.0 transactions per second
+200 connections opened
+Load test errors 0
+errors per minute 0
+%s
+%s
+---
+''' % (report_parser.TABLE_HEADER, '%s')
+
+class ReportParserTest(unittest.TestCase):
+
+    def test_text_report_is_parsed(self):
+        report = report_parser.parse(REPORT % '0,10,10,100,97,0,0,20.5\n1,10,10,max,98,0,0,21.0')
+        self.assertEqual(report.status, report_parser.COMPLETE)
+        self.assertEqual(report.load_test_id, 3)
+        self.assertEqual(report.missing_fields(), [])
+        self.assertEqual(list(report.table.rows()), [(0, 10, 10, 100, 97, 0, 0, 20.5),
+            (1, 10, 10, report_parser.UNLIMITED, 98, 0, 0, 21.0)])
+
+    def test_wrong_column_count_raises(self):
+        with self.assertRaises(ReportError) as context:
+            report_parser.parse(REPORT % '0,10,10,100,97,0,0,20.5\n1,10,10,100,97,0,20.5')
+        self.assertIn('Line 9', str(context.exception))
+        self.assertIn('7 columns', str(context.exception))
+
+    def test_non_numeric_row_raises(self):
+        with self.assertRaises(ReportError) as context:
+            report_parser.parse(REPORT % '0,10,10,100,lots,0,0,20.5')
+        self.assertIn('not numeric', str(context.exception))
+
+    def test_bad_json_raises(self):
+        self.assertRaises(ReportError, report_parser.parse, '{"status": ')
+        self.assertRaises(ReportError, report_parser.parse_json, '[1, 2]')
+        self.assertRaises(ReportError, report_parser.parse, '{"seconds": [[0, 10, 10, 100, 97, 0, 0]]}')
+        self.assertRaises(ReportError, report_parser.parse, '{"seconds": [[0, 10, 10, 100, "x", 0, 0, 1.0]]}')
+
+    def test_json_report_is_parsed(self):
+        report = report_parser.parse('{"status": "running", "load_test_id": 4, "since": 1, '
+            '"seconds": [[2, 10, 10, null, 97, 0, 0, 20.5]]}')
+        self.assertEqual(report.status, report_parser.RUNNING)
+        self.assertEqual(report.since, 1)
+        self.assertEqual(list(report.table.rows()), [(2, 10, 10, report_parser.UNLIMITED, 97, 0, 0, 20.5)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from beeswithmachineguns import roster
+
+class RosterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, '.bees')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_legacy_roster_loads_with_every_entry_stale(self):
+        with open(self.path, 'w') as f:
+            f.write('ubuntu\nkey\ni-1\ni-2\n')
+
+        hive = roster.load(self.path)
+        self.assertEqual((hive.username, hive.key_name, hive.backend), ('ubuntu', 'key', 'ec2'))
+        self.assertEqual(hive.ids(), ['i-1', 'i-2'])
+        self.assertEqual(hive.stale(), hive.entries)
+
+    def test_saved_roster_loads_back(self):
+        entry = roster.RosterEntry('i-1', 'bee.example.com', '10.0.0.1', 'us-east-1a', 'm1.small', 'running', True, 100.0)
+        roster.save(roster.Roster('ubuntu', 'key', [entry]), self.path)
+
+        hive = roster.load(self.path)
+        self.assertEqual(hive.get('i-1').to_json(), entry.to_json())
+        self.assertEqual(hive.stale(now=100.0), [])
+
+    def test_missing_roster_loads_as_none(self):
+        self.assertIsNone(roster.load(self.path))
+
+if __name__ == '__main__':
+    unittest.main()
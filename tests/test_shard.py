@@ -0,0 +1,40 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from beeswithmachineguns import shard
+
+class ShardTest(unittest.TestCase):
+
+    def test_split_adds_up_to_the_total(self):
+        self.assertEqual(sum(shard.split(1000, [1] * 7)), 1000)
+        self.assertEqual(sum(shard.split(1001, [1.0, 4.0, 8.0, 20.0])), 1001)
+        self.assertEqual(shard.split(10, [0, 0]), [5, 5])
+
+    def test_split_follows_the_weights(self):
+        self.assertEqual(shard.split(10, [1, 4]), [2, 8])
+
+    def test_plan_shares_add_up_to_the_totals(self):
+        shares = shard.plan([1.0, 4.0, 8.0], 1000, concurrent=101, rate=997)
+        for field, total in (('num_requests', 1000), ('concurrent_requests', 101), ('rate', 997)):
+            self.assertEqual(sum(share[field] for share in shares), total)
+
+    def test_plan_leaves_out_bees_it_cannot_give_a_share(self):
+        shares = shard.plan([1.0, 4.0, 8.0], 1000, concurrent=2)
+        self.assertIsNone(shares[0])
+        self.assertEqual([share['concurrent_requests'] for share in shares[1:]], [1, 1])
+
+    def test_weighted_targets_follow_the_target_weights(self):
+        hosts = shard.assign_targets(['a', 'b'], [1.0] * 8, shard.WEIGHTED, [3, 1])
+        self.assertEqual((hosts.count('a'), hosts.count('b')), (6, 2))
+
+    def test_round_robin_deals_the_targets_in_turn(self):
+        self.assertEqual(shard.assign_targets(['a', 'b'], [1.0] * 3, shard.ROUND_ROBIN), ['a', 'b', 'a'])
+
+    def test_target_weights_must_match_the_targets(self):
+        self.assertRaises(ValueError, shard.assign_targets, ['a', 'b'], [1.0], shard.WEIGHTED, [1])
+
+if __name__ == '__main__':
+    unittest.main()